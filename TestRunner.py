@@ -1,13 +1,15 @@
-import inspect
+import ast
 import json
 import os
 import re
+import resource
+import sys
+import time
 from importlib import import_module
 from pathlib import Path
 from pkgutil import iter_modules
-from typing import Iterable
+from typing import Dict, Iterable, List
 
-from interfaces.Operation import Operation
 from tasks.TaskTypes import TaskType
 
 
@@ -33,83 +35,335 @@ def convert_to_snake_case(camel_case):
     return name
 
 
+"""
+Static registry of the operations. The sources of the transformations and filters are parsed
+(without importing them) to find the operation classes with their interface, tasks, languages
+and whether they are heavy, so that looking up an operation or selecting the operations of a task
+only imports the modules of the selected operations.
+"""
+
+_INTERFACES_DIR = "interfaces"
+# value of a class attribute which is set but can't be read statically
+_UNKNOWN = object()
+
+
+class OperationInfo(object):
+    # static is False when some of tasks, languages and heavy are set in the class but
+    # couldn't be read from the source (e.g. when they are computed): they are None here
+    # and the module has to be imported to know them
+    def __init__(
+        self,
+        name,
+        package,
+        interface,
+        tasks=None,
+        languages=None,
+        heavy=False,
+        static=True,
+    ):
+        self.name = name
+        # e.g. "transformations.butter_fingers_perturbation"
+        self.package = package
+        self.interface = interface  # e.g. "SentenceOperation"
+        self.tasks = tasks
+        self.languages = languages
+        self.heavy = heavy
+        self.static = static
+
+    def load(self):
+        """Imports the package of the operation and returns its class."""
+        return getattr(import_module(self.package), self.name)
+
+    def __repr__(self):
+        return f"OperationInfo({self.name}, {self.package}, {self.interface})"
+
+
+def _literal_value(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return _UNKNOWN
+
+
+def _tasks_value(node):
+    # [TaskType.TEXT_CLASSIFICATION, ...] or [e for e in TaskType]
+    if isinstance(node, ast.Constant) and node.value is None:
+        return None
+    if isinstance(node, ast.ListComp):
+        generators = node.generators
+        if (
+            len(generators) == 1
+            and isinstance(generators[0].iter, ast.Name)
+            and generators[0].iter.id == "TaskType"
+        ):
+            return list(TaskType)
+        return _UNKNOWN
+    if not isinstance(node, (ast.List, ast.Tuple)):
+        return _UNKNOWN
+    tasks = []
+    for element in node.elts:
+        if not (
+            isinstance(element, ast.Attribute)
+            and isinstance(element.value, ast.Name)
+            and element.value.id == "TaskType"
+            and element.attr in TaskType.__members__
+        ):
+            return _UNKNOWN
+        tasks.append(TaskType[element.attr])
+    return tasks
+
+
+def _parse_classes(py_file: Path) -> List[dict]:
+    try:
+        tree = ast.parse(py_file.read_text(encoding="utf-8"))
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        return []
+    classes = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = []
+        for base in node.bases:
+            if isinstance(base, ast.Name):
+                bases.append(base.id)
+            elif isinstance(base, ast.Attribute):
+                bases.append(base.attr)
+        attributes = {}
+        for statement in node.body:
+            if (
+                isinstance(statement, ast.Assign)
+                and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)
+            ):
+                key = statement.targets[0].id
+                if key == "tasks":
+                    attributes[key] = _tasks_value(statement.value)
+                elif key in ("languages", "heavy"):
+                    attributes[key] = _literal_value(statement.value)
+        classes.append({"name": node.name, "bases": bases, **attributes})
+    return classes
+
+
+def _package_modules(package_dir: Path) -> List[Path]:
+    # the modules of a package are its __init__ and the modules it star-imports
+    init_file = package_dir / "__init__.py"
+    modules = [init_file]
+    try:
+        tree = ast.parse(init_file.read_text(encoding="utf-8"))
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        return modules
+    for node in tree.body:
+        if (
+            isinstance(node, ast.ImportFrom)
+            and node.level == 1
+            and node.module
+        ):
+            module_file = package_dir.joinpath(
+                *node.module.split(".")
+            ).with_suffix(".py")
+            if module_file.exists():
+                modules.append(module_file)
+    return modules
+
+
+_registries = {}
+
+
+def build_registry(search="transformations") -> Dict[str, OperationInfo]:
+    """Returns {class name: OperationInfo} for all the operations under the search folder."""
+    root = Path(__file__).resolve().parent
+    # classes of the interfaces and of all the packages, by name, to follow the inheritance
+    classes = {}
+    for py_file in sorted(root.joinpath(_INTERFACES_DIR).glob("*.py")):
+        for c in _parse_classes(py_file):
+            classes.setdefault(c["name"], dict(c, package=None))
+    package_classes = []
+    for folder in OperationRuns.get_all_folder_names(search):
+        for module_file in _package_modules(root.joinpath(search, folder)):
+            for c in _parse_classes(module_file):
+                c["package"] = f"{search}.{folder}"
+                package_classes.append(c)
+                classes.setdefault(c["name"], c)
+
+    def resolve(name, key, seen):
+        # first value of key found along the inheritance chain
+        c = classes.get(name)
+        if c is None or name in seen:
+            return None
+        seen.add(name)
+        if c.get(key) is not None:
+            return c[key]
+        for base in c["bases"]:
+            value = resolve(base, key, seen)
+            if value is not None:
+                return value
+        return None
+
+    def interface_of(name, seen):
+        c = classes.get(name)
+        if c is None or name in seen:
+            return None
+        seen.add(name)
+        if c["package"] is None:
+            return name
+        for base in c["bases"]:
+            interface = interface_of(base, seen)
+            if interface is not None:
+                return interface
+        return None
+
+    registry = {}
+    for c in package_classes:
+        if c["name"] in registry or c["name"].startswith("_"):
+            continue
+        interface = interface_of(c["name"], set())
+        if interface is None:
+            # not an operation, e.g. a helper class
+            continue
+        values = {
+            key: resolve(c["name"], key, set())
+            for key in ("tasks", "languages", "heavy")
+        }
+        static = all(value is not _UNKNOWN for value in values.values())
+        values = {
+            key: None if value is _UNKNOWN else value
+            for key, value in values.items()
+        }
+        registry[c["name"]] = OperationInfo(
+            c["name"],
+            c["package"],
+            interface,
+            tasks=values["tasks"],
+            languages=values["languages"],
+            heavy=bool(values["heavy"]),
+            static=static,
+        )
+    return registry
+
+
+def get_registry(search="transformations") -> Dict[str, OperationInfo]:
+    if search not in _registries:
+        _registries[search] = build_registry(search)
+    return _registries[search]
+
+
 class OperationRuns(object):
+    """
+    The test cases of one operation package, or of all of them ("light" skips the heavy
+    operations), along with the operations running them.
+
+    Iterating yields (operation, test case) pairs. An operation is only instantiated for its
+    first test case, reused by the consecutive test cases with the same class and args, and
+    released before the next one is instantiated, so that a single operation (with its models)
+    is loaded at a time. The load time of every operation and the peak resident memory are
+    reported at the end of the iteration.
+    """
+
     def __init__(self, transformation_name, search="transformations"):
+        # (load time in seconds, class name) of every instance created
+        self.load_times = []
         if transformation_name == "light":
-            self._load_all_transformation_test_case(heavy=False, search=search)
+            self._test_cases = self._load_all_transformation_test_case(
+                heavy=False, search=search
+            )
         elif transformation_name == "all":
-            self._load_all_transformation_test_case(heavy=True, search=search)
+            self._test_cases = self._load_all_transformation_test_case(
+                heavy=True, search=search
+            )
         else:
-            self._load_single_transformation_test_case(
+            self._test_cases = self._load_single_transformation_test_case(
                 transformation_name, search
             )
 
     def _load_single_transformation_test_case(
         self, transformation_name, search="transformations"
     ):
-        filters = []
-        filter_test_cases = []
         package_dir = Path(__file__).resolve()  # --> TestRunner.py
         filters_dir = package_dir.parent.joinpath(search, transformation_name)
 
         t_py = import_module(f"{search}.{transformation_name}")
         t_js = os.path.join(filters_dir, "test.json")
-        filter_instance = None
-        prev_class_args = {}
-        for test_case in load_test_cases(t_js):
-            class_name = test_case["class"]
-            class_args = test_case["args"] if "args" in test_case else {}
-            # construct filter class with input args
-            cls = getattr(t_py, class_name)
-            if (
-                filter_instance is None
-                or filter_instance.name() != class_name
-                or prev_class_args != class_args
-            ):
-                filter_instance = cls(**class_args)
-                prev_class_args = class_args
-
-            filters.append(filter_instance)
-            filter_test_cases.append(test_case)
-
-        self.operations = filters
-        self.operation_test_cases = filter_test_cases
+        return [
+            (getattr(t_py, test_case["class"]), test_case)
+            for test_case in load_test_cases(t_js)
+        ]
 
     def _load_all_transformation_test_case(
         self, heavy=False, search="transformations"
     ):
-        filters = []
         filter_test_cases = []
         package_dir = Path(__file__).resolve()  # --> TestRunner.py
         filters_dir = package_dir.parent.joinpath(search)
+        registry = get_registry(search)
         for (_, m, _) in iter_modules([filters_dir]):
-            t_py = import_module(f"{search}.{m}")
             t_js = os.path.join(filters_dir, m, "test.json")
-            filter_instance = None
-            prev_class_args = {}
-            for test_case in load_test_cases(t_js):
-                class_name = test_case["class"]
-                class_args = test_case["args"] if "args" in test_case else {}
-                cls = getattr(t_py, class_name)
-
-                is_heavy = cls.is_heavy()
-                if (not heavy) and is_heavy:
-                    continue
-                else:
-                    # Check if the same instance (i.e. with the same args is already loaded)
-                    if (
-                        filter_instance is None
-                        or filter_instance.name() != class_name
-                        or prev_class_args != class_args
-                    ):
-                        filter_instance = cls(**class_args)
-                        prev_class_args = class_args
-
-                    filters.append(filter_instance)
-                    filter_test_cases.append(test_case)
-
-        self.operations = filters
-        self.operation_test_cases = filter_test_cases
+            test_cases = load_test_cases(t_js)
+            if not heavy and all(
+                test_case["class"] in registry
+                and registry[test_case["class"]].heavy
+                for test_case in test_cases
+            ):
+                # don't even import the packages with heavy operations only
+                continue
+            t_py = import_module(f"{search}.{m}")
+            for test_case in test_cases:
+                cls = getattr(t_py, test_case["class"])
+                if heavy or not cls.is_heavy():
+                    filter_test_cases.append((cls, test_case))
+        return filter_test_cases
+
+    def __iter__(self):
+        yield from self._instances(release=True)
+        self.report()
+
+    def _instances(self, release):
+        filter_instance = None
+        prev_class_args = None
+        for cls, test_case in self._test_cases:
+            class_args = test_case["args"] if "args" in test_case else {}
+            # Check if the same instance (i.e. with the same args is already loaded)
+            if filter_instance is None or prev_class_args != (cls, class_args):
+                if release and filter_instance is not None:
+                    self._release(filter_instance)
+                start = time.perf_counter()
+                filter_instance = cls(**class_args)
+                self.load_times.append(
+                    (time.perf_counter() - start, cls.__name__)
+                )
+                prev_class_args = (cls, class_args)
+            yield filter_instance, test_case
+        if release and filter_instance is not None:
+            self._release(filter_instance)
+
+    @staticmethod
+    def _release(operation):
+        # the models of a heavy operation are unloaded before the next operation is loaded,
+        # even if the caller still holds the operation
+        if operation.is_heavy():
+            from initialize import get_model_registry
+
+            get_model_registry().release_owner(operation)
+
+    def report(self):
+        total = sum(seconds for seconds, _ in self.load_times)
+        # kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        print(
+            f"Loaded {len(self.load_times)} operations in {total:.1f}s, "
+            f"peak resident memory {peak / 2 ** 20:.0f} MB"
+        )
+        for seconds, name in sorted(self.load_times, reverse=True)[:10]:
+            print(f"\t{name}: {seconds:.2f}s")
+
+    @property
+    def operation_test_cases(self) -> List[dict]:
+        return [test_case for _, test_case in self._test_cases]
+
+    @property
+    def operations(self) -> List:
+        # all the operations at once and kept loaded, prefer iterating when they don't have to be kept
+        return [operation for operation, _ in self._instances(release=False)]
 
     @staticmethod
     def get_all_folder_names(search="transformations") -> Iterable:
@@ -123,35 +377,39 @@ class OperationRuns(object):
 
     @staticmethod
     def get_all_operations(search="transformations") -> Iterable:
-        # iterate through the modules in the current package
-        package_dir = Path(__file__).resolve()  # --> TestRunner.py
-        transformations_dir = package_dir.parent.joinpath(search)
-        for (_, folder, _) in iter_modules(
-            [transformations_dir]
-        ):  # ---> ["back_translation", ...]
-            t_py = import_module(f"{search}.{folder}")
-            for name, obj in inspect.getmembers(t_py):
-                if (
-                    inspect.isclass(obj)
-                    and issubclass(obj, Operation)
-                    and not obj.__module__.startswith("interfaces")
-                ):
-                    yield obj
+        # imports every package, prefer get_registry when the classes themselves aren't needed
+        for info in get_registry(search).values():
+            yield info.load()
+
+    @staticmethod
+    def get_all_operation_infos_for_task(
+        query_task_type: TaskType, search="transformations"
+    ) -> Iterable[OperationInfo]:
+        for info in get_registry(search).values():
+            if info.tasks is None and not info.static:
+                # the tasks couldn't be read from the source
+                tasks = info.load().tasks
+                if tasks is not None and query_task_type in tasks:
+                    yield info
+            elif info.tasks is not None and query_task_type in info.tasks:
+                yield info
 
     @staticmethod
     def get_all_operations_for_task(
         query_task_type: TaskType, search="transformations"
     ) -> Iterable:
-        # iterate through the modules in the current package
-        for operation in OperationRuns.get_all_operations(search):
-            if query_task_type in operation.tasks:
-                yield operation
+        # only the packages of the operations of the task are imported
+        for info in OperationRuns.get_all_operation_infos_for_task(
+            query_task_type, search
+        ):
+            yield info.load()
 
 
 def get_implementation(clazz: str, search="transformations"):
-    for operation in OperationRuns.get_all_operations(search):
-        if operation.name() == clazz:
-            return operation
+    # only the package defining the class is imported
+    info = get_registry(search).get(clazz)
+    if info is not None:
+        return info.load()
     raise ValueError(
         f"No class called {clazz} found in the {search} folder. Check if you've spelled it right!"
     )
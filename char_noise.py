@@ -0,0 +1,209 @@
+from typing import Dict, List
+
+import numpy as np
+
+from interfaces.Operation import derive_seed
+
+"""
+Vectorized character-level noise, shared by the batched modes of ButterFingersPerturbation,
+ChangeCharCase and LeetLetters.
+A batch of sentences is encoded as a single array of code points. The random draws of all its
+characters are made at once with a counter-based hash of (seed of the sentence, position of
+the character, stream), so the noise added to a sentence only depends on the seed and on the
+sentence, not on the other sentences of the batch. Replacements are then applied with array
+indexing, only the rare replacements by several characters (e.g. "ß" -> "SS") are applied
+one by one when decoding.
+"""
+
+_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        x = x + _GAMMA
+        x = (x ^ (x >> np.uint64(30))) * _MIX1
+        x = (x ^ (x >> np.uint64(27))) * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+
+class CharBatch:
+    """Code points of a batch of sentences, with the random draws of their characters."""
+
+    def __init__(self, texts: List[str], seed: int = 0):
+        self.texts = list(texts)
+        lengths = np.array([len(text) for text in self.texts], dtype=np.int64)
+        self.offsets = np.zeros(len(self.texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.codes = np.frombuffer(
+            "".join(self.texts).encode("utf-32-le", "surrogatepass"),
+            dtype="<u4",
+        ).astype(np.int64)
+        # sentence and position in the sentence of every character
+        self.sentences = np.repeat(np.arange(len(self.texts)), lengths)
+        self.positions = (
+            np.arange(len(self.codes)) - self.offsets[self.sentences]
+        )
+        seeds = np.array(
+            [derive_seed(seed, text) for text in self.texts], dtype=np.uint64
+        )
+        self._char_seeds = _splitmix64(seeds)[self.sentences]
+
+    def uniform(self, stream: int) -> np.ndarray:
+        """One draw in [0, 1) per character, different for every stream."""
+        with np.errstate(over="ignore"):
+            counter = self.positions.astype(np.uint64) * np.uint64(
+                1 << 20
+            ) + np.uint64(stream)
+            x = _splitmix64(self._char_seeds ^ _splitmix64(counter))
+        return (x >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+    def per_sentence(self, values: np.ndarray) -> np.ndarray:
+        """Sums per-character values over every sentence."""
+        return np.bincount(
+            self.sentences, weights=values, minlength=len(self.texts)
+        )
+
+    def decode(
+        self, codes: np.ndarray, replacements: Dict[int, str] = None
+    ) -> List[str]:
+        """
+        The sentences of codes. replacements maps the indices of characters in codes to the
+        strings replacing them, when they aren't replaced by a single character.
+        """
+        data = codes.astype("<u4").tobytes()
+        texts = []
+        by_sentence = {}
+        for index, replacement in (replacements or {}).items():
+            by_sentence.setdefault(self.sentences[index], []).append(
+                (index, replacement)
+            )
+        for i in range(len(self.texts)):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            text = data[start * 4 : end * 4].decode(
+                "utf-32-le", "surrogatepass"
+            )
+            if i in by_sentence:
+                chars = list(text)
+                for index, replacement in by_sentence[i]:
+                    chars[index - start] = replacement
+                text = "".join(chars)
+            texts.append(text)
+        return texts
+
+
+class NeighbourTable:
+    """Keys of a keyboard layout with their neighbours, compiled into arrays once."""
+
+    def __init__(self, key_approx: Dict[str, str]):
+        size = max(map(ord, key_approx)) + 1 if key_approx else 1
+        width = max(map(len, key_approx.values())) if key_approx else 1
+        self.neighbours = np.zeros((size, width), dtype=np.int64)
+        self.counts = np.zeros(size, dtype=np.int64)
+        for key, neighbours in key_approx.items():
+            self.neighbours[ord(key), : len(neighbours)] = [
+                ord(c) for c in neighbours
+            ]
+            self.counts[ord(key)] = len(neighbours)
+
+
+def _is_ascii_upper(codes):
+    return (codes >= 65) & (codes <= 90)
+
+
+def _is_ascii_lower(codes):
+    return (codes >= 97) & (codes <= 122)
+
+
+def typos(
+    batch: CharBatch, table: NeighbourTable, prob: float, stream: int = 0
+) -> List[str]:
+    """
+    Replaces every key of the table (whatever its case) by one of its neighbours with
+    probability prob, keeping the case of the character.
+    """
+    codes = batch.codes
+    upper = _is_ascii_upper(codes)
+    lower = np.where(upper, codes + 32, codes)
+    known = lower < len(table.counts)
+    keys = np.where(known, lower, 0)
+    candidates = known & (table.counts[keys] > 0)
+    typo = candidates & (batch.uniform(2 * stream) < prob)
+    choice = np.floor(
+        batch.uniform(2 * stream + 1) * table.counts[keys]
+    ).astype(np.int64)
+    replaced = np.where(
+        typo,
+        table.neighbours[keys, np.minimum(choice, table.counts[keys] - 1)],
+        codes,
+    )
+    # back to the original case, for the characters which have one
+    replaced = np.where(
+        typo & upper & _is_ascii_lower(replaced), replaced - 32, replaced
+    )
+    return batch.decode(replaced)
+
+
+def flip_case(batch: CharBatch, prob: float, stream: int = 0) -> List[str]:
+    """Changes the case of every cased character with probability prob."""
+    codes = batch.codes
+    draws = batch.uniform(stream) < prob
+    upper = _is_ascii_upper(codes)
+    lower = _is_ascii_lower(codes)
+    replaced = np.where(draws & upper, codes + 32, codes)
+    replaced = np.where(draws & lower, codes - 32, replaced)
+    replacements = {}
+    # the other scripts are left to python, there are few of them
+    for index in np.flatnonzero(draws & (codes > 127)):
+        c = chr(codes[index])
+        if c.isupper():
+            flipped = c.lower()
+        elif c.islower():
+            flipped = c.upper()
+        else:
+            continue
+        if len(flipped) == 1:
+            replaced[index] = ord(flipped)
+        else:
+            replacements[index] = flipped
+    return batch.decode(replaced, replacements)
+
+
+def substitute(
+    batch: CharBatch,
+    mapping: Dict[str, str],
+    max_ratio: float,
+    stream: int = 0,
+) -> List[str]:
+    """
+    Replaces the characters found in mapping. As many draws as max_ratio * the length of the
+    sentence are made among its candidate characters (with replacement), so every candidate
+    of a sentence is replaced with probability 1 - (1 - 1 / candidates) ** draws.
+    """
+    keys = np.array(sorted(ord(k) for k in mapping if len(k) == 1))
+    if len(keys) == 0:
+        return list(batch.texts)
+    values = [mapping[chr(k)] for k in keys]
+    # -1 for the characters replaced by several ones
+    single_codes = np.array([ord(v) if len(v) == 1 else -1 for v in values])
+    codes = batch.codes
+    slots = np.searchsorted(keys, codes)
+    slots = np.minimum(slots, len(keys) - 1)
+    candidates = keys[slots] == codes
+    counts = batch.per_sentence(candidates.astype(np.float64))
+    lengths = np.diff(batch.offsets)
+    draws = np.floor(max_ratio * lengths)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        probs = np.where(
+            counts > 0, 1 - (1 - 1 / np.maximum(counts, 1)) ** draws, 0.0
+        )
+    chosen = candidates & (batch.uniform(stream) < probs[batch.sentences])
+    replaced = np.where(
+        chosen & (single_codes[slots] >= 0), single_codes[slots], codes
+    )
+    replacements = {
+        index: values[slots[index]]
+        for index in np.flatnonzero(chosen & (single_codes[slots] < 0))
+    }
+    return batch.decode(replaced, replacements)
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-from typing import Iterable, List
+import json
+import multiprocessing
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List
 
 from tqdm import tqdm
 
+from initialize import get_spacy_doc_cache
 from interfaces import Operation
 from interfaces.QuestionAnswerOperation import QuestionAnswerOperation
 from interfaces.SentenceOperation import (
@@ -14,6 +18,120 @@ from interfaces.SentenceOperation import (
 from tasks.TaskTypes import TaskType
 
 
+"""
+Helpers to apply an operation to a dataset batch by batch, either in the current process
+or sharded across a pool of worker processes.
+"""
+
+# the operation and the function applying it, set up once in every worker process
+_worker_state = {}
+
+
+def _init_worker(apply_func: Callable, operation: Operation, batch_size: int):
+    _worker_state["apply_func"] = apply_func
+    _worker_state["operation"] = operation
+    _worker_state["batch_size"] = batch_size
+
+
+def _apply_in_batches(
+    apply_func: Callable, operation: Operation, data: List, batch_size: int
+) -> List:
+    results = []
+    for start in range(0, len(data), batch_size):
+        results.extend(apply_func(data[start : start + batch_size], operation))
+    return results
+
+
+def _apply_chunk_in_worker(chunk: List) -> List:
+    return _apply_in_batches(
+        _worker_state["apply_func"],
+        _worker_state["operation"],
+        chunk,
+        _worker_state["batch_size"],
+    )
+
+
+def map_operation(
+    apply_func: Callable,
+    operation: Operation,
+    data: List,
+    batch_size: int = 32,
+    num_workers: int = 0,
+    chunk_size: int = None,
+) -> Iterator:
+    """
+    Yields apply_func's result for every datapoint of data, in the same order as data.
+    The generator should be consumed until the end so that the worker pool is shut down.
+    apply_func(batch, operation) receives a list of at most batch_size datapoints and returns
+    one result per datapoint.
+    With num_workers > 1, data is split in chunks of chunk_size datapoints which are
+    distributed over a pool of num_workers processes. The operation is sent to each worker
+    once when the pool starts, so it is not re-initialized for every chunk.
+    """
+    chunk_size = chunk_size or batch_size
+    chunks = [
+        data[start : start + chunk_size]
+        for start in range(0, len(data), chunk_size)
+    ]
+    with tqdm(total=len(data)) as progress:
+        if num_workers > 1:
+            with multiprocessing.Pool(
+                num_workers,
+                initializer=_init_worker,
+                initargs=(apply_func, operation, batch_size),
+            ) as pool:
+                # imap keeps the order of the chunks
+                for chunk_results in pool.imap(_apply_chunk_in_worker, chunks):
+                    yield from chunk_results
+                    progress.update(len(chunk_results))
+        else:
+            for chunk in chunks:
+                chunk_results = _apply_in_batches(
+                    apply_func, operation, chunk, batch_size
+                )
+                yield from chunk_results
+                progress.update(len(chunk_results))
+
+
+def parse_texts(
+    texts: List[str], batch_size: int = 256, n_process: int = 1
+) -> List:
+    """
+    Parses texts with spaCy in a single nlp.pipe pass and returns their Docs.
+    The Docs are also kept in the shared Doc cache (initialize.get_spacy_doc_cache), within
+    its max_size, so that operations applied afterwards don't parse the texts again. Raise
+    max_size beforehand to keep the Docs of a larger dataset.
+    """
+    return get_spacy_doc_cache().pipe(
+        texts, batch_size=batch_size, n_process=n_process
+    )
+
+
+def _uses_docs(operation: Operation, hook: str) -> bool:
+    # only operations overriding generate_from_doc/filter_from_doc are given Docs, the others
+    # keep their own (possibly batched) generate/filter
+    return isinstance(operation, SentenceOperation) and getattr(
+        type(operation), hook
+    ) is not getattr(SentenceOperation, hook)
+
+
+def _generate_sentences(sentences: List[str], transformation: Operation):
+    if _uses_docs(transformation, "generate_from_doc"):
+        return transformation.generate_batch_from_docs(sentences)
+    return transformation.generate_batch(sentences)
+
+
+def _filter_sentences(sentences: List[str], filter: Operation):
+    if _uses_docs(filter, "filter_from_doc"):
+        return filter.filter_batch_from_docs(sentences)
+    return filter.filter_batch(sentences)
+
+
+def _source(dataset, index: int) -> int:
+    # index of the original datapoint the index-th datapoint of dataset comes from
+    return dataset.sources[index] if dataset.sources is not None else index
+
+
 class BaseDataset(Iterable):
     def __init__(self, data: Iterable):
         self.data = data
@@ -62,12 +180,17 @@ Dataset for data in plain texts where each line is a datapoint
 class TextLineDataset(BaseDataset):
     tasks = [TaskType.TEXT_CLASSIFICATION]
 
-    def __init__(self, data: List[str], labels: List):
+    # sources: index of the original datapoint every datapoint was generated from by
+    # apply_transformation or kept by apply_filter (None for an original dataset)
+    def __init__(
+        self, data: List[str], labels: List, sources: List[int] = None
+    ):
         super(TextLineDataset, self).__init__(data)
         assert len(data) == len(
             labels
         ), "The number of datapoint should be the same as the number of labels"
         self.labels = labels
+        self.sources = sources
         self.mapping = {
             datapoint: label
             for datapoint, label in zip(self.data, self.labels)
@@ -77,37 +200,96 @@ class TextLineDataset(BaseDataset):
     def from_huggingface(cls, dataset, task_type, fields, max_size=None):
         data = []
         labels = []
-        max_size = max_size or len(dataset)
-        for example in list(dataset)[:max_size]:
+        for example in islice(dataset, max_size or None):
             data.append(example[fields[0]])
             labels.append(example[fields[1]])
         return cls(data, labels)
 
-    def apply_filter(self, filter: SentenceOperation) -> TextLineDataset:
+    # parses all the datapoints with spaCy in one batched pass (n_process > 1 parses in
+    # several processes), so that spaCy-based operations applied afterwards reuse the Docs
+    def parse(
+        self, batch_size: int = 256, n_process: int = 1
+    ) -> TextLineDataset:
+        parse_texts(self.data, batch_size=batch_size, n_process=n_process)
+        return self
+
+    # num_workers: number of processes to shard the dataset over (0 or 1 runs in this process)
+    # chunk_size: number of datapoints sent to a worker at once (defaults to batch_size)
+    def apply_filter(
+        self,
+        filter: SentenceOperation,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        chunk_size: int = None,
+    ) -> TextLineDataset:
         filtered_data = []
         filtered_labels = []
+        filtered_sources = []
         print("Applying filtering:")
-        for datapoint, label in tqdm(
-            zip(self.data, self.labels), total=len(self.data)
+        keep = self.filter_mask(
+            filter,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            chunk_size=chunk_size,
+        )
+        for i, (keep_datapoint, datapoint, label) in enumerate(
+            zip(keep, self.data, self.labels)
         ):
-            if filter.filter(datapoint):
+            if keep_datapoint:
                 filtered_data.append(datapoint)
                 filtered_labels.append(label)
+                filtered_sources.append(_source(self, i))
+
+        return TextLineDataset(
+            filtered_data, filtered_labels, filtered_sources
+        )
 
-        return TextLineDataset(filtered_data, filtered_labels)
+    # returns whether every datapoint passes the filter, in the order of the datapoints
+    def filter_mask(
+        self,
+        filter: SentenceOperation,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        chunk_size: int = None,
+    ) -> List[bool]:
+        return list(
+            map_operation(
+                _filter_sentences,
+                filter,
+                self.data,
+                batch_size=batch_size,
+                num_workers=num_workers,
+                chunk_size=chunk_size,
+            )
+        )
 
     def apply_transformation(
-        self, transformation: SentenceOperation
+        self,
+        transformation: SentenceOperation,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        chunk_size: int = None,
     ) -> TextLineDataset:
         transformed_data = []
+        transformed_labels = []
+        transformed_sources = []
         print("Applying transformation:")
 
         # calculating ratio of transformed example to unchanged example
         successful_num = 0
         failed_num = 0
 
-        for line in tqdm(self.data):
-            pt_examples = transformation.generate(line)
+        batch_pt_examples = map_operation(
+            _generate_sentences,
+            transformation,
+            self.data,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            chunk_size=chunk_size,
+        )
+        for i, (pt_examples, line, label) in enumerate(
+            zip(batch_pt_examples, self.data, self.labels)
+        ):
             successful_pt, failed_pt = transformation.compare(
                 line, pt_examples
             )
@@ -115,6 +297,8 @@ class TextLineDataset(BaseDataset):
             failed_num += failed_pt
 
             transformed_data.extend(pt_examples)
+            transformed_labels.extend([label] * len(pt_examples))
+            transformed_sources.extend([_source(self, i)] * len(pt_examples))
 
         total_num = successful_num + failed_num
         print(
@@ -127,7 +311,9 @@ class TextLineDataset(BaseDataset):
             )
         )
         if total_num == 0: return None
-        return TextLineDataset(transformed_data, self.labels)
+        return TextLineDataset(
+            transformed_data, transformed_labels, transformed_sources
+        )
 
     def __iter__(self):
         for text, label in zip(self.data, self.labels):
@@ -175,26 +361,29 @@ class KeyValueDataset(BaseDataset):
         data: List[dict],
         task_type=TaskType.TEXT_TO_TEXT_GENERATION,
         fields: List[str] = None,
+        sources: List[int] = None,
     ):
         super(KeyValueDataset, self).__init__(data)
         self.task_type = task_type
         self.fields = fields
         self.operation_type = None
+        # index of the original datapoint every datapoint was generated from by
+        # apply_transformation or kept by apply_filter (None for an original dataset)
+        self.sources = sources
 
     @classmethod
     def from_huggingface(cls, dataset, task_type, fields, max_size=None):
         data = []
-        max_size = max_size or len(dataset)
         if task_type not in [
             TaskType.QUESTION_ANSWERING,
             TaskType.QUESTION_GENERATION,
         ]:
-            for example in list(dataset)[:max_size]:
+            for example in islice(dataset, max_size or None):
                 data.append({key: example[key] for key in fields})
         else:
             # this is an ugly implementation, which hard-codes the squad data format
             # TODO might need a more elegant way to deal with the fields with hierachy, e.g. the answers field in squad data (exampl['answers']['text'])
-            for example in list(dataset)[:max_size]:
+            for example in islice(dataset, max_size or None):
                 data.append(
                     {
                         fields[0]: example[fields[0]],
@@ -241,72 +430,162 @@ class KeyValueDataset(BaseDataset):
         )
         return filter_func, transformation_func
 
+    # parses the given fields (all the text fields by default) of all the datapoints with
+    # spaCy in one batched pass, so that spaCy-based operations applied afterwards reuse the Docs
+    def parse(
+        self,
+        subfields: List[str] = None,
+        batch_size: int = 256,
+        n_process: int = 1,
+    ) -> KeyValueDataset:
+        texts = [
+            datapoint[field]
+            for field in (subfields or self.fields)
+            for datapoint in self.data
+            if isinstance(datapoint[field], str)
+        ]
+        parse_texts(texts, batch_size=batch_size, n_process=n_process)
+        return self
+
     # this function is an adapter and will call the corresponding filter function for the task
     # subfields: the fields to apply filter, it is a subset of self.fields
+    # num_workers: number of processes to shard the dataset over (0 or 1 runs in this process)
+    # chunk_size: number of datapoints sent to a worker at once (defaults to batch_size)
     def apply_filter(
-        self, filter: Operation, subfields: List[str] = None
+        self,
+        filter: Operation,
+        subfields: List[str] = None,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        chunk_size: int = None,
     ) -> KeyValueDataset:
-        filter_func, _ = self._analyze(subfields)
-
         filtered_data = []
+        filtered_sources = []
         print("Applying filtering:")
-        for datapoint in tqdm(self.data):
-            if filter_func(datapoint, filter):
+        keep = self.filter_mask(
+            filter,
+            subfields,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            chunk_size=chunk_size,
+        )
+        for i, (keep_datapoint, datapoint) in enumerate(zip(keep, self.data)):
+            if keep_datapoint:
                 filtered_data.append(datapoint)
+                filtered_sources.append(_source(self, i))
+
+        return KeyValueDataset(
+            filtered_data, self.task_type, self.fields, filtered_sources
+        )
 
-        return KeyValueDataset(filtered_data, self.task_type, self.fields)
+    # returns whether every datapoint passes the filter, in the order of the datapoints
+    def filter_mask(
+        self,
+        filter: Operation,
+        subfields: List[str] = None,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        chunk_size: int = None,
+    ) -> List[bool]:
+        filter_func, _ = self._analyze(subfields)
+        if num_workers > 1:
+            filter_func = self._without_data(filter_func)
+        return list(
+            map_operation(
+                filter_func,
+                filter,
+                self.data,
+                batch_size=batch_size,
+                num_workers=num_workers,
+                chunk_size=chunk_size,
+            )
+        )
 
+    def _without_data(self, apply_func: Callable) -> Callable:
+        # the _apply_* functions only need the fields of the dataset, so bind them to an empty
+        # copy of it to avoid sending the whole data to every worker process
+        empty = KeyValueDataset([], self.task_type, self.fields)
+        empty.operation_type = self.operation_type
+        return getattr(empty, apply_func.__name__)
+
+    # the _apply_*_filter and _apply_*_transformation functions below work on a batch of datapoints
+    # and return one result per datapoint, so that operations can process the batch at once
     def _apply_sentence_filter(
-        self, datapoint: dict, filter: SentenceOperation
+        self, datapoints: List[dict], filter: SentenceOperation
     ):
-        sentence = datapoint[self.fields[0]]
-        return filter.filter(sentence)
+        sentences = [datapoint[self.fields[0]] for datapoint in datapoints]
+        return _filter_sentences(sentences, filter)
 
     def _apply_sentence_and_target_filter(
-        self, datapoint: dict, filter: SentenceAndTargetOperation
+        self, datapoints: List[dict], filter: SentenceAndTargetOperation
     ):
-        sentence = datapoint[self.fields[0]]
-        target = datapoint[self.fields[1]]
-        return filter.filter(sentence, target)
+        sentences = [datapoint[self.fields[0]] for datapoint in datapoints]
+        targets = [datapoint[self.fields[1]] for datapoint in datapoints]
+        return filter.filter_batch(sentences, targets)
 
     def _apply_sentence_and_targets_filter(
-        self, datapoint: dict, filter: SentenceAndTargetsOperation
+        self, datapoints: List[dict], filter: SentenceAndTargetsOperation
     ):
-        sentence = datapoint[self.fields[0]]
-        targets = [datapoint[target_key] for target_key in self.fields[1:]]
-        return filter.filter(sentence, targets)
+        sentences = [datapoint[self.fields[0]] for datapoint in datapoints]
+        targets = [
+            [datapoint[target_key] for target_key in self.fields[1:]]
+            for datapoint in datapoints
+        ]
+        return filter.filter_batch(sentences, targets)
 
     def _apply_question_answer_filter(
-        self, datapoint: dict, filter: QuestionAnswerOperation
+        self, datapoints: List[dict], filter: QuestionAnswerOperation
     ):
-        context = datapoint[self.fields[0]]
-        question = datapoint[self.fields[1]]
-        answers = [datapoint[answer_key] for answer_key in self.fields[2:]]
-        return filter.filter(context, question, answers)
+        contexts = [datapoint[self.fields[0]] for datapoint in datapoints]
+        questions = [datapoint[self.fields[1]] for datapoint in datapoints]
+        answers = [
+            [datapoint[answer_key] for answer_key in self.fields[2:]]
+            for datapoint in datapoints
+        ]
+        return filter.filter_batch(contexts, questions, answers)
 
     # this function is an adapter and will call the corresponding transform function for the task
     # subfields: the fields to apply transformation, it is a subset of self.fields
     def apply_transformation(
-        self, transformation: Operation, subfields: List[str] = None
+        self,
+        transformation: Operation,
+        subfields: List[str] = None,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        chunk_size: int = None,
     ) -> KeyValueDataset:
         _, transformation_func = self._analyze(subfields)
+        if num_workers > 1:
+            transformation_func = self._without_data(transformation_func)
         transformed_data = []
+        transformed_sources = []
         print("Applying transformation:")
-        
+
         # calculating ratio of transformed example to unchanged example
         successful_num = 0
         failed_num = 0
-        
-        for datapoint in tqdm(self.data):
-            pt_examples = transformation_func(datapoint.copy(), transformation)
+
+        batch_pt_examples = map_operation(
+            transformation_func,
+            transformation,
+            # don't want self.data to be changed
+            [datapoint.copy() for datapoint in self.data],
+            batch_size=batch_size,
+            num_workers=num_workers,
+            chunk_size=chunk_size,
+        )
+        for i, (pt_examples, datapoint) in enumerate(
+            zip(batch_pt_examples, self.data)
+        ):
             successful_pt, failed_pt = transformation.compare(
                 datapoint, pt_examples
             )
             successful_num += successful_pt
             failed_num += failed_pt
-            
-            transformed_data.extend(pt_examples)  # don't want self.data to be changed
-        
+
+            transformed_data.extend(pt_examples)
+            transformed_sources.extend([_source(self, i)] * len(pt_examples))
+
         total_num = successful_num + failed_num
 
         print(
@@ -319,65 +598,98 @@ class KeyValueDataset(BaseDataset):
             )
         )
         if total_num == 0: return None
-        return KeyValueDataset(transformed_data, self.task_type, self.fields)
+        return KeyValueDataset(
+            transformed_data, self.task_type, self.fields, transformed_sources
+        )
 
     def _apply_sentence_transformation(
-        self, datapoint: dict, transformation: SentenceOperation
+        self, datapoints: List[dict], transformation: SentenceOperation
     ):
-        sentence = datapoint[self.fields[0]]
-        transformed_sentence = transformation.generate(sentence)
-        datapoint[self.fields[0]] = transformed_sentence
-        return [datapoint]
+        sentences = [datapoint[self.fields[0]] for datapoint in datapoints]
+        batch_transformed = _generate_sentences(sentences, transformation)
+        results = []
+        for datapoint, transformed in zip(datapoints, batch_transformed):
+            # one datapoint per generated sentence
+            datapoints_n = []
+            for transformed_sentence in transformed:
+                datapoint_n = datapoint.copy()
+                datapoint_n[self.fields[0]] = transformed_sentence
+                datapoints_n.append(datapoint_n)
+            results.append(datapoints_n)
+        return results
 
     def _apply_sentence_and_target_transformation(
-        self, datapoint: dict, transformation: SentenceAndTargetOperation
+        self,
+        datapoints: List[dict],
+        transformation: SentenceAndTargetOperation,
     ):
-        sentence = datapoint[self.fields[0]]
-        target = datapoint[self.fields[1]]
-        transformed_sentence, transformed_target = transformation.generate(
-            sentence, target
-        )
-        datapoint[self.fields[0]] = transformed_sentence
-        datapoint[self.fields[1]] = transformed_target
-        return [datapoint]
+        sentences = [datapoint[self.fields[0]] for datapoint in datapoints]
+        targets = [datapoint[self.fields[1]] for datapoint in datapoints]
+        batch_transformed = transformation.generate_batch(sentences, targets)
+        results = []
+        for datapoint, transformed in zip(datapoints, batch_transformed):
+            datapoints_n = []
+            for transformed_sentence, transformed_target in transformed:
+                datapoint_n = datapoint.copy()
+                datapoint_n[self.fields[0]] = transformed_sentence
+                datapoint_n[self.fields[1]] = transformed_target
+                datapoints_n.append(datapoint_n)
+            results.append(datapoints_n)
+        return results
 
     def _apply_sentence_and_targets_transformation(
-        self, datapoint: dict, transformation: SentenceAndTargetsOperation
+        self,
+        datapoints: List[dict],
+        transformation: SentenceAndTargetsOperation,
     ):
-        sentence = datapoint[self.fields[0]]
-        targets = [datapoint[target_key] for target_key in self.fields[1:]]
-        transformed = transformation.generate(sentence, targets)
-        datapoints = []
-        for to in transformed:
-            datapoint_n = dict()
-            datapoint_n[self.fields[0]] = to[0]
-            for i, target_key in enumerate(self.fields[1:]):
-                datapoint[target_key] = to[1][
-                    1 + i
-                ]  # targets starting from pos 1
-            datapoints.append(datapoint_n)
-        return datapoints
+        sentences = [datapoint[self.fields[0]] for datapoint in datapoints]
+        targets = [
+            [datapoint[target_key] for target_key in self.fields[1:]]
+            for datapoint in datapoints
+        ]
+        batch_transformed = transformation.generate_batch(sentences, targets)
+        results = []
+        for datapoint, transformed in zip(datapoints, batch_transformed):
+            datapoints_n = []
+            for to in transformed:
+                datapoint_n = dict()
+                datapoint_n[self.fields[0]] = to[0]
+                for i, target_key in enumerate(self.fields[1:]):
+                    datapoint[target_key] = to[1][
+                        1 + i
+                    ]  # targets starting from pos 1
+                datapoints_n.append(datapoint_n)
+            results.append(datapoints_n)
+        return results
 
     def _apply_question_answer_transformation(
-        self, datapoint: dict, transformation: QuestionAnswerOperation
+        self, datapoints: List[dict], transformation: QuestionAnswerOperation
     ):
-        context = datapoint[self.fields[0]]
-        question = datapoint[self.fields[1]]
-        answers = [datapoint[answer_key] for answer_key in self.fields[2:]]
-        transformed = transformation.generate(context, question, answers)
-
-        datapoints = []
-        for to in transformed:
-            datapoint_n = dict()
-            datapoint_n[self.fields[0]] = to[0]
-            datapoint_n[self.fields[1]] = to[1]
-            for i, answers_key in enumerate(self.fields[2:]):
-                datapoint_n[answers_key] = to[
-                    2 + i
-                ]  # answers starting from pos 2
-            datapoints.append(datapoint_n)
-
-        return datapoints
+        contexts = [datapoint[self.fields[0]] for datapoint in datapoints]
+        questions = [datapoint[self.fields[1]] for datapoint in datapoints]
+        answers = [
+            [datapoint[answer_key] for answer_key in self.fields[2:]]
+            for datapoint in datapoints
+        ]
+        batch_transformed = transformation.generate_batch(
+            contexts, questions, answers
+        )
+
+        results = []
+        for transformed in batch_transformed:
+            datapoints_n = []
+            for to in transformed:
+                datapoint_n = dict()
+                datapoint_n[self.fields[0]] = to[0]
+                datapoint_n[self.fields[1]] = to[1]
+                for i, answers_key in enumerate(self.fields[2:]):
+                    datapoint_n[answers_key] = to[
+                        2 + i
+                    ]  # answers starting from pos 2
+                datapoints_n.append(datapoint_n)
+            results.append(datapoints_n)
+
+        return results
 
     def __iter__(self):
         for datapoint in self.data:
@@ -447,3 +759,168 @@ class KeyValueDataset(BaseDataset):
         identifiers = identifiers.difference(identifiers2)
         data = self._identifier2data(id2datapoint, identifier2id, identifiers)
         return KeyValueDataset(data, self.task_type, self.fields)
+
+
+"""
+Dataset of key-value pairs which is read and processed lazily, chunk by chunk, so that
+large corpora never have to fit in memory
+"""
+
+
+class StreamingDataset(BaseDataset):
+    tasks = KeyValueDataset.tasks
+
+    # source: function returning a new iterator over the datapoints (dicts) every time it's called
+    # task_type, fields: same as for KeyValueDataset
+    # chunk_size: number of datapoints read from the source and processed at once
+    def __init__(
+        self,
+        source: Callable[[], Iterable[dict]],
+        task_type=TaskType.TEXT_TO_TEXT_GENERATION,
+        fields: List[str] = None,
+        chunk_size: int = 1000,
+        stages: List = None,
+    ):
+        super(StreamingDataset, self).__init__(source)
+        self.task_type = task_type
+        self.fields = fields
+        self.chunk_size = chunk_size
+        # (kind, operation, function applying the operation to a batch, batch_size)
+        self.stages = stages or []
+
+    @classmethod
+    def from_huggingface(
+        cls, dataset, task_type, fields, max_size=None, chunk_size=1000
+    ):
+        # works with both regular and streaming (load_dataset(..., streaming=True)) datasets
+        def source():
+            for example in islice(dataset, max_size or None):
+                if task_type in [
+                    TaskType.QUESTION_ANSWERING,
+                    TaskType.QUESTION_GENERATION,
+                ]:
+                    # same hard-coded squad format as KeyValueDataset.from_huggingface
+                    yield {
+                        fields[0]: example[fields[0]],
+                        fields[1]: example[fields[1]],
+                        fields[2]: example[fields[2]]["text"],
+                    }
+                else:
+                    yield {key: example[key] for key in fields}
+
+        return cls(source, task_type, fields, chunk_size)
+
+    @classmethod
+    def from_jsonl(
+        cls, path, task_type, fields, max_size=None, chunk_size=1000
+    ):
+        def source():
+            with open(path, encoding="utf-8") as f:
+                for line in islice(f, max_size or None):
+                    example = json.loads(line)
+                    yield {key: example[key] for key in fields}
+
+        return cls(source, task_type, fields, chunk_size)
+
+    # every line of the file is a datapoint with a single "text" field
+    @classmethod
+    def from_text_file(
+        cls,
+        path,
+        task_type=TaskType.TEXT_TO_TEXT_GENERATION,
+        max_size=None,
+        chunk_size=1000,
+    ):
+        def source():
+            with open(path, encoding="utf-8") as f:
+                for line in islice(f, max_size or None):
+                    yield {"text": line.rstrip("\n")}
+
+        return cls(source, task_type, ["text"], chunk_size)
+
+    def _add_stage(self, kind, operation, subfields, batch_size):
+        filter_func, transformation_func = KeyValueDataset(
+            [], self.task_type, self.fields
+        )._analyze(subfields)
+        apply_func = filter_func if kind == "filter" else transformation_func
+        return StreamingDataset(
+            self.data,
+            self.task_type,
+            self.fields,
+            self.chunk_size,
+            self.stages + [(kind, operation, apply_func, batch_size)],
+        )
+
+    # filters and transformations are only recorded here and run when the dataset is iterated
+    def apply_filter(
+        self,
+        filter: Operation,
+        subfields: List[str] = None,
+        batch_size: int = 32,
+    ) -> StreamingDataset:
+        return self._add_stage("filter", filter, subfields, batch_size)
+
+    def apply_transformation(
+        self,
+        transformation: Operation,
+        subfields: List[str] = None,
+        batch_size: int = 32,
+    ) -> StreamingDataset:
+        return self._add_stage(
+            "transformation", transformation, subfields, batch_size
+        )
+
+    def datapoints(self) -> Iterator[dict]:
+        """Yields the processed datapoints, running all the stages one chunk at a time."""
+        source = iter(self.data())
+        while True:
+            chunk = list(islice(source, self.chunk_size))
+            if not chunk:
+                return
+            for kind, operation, apply_func, batch_size in self.stages:
+                if kind == "filter":
+                    keep = _apply_in_batches(
+                        apply_func, operation, chunk, batch_size
+                    )
+                    chunk = [
+                        datapoint
+                        for keep_datapoint, datapoint in zip(keep, chunk)
+                        if keep_datapoint
+                    ]
+                else:
+                    pt_examples = _apply_in_batches(
+                        apply_func,
+                        operation,
+                        [datapoint.copy() for datapoint in chunk],
+                        batch_size,
+                    )
+                    chunk = [
+                        pt_example
+                        for pt_examples_datapoint in pt_examples
+                        for pt_example in pt_examples_datapoint
+                    ]
+            yield from chunk
+
+    def write_jsonl(self, path) -> int:
+        """Writes the processed datapoints to a jsonl file as they are produced, returns their number."""
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for datapoint in tqdm(self.datapoints()):
+                f.write(json.dumps(datapoint, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+    def to_key_value_dataset(self, max_size=None) -> KeyValueDataset:
+        return KeyValueDataset(
+            list(islice(self.datapoints(), max_size or None)),
+            self.task_type,
+            self.fields,
+        )
+
+    def __iter__(self):
+        for datapoint in self.datapoints():
+            yield tuple(datapoint[field] for field in self.fields)
+
+    def __len__(self):
+        # TypeError (rather than NotImplementedError) lets list() and friends fall back to iterating
+        raise TypeError("The length of a StreamingDataset is not known")
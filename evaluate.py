@@ -1,6 +1,7 @@
 import argparse
 
-from evaluation.evaluation_engine import evaluate
+from evaluation.evaluation_engine import evaluate, evaluate_operations
+from initialize import get_model_registry
 from TestRunner import get_implementation
 
 parser = argparse.ArgumentParser(
@@ -10,7 +11,13 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "-l", "--language", help="language to evaluate over", default="en"
 )
-parser.add_argument("--transformation", "-t", required=False)
+parser.add_argument(
+    "--transformation",
+    "-t",
+    help="Name of the transformation, or comma-separated names to evaluate "
+    "several transformations with a single pass of the model.",
+    required=False,
+)
 parser.add_argument("--filter", "-f", required=False)
 parser.add_argument("--task_type", "-task", help="type of the task")
 parser.add_argument(
@@ -30,6 +37,19 @@ parser.add_argument(
     help="percentage of examples to test",
     default=20,
 )
+parser.add_argument(
+    "--cache_dir",
+    help="Directory where the outputs of the transformation/filter are cached, "
+    "so that later runs only compute the outputs of new examples.",
+    default=None,
+)
+parser.add_argument(
+    "--memory_budget_mb",
+    help="Memory the loaded models may take, in MB. The least recently used "
+    "models are unloaded beyond it and loaded again when they are needed.",
+    type=float,
+    default=None,
+)
 
 
 """
@@ -40,6 +60,10 @@ Just run this file using the following command:
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    if args.memory_budget_mb is not None:
+        get_model_registry().set_memory_budget(
+            int(args.memory_budget_mb * 1024 * 1024)
+        )
 
     if args.transformation is None and args.filter is None:
         raise ValueError(
@@ -51,22 +75,44 @@ if __name__ == "__main__":
     # Identify the transformation that the user has mentioned.
     if_filter = args.transformation is None
     if args.transformation:
-        implementation = get_implementation(args.transformation)
+        implementations = [
+            get_implementation(name.strip())
+            for name in args.transformation.split(",")
+            if name.strip()
+        ]
     else:
-        implementation = get_implementation(args.filter, "filters")
+        implementations = [
+            get_implementation(name.strip(), "filters")
+            for name in args.filter.split(",")
+            if name.strip()
+        ]
     # Use the tasks and the locales of an implementation to retrieve an HF model and a test set.
     if True:  # domain should have name and locale.
-        languages = implementation.languages
-        if languages != "All" and args.language not in languages:
-            raise ValueError(
-                f"The specified transformation is applicable only for the locales={languages}."
+        for implementation in implementations:
+            languages = implementation.languages
+            if languages != "All" and args.language not in languages:
+                raise ValueError(
+                    f"The specified transformation is applicable only for the locales={languages}."
+                )
+        if len(implementations) > 1:
+            evaluate_operations(
+                implementations,
+                args.task_type,
+                args.language,
+                args.model,
+                args.dataset,
+                args.percentage_of_examples,
+                if_filter,
+                args.cache_dir,
+            )
+        else:
+            evaluate(
+                implementations[0],
+                args.task_type,
+                args.language,
+                args.model,
+                args.dataset,
+                args.percentage_of_examples,
+                if_filter,
+                args.cache_dir,
             )
-        evaluate(
-            implementation,
-            args.task_type,
-            args.language,
-            args.model,
-            args.dataset,
-            args.percentage_of_examples,
-            if_filter,
-        )
@@ -1,7 +1,12 @@
+import time
+
 import numpy as np
+import torch
 from datasets import load_dataset
-from seqeval.metrics import accuracy_score
-from transformers import pipeline
+
+from evaluation.inference_planner import predict_perturbed_union
+from initialize import load_pipeline
+from result_cache import get_prediction_store, get_result_cache, perturbed_set
 
 
 def convert_ner_ids_to_tags(ner_tags):
@@ -24,31 +29,141 @@ def convert_ner_ids_to_tags(ner_tags):
     return ner_tag_sequence
 
 
-def create_prediction_seq(prediction, expected_seq_length):
-    # create model output into ner tag sequence
-    # input : model output in the form [[], [{ner-info}], [{ner-info}], []]
-    # output : ['0', 'B-PER', 'I-PER', '0']
-    if (
-        prediction == []
-    ):  # corner case where model prediction is [] and gold label is not []. ex: example["tokens"] = [',']
-        return ["0"] * expected_seq_length
-    seq = []
-    tag = ""
-    for item in prediction:
-        if len(item) == 0:
-            seq.append("0")
-        else:
-            if isinstance(item, list):
-                tag = item[0]["entity"]
-            elif isinstance(item, dict):  # to handle a corner case
-                tag = item["entity"]
-            seq.append(tag)
-    return seq
+def predict_tag_sequences(model, tokenizer, token_sequences, batch_size=32):
+    """
+    Tags pre-tokenized sentences with a token classification model, running it on padded
+    batches of sentences. The tag of a word is the tag predicted for its first sub-token,
+    and the "O" tag is returned as "0" like in convert_ner_ids_to_tags.
+    """
+    id2label = {
+        i: "0" if label == "O" else label
+        for i, label in model.config.id2label.items()
+    }
+    model.eval()
+    predictions = []
+    for start in range(0, len(token_sequences), batch_size):
+        batch = [
+            list(tokens)
+            for tokens in token_sequences[start : start + batch_size]
+        ]
+        encoded = tokenizer(
+            batch,
+            is_split_into_words=True,
+            truncation=True,
+            padding=True,
+            return_tensors="pt",
+        )
+        with torch.no_grad():
+            logits = model(
+                **{
+                    key: value.to(model.device)
+                    for key, value in encoded.items()
+                }
+            ).logits
+        label_ids = logits.argmax(-1).cpu().numpy()
+        for i, tokens in enumerate(batch):
+            # words cut by the truncation keep the "0" tag
+            tags = ["0"] * len(tokens)
+            previous_word_id = None
+            for position, word_id in enumerate(encoded.word_ids(i)):
+                if word_id is not None and word_id != previous_word_id:
+                    tags[word_id] = id2label[int(label_ids[i, position])]
+                previous_word_id = word_id
+            predictions.append(tags)
+    return predictions
+
+
+def token_accuracy(gold_tag_sequences, predicted_tag_sequences):
+    """Accuracy over all the tokens of all the sentences."""
+    tag_ids = {}
+    gold = np.fromiter(
+        (
+            tag_ids.setdefault(tag, len(tag_ids))
+            for sequence in gold_tag_sequences
+            for tag in sequence
+        ),
+        dtype=np.int64,
+    )
+    predicted = np.fromiter(
+        (
+            tag_ids.setdefault(tag, len(tag_ids))
+            for sequence in predicted_tag_sequences
+            for tag in sequence
+        ),
+        dtype=np.int64,
+    )
+    if len(gold) == 0:
+        return 0.0
+    return float(np.mean(gold == predicted))
+
+
+def perturb_tagged_sentences(operation, token_sequences, tag_sequences):
+    """
+    Applies a tagging transformation to all the sentences, and returns the perturbed token
+    and tag sequences with the index of the sentence each one comes from.
+    """
+    pt_token_sequences = []
+    pt_tag_sequences = []
+    pt_sources = []
+    for source, outputs in enumerate(
+        operation.generate_batch(token_sequences, tag_sequences)
+    ):
+        for pt_tokens, pt_tags in outputs:
+            pt_token_sequences.append(pt_tokens)
+            pt_tag_sequences.append(pt_tags)
+            pt_sources.append(source)
+    return pt_token_sequences, pt_tag_sequences, pt_sources
+
+
+def _perturbed_sets(
+    perturbed_sets,
+    dataset_name,
+    split,
+    operations,
+    token_sequences,
+    tag_sequences,
+):
+    # the perturbed sets are made once and shared by all the models evaluated on this dataset
+    return [
+        perturbed_set(
+            perturbed_sets,
+            dataset_name,
+            split,
+            operation,
+            lambda: perturb_tagged_sentences(
+                operation, token_sequences, tag_sequences
+            ),
+        )
+        for operation in operations
+    ]
 
 
-"""
-TODO: this implementation should change - needs to be done dataset wise
-"""
+def make_perturbed_sets(
+    operations,
+    dataset_name=None,
+    split="validation[:20%]",
+    perturbed_sets=None,
+):
+    """
+    Makes the perturbed sets of the transformations on the dataset without loading any model,
+    so that the evaluations of all the models on the dataset find them in perturbed_sets.
+    """
+    if dataset_name is None:
+        dataset_name = "conll2003"
+    if perturbed_sets is None:
+        perturbed_sets = get_result_cache()
+    dataset = load_dataset(dataset_name, split=split)
+    return _perturbed_sets(
+        perturbed_sets,
+        dataset_name,
+        split,
+        operations,
+        dataset["tokens"],
+        [
+            convert_ner_ids_to_tags(ner_tags)
+            for ner_tags in dataset["ner_tags"]
+        ],
+    )
 
 
 def evaluate(
@@ -57,7 +172,37 @@ def evaluate(
     model_name,
     dataset_name,
     split="validation[:20%]",
+    batch_size=32,
+    prediction_store=None,
+    perturbed_sets=None,
+):
+    return evaluate_operations(
+        [operation],
+        evaluate_filter,
+        model_name,
+        dataset_name,
+        split,
+        batch_size,
+        prediction_store,
+        perturbed_sets,
+    )[0]
+
+
+def evaluate_operations(
+    operations,
+    evaluate_filter,
+    model_name,
+    dataset_name,
+    split="validation[:20%]",
+    batch_size=32,
+    prediction_store=None,
+    perturbed_sets=None,
 ):
+    """
+    Evaluates the model on several operations and returns the performance for every operation.
+    The perturbed sets of all the transformations are tagged in a single pass over their
+    union, so that the sentences produced by several transformations are tagged once.
+    """
     # load modal
     if model_name is None:
         model_name = "dslim/bert-base-NER"
@@ -69,90 +214,126 @@ def evaluate(
         f"Loading <{dataset_name}> dataset to evaluate <{model_name}> model."
     )
     dataset = load_dataset(dataset_name, split=split)
-    tagging_pipeline = pipeline("ner", model=model_name, tokenizer=model_name)
+    # the pipeline is shared by all the evaluations of the process
+    tagging_pipeline = load_pipeline("ner", model_name)
+    model, tokenizer = tagging_pipeline.model, tagging_pipeline.tokenizer
 
-    average_score = 0.0
-    average_pertubed_score = 0.0
     print(f"Length of Evaluation dataset is {len(dataset)}")
+    token_sequences = dataset["tokens"]
+    gold_tag_sequences = [
+        convert_ner_ids_to_tags(ner_tags) for ner_tags in dataset["ner_tags"]
+    ]
+
+    # (1) apply the operations to the whole split
     if evaluate_filter:
-        filter_true_average_score = 0.0
-        filter_false_average_score = 0.0
-        filter_true_count = (
-            0  # This will track the number of examples where the filter is +ve
+        # The Operations are "filters"
+        keeps = [
+            operation.filter_batch(token_sequences, gold_tag_sequences)
+            for operation in operations
+        ]
+    else:
+        # The Operations are "transformations"
+        if perturbed_sets is None:
+            perturbed_sets = get_result_cache()
+        pt_sets = _perturbed_sets(
+            perturbed_sets,
+            dataset_name,
+            split,
+            operations,
+            token_sequences,
+            gold_tag_sequences,
         )
-        filter_false_count = (
-            0  # This will track the number of examples where the filter is -ve
+
+    # (2) tag the sentences with the model
+    start_time = time.perf_counter()
+    # the tags of the original sentences are predicted once per model and dataset
+    if prediction_store is None:
+        prediction_store = get_prediction_store()
+    predicted_tag_sequences = prediction_store.predict(
+        model_name,
+        dataset_name,
+        split,
+        token_sequences,
+        lambda missing: predict_tag_sequences(
+            model, tokenizer, missing, batch_size
+        ),
+    )
+    n_tagged = len(token_sequences)
+    if not evaluate_filter:
+        # only the perturbed sentences which differ from all the original ones are tagged
+        all_pt_predicted_tag_sequences = predict_perturbed_union(
+            [
+                (pt_token_sequences, pt_sources)
+                for pt_token_sequences, _, pt_sources in pt_sets
+            ],
+            token_sequences,
+            predicted_tag_sequences,
+            lambda new_sequences: predict_tag_sequences(
+                model, tokenizer, new_sequences, batch_size
+            ),
         )
-    for example in dataset:
-        # Calculating the performance on the original set
-        gold_tag_seq = convert_ner_ids_to_tags(example["ner_tags"])
-        prediction = tagging_pipeline(example["tokens"])
-        predicted_tag_seq = create_prediction_seq(
-            prediction, len(gold_tag_seq)
+        n_tagged += sum(
+            len(pt_token_sequences) for pt_token_sequences, _, _ in pt_sets
         )
-        score = accuracy_score([gold_tag_seq], [predicted_tag_seq])
-        average_score += score
-        if evaluate_filter:
-            # The Operation is a "filter"
-            if operation.filter(example["tokens"], gold_tag_seq):
-                filter_true_average_score += score
-                filter_true_count += 1
-            else:
-                filter_false_average_score += score
-                filter_false_count += 1
-        else:
-            # The Operation is a "transformation"
-            # Calculating the performance on the perturbed set
-            # TODO: Needs to handle for multiple outputs.
-            trans_input, trans_gold_tag_seq = operation.generate(
-                example["tokens"], gold_tag_seq
-            )
-            trans_gold_tag_seq = convert_ner_ids_to_tags(trans_gold_tag_seq)
-            transformed_input_prediction = tagging_pipeline(trans_input)
-            trans_predicted_tag_seq = create_prediction_seq(
-                transformed_input_prediction, len(trans_gold_tag_seq)
-            )
-            pt_score = accuracy_score(
-                [trans_gold_tag_seq], [trans_predicted_tag_seq]
-            )
-            average_pertubed_score += pt_score
-
-    average_score = average_score / len(dataset) * 100
+    elapsed = time.perf_counter() - start_time
+    print(f"Tagged {n_tagged / elapsed:.1f} sentences/sec")
 
+    # (3) compute the token accuracy over the whole split
+    average_score = (
+        token_accuracy(gold_tag_sequences, predicted_tag_sequences) * 100
+    )
     print(
         f"Here is the performance of the model {model_name} on the {split} split of the {dataset} dataset"
     )
     print(
         f"The average accuracy on a subset of {dataset_name} = {average_score}"
     )
-    performance = {
-        "model_name": model_name,
-        "split": split,
-        "dataset_name": dataset_name,
-        "accuracy": np.round(average_score, 1),
-    }
-    if evaluate_filter:
-        filter_true_average_score = (
-            filter_true_average_score / filter_true_count * 100
-        )
-        filter_false_average_score = (
-            filter_false_average_score / filter_false_count * 100
-        )
-        print(
-            f"The average accuracy of {filter_true_count} examples which pass the filter = {filter_true_average_score}"
-        )
-        print(
-            f"The average accuracy of {filter_false_count} examples which fail the filter = {filter_false_average_score}"
-        )
-        performance["filter_true_count"] = filter_true_count
-        performance["filter_false_count"] = filter_false_count
-        performance["filter_true_average_score"] = filter_true_average_score
-        performance["filter_false_average_score"] = filter_false_average_score
-    else:
-        performance["pt_accuracy"]: np.round(average_pertubed_score, 1)
-        average_pertubed_score = average_pertubed_score / len(dataset) * 100
-        print(
-            f"The average accuracy on its perturbed set = {average_pertubed_score}"
-        )
+    performances = []
+    for i in range(len(operations)):
+        performance = {
+            "model_name": model_name,
+            "split": split,
+            "dataset_name": dataset_name,
+            "accuracy": np.round(average_score, 1),
+        }
+        if evaluate_filter:
+            groups = {True: ([], []), False: ([], [])}
+            for keep_example, gold, predicted in zip(
+                keeps[i], gold_tag_sequences, predicted_tag_sequences
+            ):
+                groups[bool(keep_example)][0].append(gold)
+                groups[bool(keep_example)][1].append(predicted)
+            filter_true_count = len(groups[True][0])
+            filter_false_count = len(groups[False][0])
+            filter_true_average_score = token_accuracy(*groups[True]) * 100
+            filter_false_average_score = token_accuracy(*groups[False]) * 100
+            print(
+                f"The average accuracy of {filter_true_count} examples which pass the filter = {filter_true_average_score}"
+            )
+            print(
+                f"The average accuracy of {filter_false_count} examples which fail the filter = {filter_false_average_score}"
+            )
+            performance["filter_true_count"] = filter_true_count
+            performance["filter_false_count"] = filter_false_count
+            performance["filter_true_average_score"] = (
+                filter_true_average_score
+            )
+            performance["filter_false_average_score"] = (
+                filter_false_average_score
+            )
+        else:
+            pt_token_sequences, pt_gold_tag_sequences, _ = pt_sets[i]
+            average_pertubed_score = (
+                token_accuracy(
+                    pt_gold_tag_sequences, all_pt_predicted_tag_sequences[i]
+                )
+                * 100
+            )
+            performance["pt_accuracy"] = np.round(average_pertubed_score, 1)
+            performance["no_of_pt_examples"] = len(pt_token_sequences)
+            print(
+                f"The average accuracy on its perturbed set of {len(pt_token_sequences)} examples = {average_pertubed_score}"
+            )
+        performances.append(performance)
 
-    return performance
+    return performances
@@ -1,8 +1,13 @@
+import time
+
 import numpy as np
+import torch
 from datasets import load_dataset
-from transformers import pipeline
 
 from dataset import KeyValueDataset
+from evaluation.inference_planner import predict_perturbed_union
+from initialize import load_pipeline
+from result_cache import get_prediction_store, get_result_cache, perturbed_set
 from tasks.TaskTypes import TaskType
 
 
@@ -12,7 +17,37 @@ def evaluate(
     model_name,
     dataset_name,
     split="validation[:20%]",
+    batch_size=32,
+    prediction_store=None,
+    perturbed_sets=None,
+):
+    return evaluate_operations(
+        [operation],
+        evaluate_filter,
+        model_name,
+        dataset_name,
+        split,
+        batch_size,
+        prediction_store,
+        perturbed_sets,
+    )[0]
+
+
+def evaluate_operations(
+    operations,
+    evaluate_filter,
+    model_name,
+    dataset_name,
+    split="validation[:20%]",
+    batch_size=32,
+    prediction_store=None,
+    perturbed_sets=None,
 ):
+    """
+    Evaluates the model on several operations and returns the performance for every operation.
+    The perturbed sets of all the transformations are predicted in a single pass over their
+    union, so that the questions produced by several transformations are predicted once.
+    """
     # (1) load model
     if model_name is None:
         model_name = "mrm8488/bert-tiny-5-finetuned-squadv2"
@@ -23,58 +58,355 @@ def evaluate(
         f"Loading <{dataset_name}> dataset to evaluate <{model_name}> model."
     )
 
-    hf_dataset = load_dataset(dataset_name, split=split)
-    qa_pipeline = pipeline(
-        "question-answering", model=model_name, tokenizer=model_name
-    )
-
-    dataset = KeyValueDataset.from_huggingface(
-        hf_dataset,
-        TaskType.QUESTION_ANSWERING,
-        ["context", "question", "answers"],
-    )
+    dataset = _load(dataset_name, split)
+    # the pipeline is shared by all the evaluations of the process
+    qa_pipeline = load_pipeline("question-answering", model_name)
 
     print(
         f"Here is the performance of the model {model_name} on the {split} split of the {dataset_name} dataset"
     )
 
+    # shared by the evaluations on the original and the transformed dataset, so that the
+    # contexts left unchanged by the transformation are tokenized only once
+    context_encodings = {}
+    # throughput of all the predictions of this evaluation
+    stats = {"examples": 0, "seconds": 0.0}
+
+    def predict(examples):
+        start_time = time.perf_counter()
+        answers = predict_answers(
+            qa_pipeline.model,
+            qa_pipeline.tokenizer,
+            examples,
+            batch_size,
+            context_encodings,
+        )
+        stats["examples"] += len(examples)
+        stats["seconds"] += time.perf_counter() - start_time
+        return answers
+
+    # the answers to the original questions are predicted once per model and dataset
+    if prediction_store is None:
+        prediction_store = get_prediction_store()
+    examples = [tuple(example) for example in dataset]
+    predictions = prediction_store.predict(
+        model_name,
+        dataset_name,
+        split,
+        [(context, question) for context, question, _ in examples],
+        predict,
+    )
+    performances = []
     if evaluate_filter:
-        filtered_dataset = dataset.apply_filter(operation)
-        print("Starting evaluation on the filtered dataset.")
-        performance = evaluate_on_dataset(filtered_dataset, qa_pipeline)
+        for operation in operations:
+            keep = dataset.filter_mask(operation)
+            print("Starting evaluation on the filtered dataset.")
+            performances.append(
+                exact_match(
+                    [p for p, keep_p in zip(predictions, keep) if keep_p],
+                    [e for e, keep_e in zip(examples, keep) if keep_e],
+                )
+            )
     else:
         print("Starting evaluation on the original dataset.")
-        performance = evaluate_on_dataset(dataset, qa_pipeline)
+        performance = exact_match(predictions, examples)
 
-        print("Starting evaluation on the transformed dataset.")
-        pt_dataset = dataset.apply_transformation(operation)
-        pt_performance = evaluate_on_dataset(pt_dataset, qa_pipeline)
-        performance["pt_accuracy"] = pt_performance["accuracy"]
+        print("Starting evaluation on the transformed datasets.")
+        if perturbed_sets is None:
+            perturbed_sets = get_result_cache()
+        pt_datasets = _perturbed_datasets(
+            perturbed_sets, dataset, dataset_name, split, operations
+        )
+        all_pt_examples = [
+            (
+                [tuple(example) for example in pt_dataset]
+                if pt_dataset is not None
+                else []
+            )
+            for pt_dataset in pt_datasets
+        ]
+        # only the perturbed questions which differ from all the original ones are predicted
+        all_pt_predictions = predict_perturbed_union(
+            [
+                (
+                    [
+                        (context, question)
+                        for context, question, _ in pt_examples
+                    ],
+                    pt_dataset.sources if pt_dataset is not None else None,
+                )
+                for pt_examples, pt_dataset in zip(
+                    all_pt_examples, pt_datasets
+                )
+            ],
+            [(context, question) for context, question, _ in examples],
+            predictions,
+            predict,
+        )
+        for pt_examples, pt_predictions in zip(
+            all_pt_examples, all_pt_predictions
+        ):
+            pt_performance = exact_match(pt_predictions, pt_examples)
+            performances.append(
+                {**performance, "pt_accuracy": pt_performance["accuracy"]}
+            )
 
     # (3) Execute perturbation
     # (4) Execute the performance of the original set and the perturbed set
 
-    performance["model_name"] = model_name
-    performance["split"] = split
-    performance["dataset_name"] = dataset_name
+    if stats["examples"]:
+        examples_per_second = (
+            stats["examples"] / stats["seconds"] if stats["seconds"] else 0.0
+        )
+        print(f"Evaluated {examples_per_second:.1f} examples/sec")
+        for performance in performances:
+            performance["examples_per_second"] = np.round(
+                examples_per_second, 1
+            )
+    for performance in performances:
+        performance["model_name"] = model_name
+        performance["split"] = split
+        performance["dataset_name"] = dataset_name
+
+    return performances
+
+
+# same defaults as the question-answering pipeline
+MAX_SEQ_LEN = 384
+DOC_STRIDE = 128
+MAX_ANSWER_LEN = 15
+
+
+def _load(dataset_name, split):
+    return KeyValueDataset.from_huggingface(
+        load_dataset(dataset_name, split=split),
+        TaskType.QUESTION_ANSWERING,
+        ["context", "question", "answers"],
+    )
+
+
+def _perturbed_datasets(
+    perturbed_sets, dataset, dataset_name, split, operations
+):
+    # the perturbed sets are made once and shared by all the models evaluated on this dataset
+    return [
+        perturbed_set(
+            perturbed_sets,
+            dataset_name,
+            split,
+            operation,
+            lambda: dataset.apply_transformation(operation),
+        )
+        for operation in operations
+    ]
+
+
+def make_perturbed_sets(
+    operations,
+    dataset_name=None,
+    split="validation[:20%]",
+    perturbed_sets=None,
+):
+    """
+    Makes the perturbed sets of the transformations on the dataset without loading any model,
+    so that the evaluations of all the models on the dataset find them in perturbed_sets.
+    """
+    if dataset_name is None:
+        dataset_name = "squad"
+    if perturbed_sets is None:
+        perturbed_sets = get_result_cache()
+    return _perturbed_datasets(
+        perturbed_sets,
+        _load(dataset_name, split),
+        dataset_name,
+        split,
+        operations,
+    )
+
+
+def _pair_template(tokenizer):
+    """
+    Returns how the tokenizer lays out a (question, context) pair: the special tokens before,
+    between and after the two sequences, with the token type ids of each part.
+    """
+    encoded = tokenizer("question", "context")
+    sequence_ids = encoded.sequence_ids(0)
+    input_ids = encoded["input_ids"]
+    type_ids = encoded.get("token_type_ids", [0] * len(input_ids))
+    parts = {"prefix": [], "middle": [], "suffix": []}
+    part = "prefix"
+    sequence_type_ids = {}
+    for token_id, type_id, sequence_id in zip(
+        input_ids, type_ids, sequence_ids
+    ):
+        if sequence_id is None:
+            parts[part].append((token_id, type_id))
+        else:
+            sequence_type_ids[sequence_id] = type_id
+            part = "middle" if sequence_id == 0 else "suffix"
+    return parts, sequence_type_ids, "token_type_ids" in encoded
 
-    return performance
 
+def _encode_context(tokenizer, context, context_encodings):
+    if context not in context_encodings:
+        encoded = tokenizer(
+            context, add_special_tokens=False, return_offsets_mapping=True
+        )
+        context_encodings[context] = (
+            encoded["input_ids"],
+            encoded["offset_mapping"],
+        )
+    return context_encodings[context]
 
-def evaluate_on_dataset(dataset, qa_pipeline):
+
+def _build_features(tokenizer, examples, context_encodings):
+    """
+    Splits every (context, question) example in windows over the context, like the pipeline
+    does for long contexts, and returns one feature per window. Examples whose context has no
+    tokens get no feature.
+    """
+    parts, sequence_type_ids, has_type_ids = _pair_template(tokenizer)
+    n_special = sum(len(tokens) for tokens in parts.values())
+    features = []
+    for example_index, (context, question) in enumerate(examples):
+        context_ids, offsets = _encode_context(
+            tokenizer, context, context_encodings
+        )
+        if not context_ids:
+            # nothing to extract from an empty context (e.g. a perturbation removed it all),
+            # the example keeps an empty answer
+            continue
+        question_ids = tokenizer(question, add_special_tokens=False)[
+            "input_ids"
+        ]
+        window = max(MAX_SEQ_LEN - len(question_ids) - n_special, 1)
+        step = max(window - DOC_STRIDE, 1)
+        start = 0
+        while True:
+            window_ids = context_ids[start : start + window]
+            input_ids = (
+                [token_id for token_id, _ in parts["prefix"]]
+                + question_ids
+                + [token_id for token_id, _ in parts["middle"]]
+            )
+            context_start = len(input_ids)
+            input_ids += window_ids + [
+                token_id for token_id, _ in parts["suffix"]
+            ]
+            type_ids = (
+                [type_id for _, type_id in parts["prefix"]]
+                + [sequence_type_ids.get(0, 0)] * len(question_ids)
+                + [type_id for _, type_id in parts["middle"]]
+                + [sequence_type_ids.get(1, 0)] * len(window_ids)
+                + [type_id for _, type_id in parts["suffix"]]
+            )
+            feature = {
+                "example_index": example_index,
+                "input_ids": input_ids,
+                # position of the window in the input and in the context
+                "context_start": context_start,
+                "window_start": start,
+                "window_length": len(window_ids),
+            }
+            if has_type_ids:
+                feature["token_type_ids"] = type_ids
+            features.append(feature)
+            if start + window >= len(context_ids):
+                break
+            start += step
+    return features
+
+
+def _best_span(start_logits, end_logits, feature):
+    # only spans inside the context window can be answers
+    mask = np.full(start_logits.shape, -10000.0)
+    first = feature["context_start"]
+    last = first + feature["window_length"]
+    mask[first:last] = 0.0
+    start_logits = start_logits + mask
+    end_logits = end_logits + mask
+    start_probs = np.exp(start_logits - start_logits.max())
+    start_probs /= start_probs.sum()
+    end_probs = np.exp(end_logits - end_logits.max())
+    end_probs /= end_probs.sum()
+    outer = np.outer(start_probs, end_probs)
+    candidates = np.tril(np.triu(outer), MAX_ANSWER_LEN - 1)
+    start, end = np.unravel_index(np.argmax(candidates), candidates.shape)
+    return candidates[start, end], start - first, end - first
+
+
+def _pad(tokenizer, features):
+    length = max(len(feature["input_ids"]) for feature in features)
+    inputs = {
+        "input_ids": torch.full(
+            (len(features), length), tokenizer.pad_token_id, dtype=torch.long
+        ),
+        "attention_mask": torch.zeros(
+            (len(features), length), dtype=torch.long
+        ),
+    }
+    if "token_type_ids" in features[0]:
+        inputs["token_type_ids"] = torch.zeros(
+            (len(features), length), dtype=torch.long
+        )
+    for i, feature in enumerate(features):
+        n = len(feature["input_ids"])
+        inputs["input_ids"][i, :n] = torch.tensor(feature["input_ids"])
+        inputs["attention_mask"][i, :n] = 1
+        if "token_type_ids" in inputs:
+            inputs["token_type_ids"][i, :n] = torch.tensor(
+                feature["token_type_ids"]
+            )
+    return inputs
+
+
+def predict_answers(
+    model, tokenizer, examples, batch_size=32, context_encodings=None
+):
+    """
+    Predicts the answer of every (context, question) example with an extractive QA model,
+    running the model on padded batches of examples.
+    """
+    if context_encodings is None:
+        context_encodings = {}
+    features = _build_features(tokenizer, examples, context_encodings)
+    # best (score, answer) of every example over its windows
+    best = [(-1.0, "") for _ in examples]
+    model.eval()
+    for start in range(0, len(features), batch_size):
+        batch = features[start : start + batch_size]
+        inputs = _pad(tokenizer, batch)
+        inputs = {key: value.to(model.device) for key, value in inputs.items()}
+        with torch.no_grad():
+            outputs = model(**inputs)
+        start_logits = outputs.start_logits.cpu().numpy()
+        end_logits = outputs.end_logits.cpu().numpy()
+        for i, feature in enumerate(batch):
+            length = len(feature["input_ids"])
+            score, answer_start, answer_end = _best_span(
+                start_logits[i, :length], end_logits[i, :length], feature
+            )
+            example_index = feature["example_index"]
+            if score > best[example_index][0]:
+                context, _ = examples[example_index]
+                _, offsets = context_encodings[context]
+                first_token = feature["window_start"] + answer_start
+                last_token = feature["window_start"] + answer_end
+                best[example_index] = (
+                    score,
+                    context[offsets[first_token][0] : offsets[last_token][1]],
+                )
+    return [answer for _, answer in best]
+
+
+def exact_match(predictions, examples):
     accuracy = 0
     total = 0
-    for example in dataset:
-        context, question, answers = example
-        prediction = qa_pipeline(
-            {"context": context, "question": question}, truncation=True
-        )["answer"]
+    for prediction, (_, _, answers) in zip(predictions, examples):
         if prediction in answers:
             accuracy += 1
         total += 1
+    score = 100 * accuracy / total if total else 0.0
     print(f"The number of examples = {total}")
-    print(f"The accuracy of exact matching = {100 * accuracy / total}")
-    return {
-        "accuracy": np.round(100 * accuracy / total, 1),
-        "no_of_examples": total,
-    }
+    print(f"The accuracy of exact matching = {score}")
+    return {"accuracy": np.round(score, 1), "no_of_examples": total}
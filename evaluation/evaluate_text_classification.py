@@ -3,9 +3,11 @@ import numpy as np
 import enum
 
 from datasets import load_dataset
-from transformers import pipeline
 
 from dataset import TextLineDataset, KeyValueDataset
+from evaluation.inference_planner import predict_perturbed_union
+from initialize import load_pipeline
+from result_cache import get_prediction_store, get_result_cache, perturbed_set
 import torch
 # make this to work for three task.
 
@@ -85,53 +87,116 @@ def _process_model_pred(model_name, pred):
 
 def evaluate(
     operation, evaluate_filter, model_name, 
-    dataset_name, split="test[:20%]", batch_size=8, is_cuda=True):
+    dataset_name, split="test[:20%]", batch_size=8, is_cuda=True,
+    prediction_store=None, perturbed_sets=None):
+    return evaluate_operations(
+        [operation], evaluate_filter, model_name, dataset_name, split,
+        batch_size, is_cuda, prediction_store, perturbed_sets)[0]
+
+def evaluate_operations(
+    operations, evaluate_filter, model_name, 
+    dataset_name, split="test[:20%]", batch_size=8, is_cuda=True,
+    prediction_store=None, perturbed_sets=None):
+    """
+    Evaluates the model on several operations and returns the performance for every operation.
+    The perturbed sets of all the transformations are predicted in a single pass over their
+    union, so that the inputs produced by several transformations are predicted once.
+    """
     if model_name is None: model_name = "aychang/roberta-base-imdb"
     if dataset_name is None: dataset_name = "imdb"
+    if prediction_store is None: prediction_store = get_prediction_store()
+    if perturbed_sets is None: perturbed_sets = get_result_cache()
     print(f"Loading <{dataset_name}> dataset to evaluate <{model_name}> model.")
-    text_classification_pipeline = pipeline(
-        "sentiment-analysis", model=model_name, tokenizer=model_name, 
-        device=0 if is_cuda else -1)
-    
-    percent = f"[{split.split('[')[-1]}" if "[" in split else ""
-    if dataset_name == "multi_nli": split = f"validation_matched{percent}"
-    elif dataset_name != "imdb": split = f"validation{percent}"
+    # the pipeline is shared by all the evaluations of the process
+    text_classification_pipeline = load_pipeline(
+        "sentiment-analysis", model_name, device=0 if is_cuda else -1)
     
-    performance = {
-        "model_name": model_name,
-        "split": split,
-        "dataset_name": dataset_name,
-    }
+    split = _split(dataset_name, split)
     dataset, label_func = _process_data(dataset_name, split)
 
+    def predict(new_examples):
+        return _get_model_pred(
+            text_classification_pipeline, new_examples, batch_size=batch_size)
+
+    # the predictions on the original examples are computed once per model and dataset
+    examples, labels = _examples_and_labels(dataset, label_func)
+    raw_preds = prediction_store.predict(
+        model_name, dataset_name, split, examples, predict)
+    preds = [_process_model_pred(model_name, raw_pred) for raw_pred in raw_preds]
+
     print(f"Here is the performance of the model {model_name} on the {split} split of the {dataset_name} dataset")
+    performances = [
+        {"model_name": model_name, "split": split, "dataset_name": dataset_name}
+        for _ in operations
+    ]
     if evaluate_filter:
-        filtered_dataset = dataset.apply_filter(operation)
-        print("Here is the performance of the model on the filtered set")
-        accuracy, total = evaluate_dataset(
-            text_classification_pipeline, filtered_dataset, 
-            model_name, label_func, batch_size=batch_size)
-        performance["accuracy"] = accuracy
-        performance["no_of_examples"] = total
-    else:
-        accuracy, total = evaluate_dataset(
-            text_classification_pipeline, dataset, 
-            model_name, label_func, batch_size=batch_size)
+        for operation, performance in zip(operations, performances):
+            keep = np.array(dataset.filter_mask(operation), dtype=bool)
+            print("Here is the performance of the model on the filtered set")
+            accuracy, total = _accuracy(
+                np.array(labels)[keep], np.array(preds)[keep])
+            performance["accuracy"] = accuracy
+            performance["no_of_examples"] = total
+        return performances
+
+    print("Here is the performance of the model on the original set")
+    accuracy, total = _accuracy(np.array(labels), np.array(preds))
+    pt_datasets = _perturbed_datasets(
+        perturbed_sets, dataset, dataset_name, split, operations)
+    pt_examples_and_labels = [
+        _examples_and_labels(pt_dataset, label_func) if pt_dataset is not None else ([], [])
+        for pt_dataset in pt_datasets
+    ]
+    # only the perturbed examples which differ from all the original ones are predicted
+    all_pt_raw_preds = predict_perturbed_union(
+        [
+            (pt_examples, pt_dataset.sources if pt_dataset is not None else None)
+            for (pt_examples, _), pt_dataset in zip(pt_examples_and_labels, pt_datasets)
+        ],
+        examples, raw_preds, predict)
+    for pt_dataset, (_, pt_labels), pt_raw_preds, performance in zip(
+            pt_datasets, pt_examples_and_labels, all_pt_raw_preds, performances):
         performance["accuracy"] = accuracy
         performance["no_of_examples"] = total
-        pt_dataset = dataset.apply_transformation(operation)
         if pt_dataset is None:
             print(f"No transformation applied.")
-            accuracy = 0
+            performance["pt_accuracy"] = 0
         else:
             print("Here is the performance of the model on the transformed set")
-            accuracy, _ = evaluate_dataset(
-                text_classification_pipeline, pt_dataset, 
-                model_name, label_func, batch_size=batch_size)
-        performance["pt_accuracy"] = accuracy
+            pt_preds = [_process_model_pred(model_name, raw_pred) for raw_pred in pt_raw_preds]
+            performance["pt_accuracy"], _ = _accuracy(np.array(pt_labels), np.array(pt_preds))
     # (3) Execute perturbation
     # (4) Execute the performance of the original set and the perturbed set
-    return performance
+    return performances
+
+def _split(dataset_name, split):
+    # only imdb is evaluated on its test split
+    percent = f"[{split.split('[')[-1]}" if "[" in split else ""
+    if dataset_name == "multi_nli": return f"validation_matched{percent}"
+    elif dataset_name != "imdb": return f"validation{percent}"
+    return split
+
+def _perturbed_datasets(perturbed_sets, dataset, dataset_name, split, operations):
+    # the perturbed sets are made once and shared by all the models evaluated on this dataset
+    return [
+        perturbed_set(
+            perturbed_sets, dataset_name, split, operation,
+            lambda: dataset.apply_transformation(operation))
+        for operation in operations
+    ]
+
+def make_perturbed_sets(
+    operations, dataset_name=None, split="test[:20%]", perturbed_sets=None):
+    """
+    Makes the perturbed sets of the transformations on the dataset without loading any model,
+    so that the evaluations of all the models on the dataset find them in perturbed_sets.
+    """
+    if dataset_name is None: dataset_name = "imdb"
+    if perturbed_sets is None: perturbed_sets = get_result_cache()
+    split = _split(dataset_name, split)
+    dataset, _ = _process_data(dataset_name, split)
+    return _perturbed_datasets(
+        perturbed_sets, dataset, dataset_name, split, operations)
 
 def _get_model_pred(model, examples, batch_size):
     all_preds = []
@@ -140,17 +205,13 @@ def _get_model_pred(model, examples, batch_size):
             all_preds += model(examples[e:e+batch_size], truncation=True)
     return [a["label"] for a in all_preds]
 
-def evaluate_dataset(
-    text_classification_pipeline, dataset, model_name, label_func, batch_size=32):
-    accuracy = 0
-    total = 0
+def _examples_and_labels(dataset, label_func):
     examples = [_get_instance_by_keys(list(raw_text)[:-1]) for raw_text in dataset]
-    #print(examples)
     labels = [label_func(list(raw_text)[-1]) for raw_text in dataset]
-    raw_preds = _get_model_pred(text_classification_pipeline, examples, batch_size=batch_size)
-    preds = [_process_model_pred(model_name, raw_pred) for raw_pred in raw_preds]
-    accuracy = np.round(100 * np.mean(np.array(labels) == np.array(preds)))
-    total = len(labels)
+    return examples, labels
 
+def _accuracy(labels, preds):
+    total = len(labels)
+    accuracy = np.round(100 * np.mean(labels == preds)) if total else 0
     print(f"The accuracy on this subset which has {total} examples = {accuracy}")
     return accuracy, total
@@ -1,9 +1,14 @@
+import time
+
 import numpy as np
+import torch
 from datasets import load_dataset
 from sacrebleu import corpus_bleu
-from transformers import pipeline
 
 from dataset import KeyValueDataset
+from evaluation.inference_planner import predict_perturbed_union
+from initialize import load_pipeline
+from result_cache import get_prediction_store, get_result_cache, perturbed_set
 from tasks.TaskTypes import TaskType
 
 
@@ -11,9 +16,90 @@ def sacrebleu_score(hypotheses, references):
     return corpus_bleu(hypotheses, [references]).score
 
 
+def _load(dataset_name, split):
+    hf_dataset = (
+        load_dataset(dataset_name, "3.0.0", split=split)
+        if dataset_name == "xsum"
+        else load_dataset(dataset_name, split=split)
+    )
+    return KeyValueDataset.from_huggingface(
+        hf_dataset, TaskType.TEXT_TO_TEXT_GENERATION, ["document", "summary"]
+    )
+
+
+def _perturbed_datasets(
+    perturbed_sets, dataset, dataset_name, split, operations
+):
+    # the perturbed sets are made once and shared by all the models evaluated on this dataset
+    return [
+        perturbed_set(
+            perturbed_sets,
+            dataset_name,
+            split,
+            operation,
+            lambda: dataset.apply_transformation(
+                operation, subfields=["document"]
+            ),
+            ["document"],
+        )
+        for operation in operations
+    ]
+
+
+def make_perturbed_sets(
+    operations, dataset_name=None, split="test[:20%]", perturbed_sets=None
+):
+    """
+    Makes the perturbed sets of the transformations on the dataset without loading any model,
+    so that the evaluations of all the models on the dataset find them in perturbed_sets.
+    """
+    if dataset_name is None:
+        dataset_name = "xsum"
+    if perturbed_sets is None:
+        perturbed_sets = get_result_cache()
+    return _perturbed_datasets(
+        perturbed_sets,
+        _load(dataset_name, split),
+        dataset_name,
+        split,
+        operations,
+    )
+
+
 def evaluate(
-    operation, evaluate_filter, model_name, dataset_name, split="test[:20%]"
+    operation,
+    evaluate_filter,
+    model_name,
+    dataset_name,
+    split="test[:20%]",
+    prediction_store=None,
+    perturbed_sets=None,
+):
+    return evaluate_operations(
+        [operation],
+        evaluate_filter,
+        model_name,
+        dataset_name,
+        split,
+        prediction_store,
+        perturbed_sets,
+    )[0]
+
+
+def evaluate_operations(
+    operations,
+    evaluate_filter,
+    model_name,
+    dataset_name,
+    split="test[:20%]",
+    prediction_store=None,
+    perturbed_sets=None,
 ):
+    """
+    Evaluates the model on several operations and returns the performance for every operation.
+    The perturbed sets of all the transformations are summarized in a single pass over their
+    union, so that the documents produced by several transformations are summarized once.
+    """
     # load model
     if model_name is None:
         model_name = "sshleifer/distilbart-xsum-12-6"
@@ -24,85 +110,205 @@ def evaluate(
     print(
         f"Loading <{dataset_name}> dataset to evaluate <{model_name}> model."
     )
-    hf_dataset = (
-        load_dataset(dataset_name, "3.0.0", split=split)
-        if dataset_name == "xsum"
-        else load_dataset(dataset_name, split=split)
-    )
-
-    dataset = KeyValueDataset.from_huggingface(
-        hf_dataset, TaskType.TEXT_TO_TEXT_GENERATION, ["document", "summary"]
-    )
-    summarization_pipeline = pipeline(
-        "summarization", model=model_name, tokenizer=model_name
-    )
+    dataset = _load(dataset_name, split)
+    # the pipeline is shared by all the evaluations of the process
+    summarization_pipeline = load_pipeline("summarization", model_name)
     print(
         f"Here is the performance of the model {model_name} on the {split} split of the {dataset_name} dataset"
     )
-    if evaluate_filter:
-        performance = filter_performance(
-            dataset, summarization_pipeline, filter=operation
+    # the summaries of the original documents are generated once per model and dataset
+    if prediction_store is None:
+        prediction_store = get_prediction_store()
+    articles, references, max_lengths = _summarization_inputs(dataset)
+    # throughput of all the summarizations of this evaluation
+    stats = {}
+
+    def summarize(inputs):
+        return summarize_in_buckets(
+            summarization_pipeline.model,
+            summarization_pipeline.tokenizer,
+            [article for article, _ in inputs],
+            [max_length for _, max_length in inputs],
+            stats=stats,
         )
+
+    hypotheses = prediction_store.predict(
+        model_name,
+        dataset_name,
+        split,
+        list(zip(articles, max_lengths)),
+        summarize,
+    )
+    if evaluate_filter:
+        performances = [
+            filter_performance(
+                dataset, hypotheses, references, filter=operation
+            )
+            for operation in operations
+        ]
     else:
-        performance = transformation_performance(
-            dataset, summarization_pipeline, transformation=operation
+        if perturbed_sets is None:
+            perturbed_sets = get_result_cache()
+        pt_datasets = _perturbed_datasets(
+            perturbed_sets, dataset, dataset_name, split, operations
+        )
+        performances = transformations_performance(
+            dataset,
+            summarize,
+            hypotheses=hypotheses,
+            references=references,
+            pt_datasets=pt_datasets,
         )
 
-    performance["model_name"] = model_name
-    performance["split"] = split
-    performance["dataset_name"] = dataset_name
-    return performance
+    performance_stats = throughput(stats)
+    for performance in performances:
+        performance.update(performance_stats)
+        performance["model_name"] = model_name
+        performance["split"] = split
+        performance["dataset_name"] = dataset_name
+    return performances
 
 
-def filter_performance(dataset, summarization_pipeline, filter):
+def filter_performance(dataset, hypotheses, references, filter):
     print("Here is the performance of the model on the filtered set")
-    filtered_dataset = dataset.apply_filter(filter, subfields=["document"])
-    return performance_on_dataset(filtered_dataset, summarization_pipeline)
+    keep = dataset.filter_mask(filter, subfields=["document"])
+    filtered_hypotheses = [h for h, k in zip(hypotheses, keep) if k]
+    filtered_references = [r for r, k in zip(references, keep) if k]
+    print(f"Length of Evaluation dataset is {len(filtered_references)}")
+    bleu = sacrebleu_score(filtered_hypotheses, filtered_references)
+    print(f"Predicted BLEU score = {bleu}")
+    return {"bleu": np.round(bleu, 1)}
 
 
-"""
-Evaluates performance on the original set
-and on the perturbed set.
-"""
+def transformations_performance(
+    dataset, summarize, hypotheses, references, pt_datasets
+):
+    bleu = sacrebleu_score(hypotheses, references)  # 15.989 BLEU
+    print(f"Predicted BLEU score = {bleu}")
+    # only the perturbed documents which differ from all the original ones are summarized,
+    # in a single pass over the perturbed sets
+    articles, _, max_lengths = _summarization_inputs(dataset)
+    pt_inputs = [
+        (
+            _summarization_inputs(pt_dataset)
+            if pt_dataset is not None
+            else ([], [], [])
+        )
+        for pt_dataset in pt_datasets
+    ]
+    all_pt_hypotheses = predict_perturbed_union(
+        [
+            (
+                list(zip(pt_articles, pt_max_lengths)),
+                pt_dataset.sources if pt_dataset is not None else None,
+            )
+            for (pt_articles, _, pt_max_lengths), pt_dataset in zip(
+                pt_inputs, pt_datasets
+            )
+        ],
+        list(zip(articles, max_lengths)),
+        hypotheses,
+        summarize,
+    )
+    performances = []
+    for (_, pt_references, _), pt_hypotheses in zip(
+        pt_inputs, all_pt_hypotheses
+    ):
+        print("Here is the performance of the model on the transformed set")
+        pt_bleu = sacrebleu_score(pt_hypotheses, pt_references)  # 11.830 BLEU
+        print(f"Predicted BLEU score = {pt_bleu}")
+        performances.append(
+            {"bleu": np.round(bleu, 1), "pt_bleu": np.round(pt_bleu, 1)}
+        )
+    return performances
 
 
-def transformation_performance(
-    dataset, summarization_pipeline, transformation
+def summarize_in_buckets(
+    model, tokenizer, articles, max_lengths, batch_size=16, stats=None
 ):
-    performance = performance_on_dataset(
-        dataset, summarization_pipeline
-    )  # 15.989 BLEU
-    pt_dataset = dataset.apply_transformation(
-        transformation, subfields=["document"]
+    """
+    Summarizes the articles on padded batches. The articles are sorted by length so that each
+    batch (bucket) holds articles of similar lengths and wastes little padding, and a batch is
+    generated with the largest max_length of its articles.
+    Returns the summaries in the order of the articles. The documents, seconds, real and
+    padded input tokens of the run are added to stats (see throughput).
+    """
+    start_time = time.perf_counter()
+    # same input as the summarization pipeline: config prefix and truncation to the model size
+    prefix = getattr(model.config, "prefix", None) or ""
+    input_ids = tokenizer(
+        [prefix + article for article in articles], truncation=True
+    )["input_ids"]
+    order = sorted(
+        range(len(articles)), key=lambda i: len(input_ids[i]), reverse=True
     )
-    print("Here is the performance of the model on the transformed set")
-    pt_performance = performance_on_dataset(
-        pt_dataset, summarization_pipeline
-    )  # 11.830 BLEU
-    return {"bleu": performance["bleu"], "pt_bleu": pt_performance["bleu"]}
+    summaries = [None] * len(articles)
+    real_tokens = 0
+    padded_tokens = 0
+    model.eval()
+    for start in range(0, len(order), batch_size):
+        bucket = order[start : start + batch_size]
+        length = max(len(input_ids[i]) for i in bucket)
+        batch_ids = torch.full(
+            (len(bucket), length), tokenizer.pad_token_id, dtype=torch.long
+        )
+        attention_mask = torch.zeros((len(bucket), length), dtype=torch.long)
+        for row, i in enumerate(bucket):
+            batch_ids[row, : len(input_ids[i])] = torch.tensor(input_ids[i])
+            attention_mask[row, : len(input_ids[i])] = 1
+        real_tokens += int(attention_mask.sum())
+        padded_tokens += attention_mask.numel()
+        with torch.no_grad():
+            outputs = model.generate(
+                input_ids=batch_ids.to(model.device),
+                attention_mask=attention_mask.to(model.device),
+                max_length=max(max_lengths[i] for i in bucket),
+            )
+        for i, summary in zip(
+            bucket, tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        ):
+            summaries[i] = summary
+    if stats is not None:
+        stats["documents"] = stats.get("documents", 0) + len(articles)
+        stats["seconds"] = (
+            stats.get("seconds", 0.0) + time.perf_counter() - start_time
+        )
+        stats["real_tokens"] = stats.get("real_tokens", 0) + real_tokens
+        stats["padded_tokens"] = stats.get("padded_tokens", 0) + padded_tokens
+    return summaries
 
 
-def performance_on_dataset(dataset, summarization_pipeline):
-    references = []
-    raw_hypotheses = []
-    print(f"Length of Evaluation dataset is {len(dataset)}")
+def throughput(stats) -> dict:
+    """Documents summarized per second and share of padding of the runs added to stats."""
+    if not stats.get("documents"):
+        return {}
+    documents_per_second = (
+        stats["documents"] / stats["seconds"] if stats["seconds"] else 0.0
+    )
+    padding_waste = (
+        1 - stats["real_tokens"] / stats["padded_tokens"]
+        if stats["padded_tokens"]
+        else 0.0
+    )
+    print(
+        f"Summarized {documents_per_second:.2f} documents/sec "
+        f"({100 * padding_waste:.1f}% of the input tokens were padding)"
+    )
+    return {
+        "documents_per_second": np.round(documents_per_second, 2),
+        "padding_waste": np.round(padding_waste, 3),
+    }
+
 
+def _summarization_inputs(dataset):
+    articles = []
+    references = []
+    max_lengths = []
     for example in dataset:
         article, gold_summary = example
-        max_len = (
+        articles.append(article)
+        references.append(gold_summary)
+        max_lengths.append(
             len(gold_summary.split(" ")) + 10
         )  # approximate max length to control summary generation upto length of gold summary
-        predicted_summary = summarization_pipeline(
-            article, truncation=True, max_length=max_len
-        )[0]["summary_text"]
-
-        references.append(gold_summary)
-        raw_hypotheses.append(predicted_summary)
-    predicted_summary_score = sacrebleu_score(
-        raw_hypotheses, references
-    )  # 15.989 BLEU
-
-    print(f"Predicted BLEU score = {predicted_summary_score}")
-    return {
-        "bleu": np.round(predicted_summary_score, 1),
-    }
+    return articles, references, max_lengths
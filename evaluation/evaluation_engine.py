@@ -7,6 +7,11 @@ from evaluation import (
 from interfaces.QuestionAnswerOperation import QuestionAnswerOperation
 from interfaces.SentenceOperation import SentenceOperation
 from interfaces.TaggingOperation import TaggingOperation
+from result_cache import (
+    cache_operation,
+    get_prediction_store,
+    get_result_cache,
+)
 from tasks.TaskTypes import TaskType
 
 """
@@ -24,6 +29,7 @@ def evaluate(
     dataset=None,
     percentage_of_examples=None,
     evaluate_filter=False,
+    cache_dir=None,
 ):
     # The evaluation engine would effectively do the following
     # (1) Loading a standard model and a test set (the model's original test set would be the best choice)
@@ -39,10 +45,36 @@ def evaluate(
         model_name=model,
         dataset=dataset,
         percentage_of_examples=percentage_of_examples,
+        cache_dir=cache_dir,
     )
     return
 
 
+def evaluate_operations(
+    implementations,
+    task_type,
+    language="en",
+    model=None,
+    dataset=None,
+    percentage_of_examples=None,
+    evaluate_filter=False,
+    cache_dir=None,
+):
+    # Evaluates one model on several operations of the same task at once: the perturbed sets of
+    # all the operations are predicted in a single pass over their union.
+    task_type = get_task_type(implementations[0], task_type)
+    return execute_model_on_operations(
+        implementations,
+        evaluate_filter=evaluate_filter,
+        task_type=task_type,
+        locale=language,
+        model_name=model,
+        dataset=dataset,
+        percentage_of_examples=percentage_of_examples,
+        cache_dir=cache_dir,
+    )
+
+
 def evaluate_mt(
     implementation,
     task_type,
@@ -67,6 +99,57 @@ def get_task_type(implementation, task_type):
     return task_type
 
 
+def _instantiate(implementation, cache_dir=None):
+    # implementation: an operation class, or an instance to reuse it across models
+    if not isinstance(implementation, type):
+        return implementation
+    impl = implementation()
+    if cache_dir is not None:
+        # reuse the outputs computed for the same examples in previous runs
+        impl = cache_operation(impl, get_result_cache(cache_dir))
+    return impl
+
+
+def make_perturbed_sets(
+    implementation,
+    task_type,
+    dataset=None,
+    percentage_of_examples=20,
+    cache_dir=None,
+):
+    """
+    Makes the perturbed set of the dataset used by execute_model for the transformation,
+    without loading any model, and keeps it in the result cache of cache_dir so that the
+    evaluations of all the models reuse it. Returns False when no evaluation exists for the
+    transformation on the task.
+    """
+    impl = _instantiate(implementation, cache_dir)
+    task = TaskType[task_type]
+    if task == TaskType.TEXT_CLASSIFICATION and isinstance(
+        impl, SentenceOperation
+    ):
+        evaluator, split = evaluate_text_classification, "test"
+    elif task == TaskType.QUESTION_ANSWERING and isinstance(
+        impl, QuestionAnswerOperation
+    ):
+        evaluator, split = evaluate_question_answering, "validation"
+    elif task == TaskType.TEXT_TO_TEXT_GENERATION and isinstance(
+        impl, SentenceOperation
+    ):
+        evaluator, split = evaluate_text_generation, "test"
+    elif task == TaskType.TEXT_TAGGING and isinstance(impl, TaggingOperation):
+        evaluator, split = evaluate_ner_tagging, "test"
+    else:
+        return False
+    evaluator.make_perturbed_sets(
+        [impl],
+        dataset,
+        split=f"{split}[:{percentage_of_examples}%]",
+        perturbed_sets=get_result_cache(cache_dir),
+    )
+    return True
+
+
 def execute_model(
     implementation,
     task_type,
@@ -75,9 +158,14 @@ def execute_model(
     dataset=None,
     percentage_of_examples=20,
     evaluate_filter=False,
+    cache_dir=None,
 ):
-    interface = implementation.__bases__[0]  # SentenceTransformation
-    impl = implementation()
+    impl = _instantiate(implementation, cache_dir)
+    interface = type(impl).__bases__[0]  # SentenceTransformation
+    # predictions of the models on the original examples, shared by all the operations
+    prediction_store = get_prediction_store(cache_dir)
+    # perturbed sets, shared by all the models evaluated on the same dataset
+    perturbed_sets = get_result_cache(cache_dir)
     if locale is "en":
         if (
             isinstance(impl, SentenceOperation)
@@ -89,6 +177,8 @@ def execute_model(
                 model_name,
                 dataset,
                 split=f"test[:{percentage_of_examples}%]",
+                prediction_store=prediction_store,
+                perturbed_sets=perturbed_sets,
             )
 
         elif (
@@ -101,6 +191,8 @@ def execute_model(
                 model_name,
                 dataset,
                 split=f"validation[:{percentage_of_examples}%]",
+                prediction_store=prediction_store,
+                perturbed_sets=perturbed_sets,
             )
 
         elif (
@@ -113,6 +205,8 @@ def execute_model(
                 model_name,
                 dataset,
                 split=f"test[:{percentage_of_examples}%]",
+                prediction_store=prediction_store,
+                perturbed_sets=perturbed_sets,
             )
 
         elif (
@@ -125,6 +219,8 @@ def execute_model(
                 model_name,
                 dataset,
                 split=f"test[:{percentage_of_examples}%]",
+                prediction_store=prediction_store,
+                perturbed_sets=perturbed_sets,
             )
         # Other if else cases should be added here.
         else:
@@ -143,3 +239,99 @@ def execute_model(
             f"the right place to do it would to add a new class in the evaluation folder "
             f"and call it from execute_model. That's it!"
         )
+
+
+def operation_label(impl) -> str:
+    """
+    Name of the class of an operation followed by its constructor arguments, if it has any,
+    e.g. ButterFingersPerturbation(max_outputs=3), so that the performances of several
+    instances of a class don't overwrite each other.
+    """
+    args, kwargs = getattr(impl, "_init_args", ((), {}))
+    arguments = [repr(arg) for arg in args] + [
+        f"{key}={value!r}" for key, value in sorted(kwargs.items())
+    ]
+    name = type(impl).__name__
+    return f"{name}({', '.join(arguments)})" if arguments else name
+
+
+def execute_model_on_operations(
+    implementations,
+    task_type,
+    locale="en",
+    model_name=None,
+    dataset=None,
+    percentage_of_examples=20,
+    evaluate_filter=False,
+    cache_dir=None,
+):
+    """
+    Like execute_model, but for a list of operations (classes or instances) of the same task,
+    evaluated with a single model. The perturbed inputs of all the operations are deduplicated
+    and predicted in one batched pass, then the metrics are computed for every operation.
+    Returns {operation label (see operation_label): performance}.
+    """
+    impls = [
+        _instantiate(implementation, cache_dir)
+        for implementation in implementations
+    ]
+    names = [operation_label(impl) for impl in impls]
+    kwargs = {
+        "prediction_store": get_prediction_store(cache_dir),
+        "perturbed_sets": get_result_cache(cache_dir),
+    }
+    task = TaskType[task_type]
+    if locale != "en":
+        print(f"No default evaluation model exists in the locale {locale}.")
+        return {}
+    if task == TaskType.TEXT_CLASSIFICATION and all(
+        isinstance(impl, SentenceOperation) for impl in impls
+    ):
+        performances = evaluate_text_classification.evaluate_operations(
+            impls,
+            evaluate_filter,
+            model_name,
+            dataset,
+            split=f"test[:{percentage_of_examples}%]",
+            **kwargs,
+        )
+    elif task == TaskType.QUESTION_ANSWERING and all(
+        isinstance(impl, QuestionAnswerOperation) for impl in impls
+    ):
+        performances = evaluate_question_answering.evaluate_operations(
+            impls,
+            evaluate_filter,
+            model_name,
+            dataset,
+            split=f"validation[:{percentage_of_examples}%]",
+            **kwargs,
+        )
+    elif task == TaskType.TEXT_TO_TEXT_GENERATION and all(
+        isinstance(impl, SentenceOperation) for impl in impls
+    ):
+        performances = evaluate_text_generation.evaluate_operations(
+            impls,
+            evaluate_filter,
+            model_name,
+            dataset,
+            split=f"test[:{percentage_of_examples}%]",
+            **kwargs,
+        )
+    elif task == TaskType.TEXT_TAGGING and all(
+        isinstance(impl, TaggingOperation) for impl in impls
+    ):
+        performances = evaluate_ner_tagging.evaluate_operations(
+            impls,
+            evaluate_filter,
+            model_name,
+            dataset,
+            split=f"test[:{percentage_of_examples}%]",
+            **kwargs,
+        )
+    else:
+        print(
+            f"No default evaluation model exists for all of {', '.join(names)} "
+            f"on the task {task_type} in the locale {locale}."
+        )
+        return {}
+    return dict(zip(names, performances))
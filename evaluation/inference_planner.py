@@ -0,0 +1,108 @@
+from typing import Callable, List
+
+"""
+Plans the inference on a perturbed set so that the model only sees new inputs.
+A perturbed example identical to the original example it comes from (see the `sources` of the
+datasets returned by apply_transformation), or to any other original example, reuses the
+baseline prediction, and identical perturbed examples are predicted once.
+"""
+
+
+def _key(model_input) -> str:
+    # inputs can be unhashable, e.g. lists of tokens
+    return repr(model_input)
+
+
+def plan_inference(
+    inputs: List, sources: List[int], baseline_inputs: List
+) -> dict:
+    """
+    Returns the plan for inputs:
+        "baseline": {position in inputs: index of the original example with the same input}
+        "to_predict": the distinct new inputs, in order of first appearance
+        "positions": {position in inputs: index in to_predict}
+    sources[i] is the index of the original example inputs[i] was generated from (None when
+    the lineage isn't known).
+    """
+    baseline_index = {}
+    for i, model_input in enumerate(baseline_inputs):
+        baseline_index.setdefault(_key(model_input), i)
+    plan = {"baseline": {}, "to_predict": [], "positions": {}}
+    new_index = {}
+    for position, model_input in enumerate(inputs):
+        source = sources[position] if sources is not None else None
+        # most perturbed examples left unchanged are equal to their own source
+        if source is not None and baseline_inputs[source] == model_input:
+            plan["baseline"][position] = source
+            continue
+        key = _key(model_input)
+        if key in baseline_index:
+            plan["baseline"][position] = baseline_index[key]
+        else:
+            if key not in new_index:
+                new_index[key] = len(plan["to_predict"])
+                plan["to_predict"].append(model_input)
+            plan["positions"][position] = new_index[key]
+    return plan
+
+
+def predict_perturbed(
+    inputs: List,
+    sources: List[int],
+    baseline_inputs: List,
+    baseline_predictions: List,
+    predict_func: Callable,
+) -> List:
+    """
+    Returns the predictions for the perturbed inputs, calling predict_func(new_inputs) only on
+    the distinct inputs which aren't among the original ones.
+    """
+    plan = plan_inference(inputs, sources, baseline_inputs)
+    new_predictions = (
+        predict_func(plan["to_predict"]) if plan["to_predict"] else []
+    )
+    predictions = []
+    for position in range(len(inputs)):
+        if position in plan["baseline"]:
+            predictions.append(
+                baseline_predictions[plan["baseline"][position]]
+            )
+        else:
+            predictions.append(new_predictions[plan["positions"][position]])
+    print(
+        f"Predicted {len(plan['to_predict'])} new inputs out of {len(inputs)} perturbed examples "
+        f"({len(plan['baseline'])} reuse the predictions on the original examples)"
+    )
+    return predictions
+
+
+def predict_perturbed_union(
+    perturbed_sets: List,
+    baseline_inputs: List,
+    baseline_predictions: List,
+    predict_func: Callable,
+) -> List[List]:
+    """
+    Predicts the perturbed sets of several operations in a single pass over their union, so
+    that an input produced by several operations is only predicted once.
+    perturbed_sets: one (inputs, sources) pair per operation
+    Returns the predictions for every perturbed set.
+    """
+    inputs = []
+    sources = []
+    for set_inputs, set_sources in perturbed_sets:
+        inputs.extend(set_inputs)
+        sources.extend(
+            set_sources
+            if set_sources is not None
+            else [None] * len(set_inputs)
+        )
+    predictions = predict_perturbed(
+        inputs, sources, baseline_inputs, baseline_predictions, predict_func
+    )
+    results = []
+    start = 0
+    for set_inputs, _ in perturbed_sets:
+        results.append(predictions[start : start + len(set_inputs)])
+        start += len(set_inputs)
+    return results
@@ -0,0 +1,358 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+from evaluation.evaluation_engine import execute_model, make_perturbed_sets
+from initialize import get_model_registry
+
+"""
+Scheduler of the leaderboard.
+Every (transformation, model) pair of the leaderboard is a cell. The perturbed set of every
+(dataset, split, transformation) of the cells is made first, once, in a persistent result
+cache. The cells are then grouped by model, each group running in one worker so that the
+worker keeps working with the same model and reuses the perturbed sets, and the groups and
+cells with the largest measured cost run first. The result of every cell is saved in a
+SQLite store as soon as it is known, keyed by model, dataset, split and transformation along
+with a hash of the code which produced it, so a leaderboard which crashed or was stopped only
+runs the missing, failed and outdated cells when it is started again.
+"""
+
+# transformation: OperationInfo of the operation, see TestRunner
+# split: the percentage of examples evaluated, e.g. "20"
+Cell = namedtuple(
+    "Cell",
+    ["transformation", "model_name", "dataset_name", "task_type", "split"],
+)
+
+EVALUATION_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(EVALUATION_DIR)
+
+
+def _hash_files(sha, directory, recursive=True):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".py"):
+                with open(os.path.join(root, name), "rb") as f:
+                    sha.update(f.read())
+        if not recursive:
+            break
+
+
+def code_hash(info) -> str:
+    """
+    Hash of the sources of the package of the operation, of the evaluation code and of the
+    code shared by all the operations: the modules at the root of the repository (dataset.py,
+    initialize.py, result_cache.py, char_noise.py, lexicon_matcher.py...) and interfaces/.
+    """
+    sha = hashlib.sha1()
+    # from the files, so that the operation doesn't have to be imported
+    _hash_files(sha, os.path.join(ROOT_DIR, *info.package.split(".")))
+    _hash_files(sha, EVALUATION_DIR)
+    _hash_files(sha, os.path.join(ROOT_DIR, "interfaces"))
+    _hash_files(sha, ROOT_DIR, recursive=False)
+    return sha.hexdigest()
+
+
+class LeaderboardStore:
+    """SQLite store of the results of the leaderboard cells."""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_conn"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, timeout=60, check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cells ("
+                "model TEXT, dataset TEXT, split TEXT, transformation TEXT, "
+                "code_hash TEXT, status TEXT, result TEXT, error TEXT, "
+                "seconds REAL, finished_at REAL, "
+                "PRIMARY KEY (model, dataset, split, transformation))"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def save(self, cell, code_hash, status, result, error, seconds):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    cell.model_name,
+                    cell.dataset_name,
+                    cell.split,
+                    cell.transformation.name,
+                    code_hash,
+                    status,
+                    json.dumps(result, default=float),
+                    error,
+                    seconds,
+                    time.time(),
+                ),
+            )
+            conn.commit()
+
+    def rows(self) -> dict:
+        """{(model, dataset, split, transformation): row as a dict}"""
+        with self._lock:
+            cursor = self._connection().execute("SELECT * FROM cells")
+            names = [column[0] for column in cursor.description]
+            rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        for row in rows:
+            row["result"] = json.loads(row["result"])
+        return {
+            (
+                row["model"],
+                row["dataset"],
+                row["split"],
+                row["transformation"],
+            ): row
+            for row in rows
+        }
+
+    def costs(self) -> dict:
+        """
+        Average seconds taken by the successful cells of every transformation (the failed
+        ones often stop right away).
+        """
+        with self._lock:
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT transformation, AVG(seconds) FROM cells "
+                    "WHERE status = 'done' GROUP BY transformation"
+                )
+                .fetchall()
+            )
+        return dict(rows)
+
+
+def _key(cell):
+    return (
+        cell.model_name,
+        cell.dataset_name,
+        cell.split,
+        cell.transformation.name,
+    )
+
+
+def pending_cells(cells, store: LeaderboardStore, hashes: dict):
+    """The cells without a successful result computed with the current code."""
+    rows = store.rows()
+    pending = []
+    for cell in cells:
+        row = rows.get(_key(cell))
+        if (
+            row is None
+            or row["status"] != "done"
+            or row["code_hash"] != hashes[cell.transformation.name]
+        ):
+            pending.append(cell)
+    return pending
+
+
+def plan(cells, costs: dict):
+    """
+    Groups the cells by model and orders the groups and the cells of each group from the most
+    to the least expensive. Transformations which never ran are assumed to be as expensive as
+    the most expensive one if they are heavy, and as the average one otherwise.
+    """
+    known = list(costs.values())
+    average = sum(known) / len(known) if known else 1.0
+    maximum = max(known) if known else 1.0
+
+    def cost(cell):
+        info = cell.transformation
+        if info.name in costs:
+            return costs[info.name]
+        return maximum if info.heavy else average
+
+    groups = {}
+    for cell in cells:
+        groups.setdefault(cell.model_name, []).append(cell)
+    for group in groups.values():
+        group.sort(key=cost, reverse=True)
+    return sorted(
+        groups.values(),
+        key=lambda group: sum(cost(cell) for cell in group),
+        reverse=True,
+    )
+
+
+def run_cell(cell, store, code_hash, cache_dir=None):
+    """Evaluates one cell and saves its result, or its error, in the store."""
+    start = time.perf_counter()
+    try:
+        result = execute_model(
+            implementation=cell.transformation.load(),
+            task_type=cell.task_type,
+            model_name=cell.model_name,
+            dataset=cell.dataset_name,
+            percentage_of_examples=int(cell.split),
+            cache_dir=cache_dir,
+        )
+        if result is None:
+            raise ValueError("No evaluation exists for this operation.")
+        store.save(
+            cell,
+            code_hash,
+            "done",
+            result,
+            None,
+            time.perf_counter() - start,
+        )
+        return True
+    except Exception:
+        error = traceback.format_exc()
+        print(f"\t Error on {cell.transformation.name}: {error}")
+        store.save(
+            cell,
+            code_hash,
+            "failed",
+            None,
+            error,
+            time.perf_counter() - start,
+        )
+        return False
+
+
+def _make_perturbed_set(args):
+    cell, cache_dir, memory_budget = args
+    if memory_budget is not None:
+        get_model_registry().set_memory_budget(memory_budget)
+    try:
+        make_perturbed_sets(
+            cell.transformation.load(),
+            cell.task_type,
+            dataset=cell.dataset_name,
+            percentage_of_examples=int(cell.split),
+            cache_dir=cache_dir,
+        )
+        return True
+    except Exception:
+        # the cells of the set fail with the same error, and save it
+        print(
+            f"\t Error while perturbing {cell.dataset_name} with "
+            f"{cell.transformation.name}: {traceback.format_exc()}"
+        )
+        return False
+
+
+def make_all_perturbed_sets(
+    cells, cache_dir=None, num_workers: int = 0, memory_budget: int = None
+):
+    """
+    Makes the perturbed set of every (dataset, split, transformation) of the cells once, the
+    heavy transformations first. With num_workers > 1, every set is made by its own job in a
+    pool of processes, and cache_dir is required for the sets to outlive the jobs.
+    """
+    jobs = {}
+    for cell in cells:
+        key = (
+            cell.dataset_name,
+            cell.split,
+            cell.task_type,
+            cell.transformation.name,
+        )
+        jobs.setdefault(key, (cell, cache_dir, memory_budget))
+    jobs = sorted(
+        jobs.values(),
+        key=lambda job: job[0].transformation.heavy,
+        reverse=True,
+    )
+    print(f"Making the {len(jobs)} perturbed sets of the cells.")
+    if num_workers > 1:
+        if cache_dir is None:
+            raise ValueError("The perturbed sets of workers need a cache_dir.")
+        with multiprocessing.Pool(num_workers, maxtasksperchild=1) as pool:
+            return list(pool.imap_unordered(_make_perturbed_set, jobs))
+    return [_make_perturbed_set(job) for job in jobs]
+
+
+def _run_group(args):
+    group, store, hashes, cache_dir, memory_budget = args
+    if memory_budget is not None:
+        get_model_registry().set_memory_budget(memory_budget)
+    return [
+        run_cell(cell, store, hashes[cell.transformation.name], cache_dir)
+        for cell in group
+    ]
+
+
+def run_cells(
+    cells,
+    store: LeaderboardStore,
+    cache_dir=None,
+    num_workers: int = 0,
+    memory_budget: int = None,
+):
+    """
+    Runs the cells which don't have an up-to-date result in the store. Their perturbed sets
+    are made first, once (see make_all_perturbed_sets), then with num_workers > 1 the groups
+    of cells of the different models run in parallel in a pool of processes. The processes
+    share the perturbed sets through the result cache of cache_dir, a temporary directory
+    when it is None.
+    memory_budget (bytes) caps the models kept loaded by every process, see ModelRegistry.
+    Returns the number of (successful, failed) cells which ran.
+    """
+    hashes = {}
+    for cell in cells:
+        info = cell.transformation
+        if info.name not in hashes:
+            hashes[info.name] = code_hash(info)
+    pending = pending_cells(cells, store, hashes)
+    print(
+        f"{len(cells) - len(pending)} cells are already done, running {len(pending)} cells."
+    )
+    if not pending:
+        return 0, 0
+    temporary = None
+    if num_workers > 1 and cache_dir is None:
+        # the in-memory cache of a worker would die with it
+        temporary = tempfile.TemporaryDirectory(prefix="leaderboard-")
+        cache_dir = temporary.name
+    try:
+        make_all_perturbed_sets(pending, cache_dir, num_workers, memory_budget)
+        groups = plan(pending, store.costs())
+        jobs = [
+            (group, store, hashes, cache_dir, memory_budget)
+            for group in groups
+        ]
+        if num_workers > 1:
+            with multiprocessing.Pool(num_workers, maxtasksperchild=1) as pool:
+                outcomes = [
+                    ok
+                    for group_outcomes in pool.imap_unordered(_run_group, jobs)
+                    for ok in group_outcomes
+                ]
+        else:
+            outcomes = [ok for job in jobs for ok in _run_group(job)]
+    finally:
+        if temporary is not None:
+            temporary.cleanup()
+    return sum(outcomes), len(outcomes) - sum(outcomes)
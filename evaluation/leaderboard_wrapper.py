@@ -1,10 +1,11 @@
+import os
 import sys
 
 import pandas as pd
 
-from evaluation.evaluation_engine import execute_model
+from evaluation.leaderboard_scheduler import Cell, LeaderboardStore, run_cells
 from tasks.TaskTypes import TaskType
-from TestRunner import OperationRuns, get_implementation
+from TestRunner import OperationRuns
 
 sys.path.append("..")
 sys.path.append("../..")
@@ -38,7 +39,13 @@ DEFAULT_LEADERBOARD_MODELS = {
 
 
 def create_leaderboard_for_task(
-    task_type, trans_names_to_run=None, percentage_of_examples=20
+    task_type,
+    trans_names_to_run=None,
+    percentage_of_examples=20,
+    cache_dir=None,
+    num_workers=0,
+    results_path=None,
+    memory_budget_mb=None,
 ):
     """Given a task type, the function runs a list of operations
     and return a
@@ -52,6 +59,24 @@ def create_leaderboard_for_task(
         percentage_of_examples (int, optional):
             The percentage of examples to perturb.
             Defaults to 1.
+        cache_dir (str, optional):
+            Directory where the outputs of the transformations are cached
+            across runs. Defaults to None (no caching).
+        num_workers (int, optional):
+            Number of processes evaluating the models in parallel. They
+            share the perturbed sets through the cache_dir, or through a
+            temporary directory without one.
+            Defaults to 0 (everything runs in this process).
+        results_path (str, optional):
+            SQLite file where the result of every cell is saved. The cells
+            already in it are not run again unless their code changed.
+            Defaults to leaderboard_results.sqlite in the cache_dir, or in
+            the current directory.
+        memory_budget_mb (float, optional):
+            Memory the models loaded by the transformations and the
+            evaluators may take in every process. The least recently used
+            ones are unloaded beyond it. Defaults to None (no limit, or
+            NL_AUGMENTER_MODEL_MEMORY_MB when it is set).
 
     Raises:
         ValueError: [description]
@@ -60,8 +85,11 @@ def create_leaderboard_for_task(
         #  TODO: this might be more useful somewhere else.
         raise ValueError(f"{task_type} does not exist.")
     task_name = TaskType(task_type).name
-    all_trans = list(OperationRuns.get_all_operations_for_task(task_type))
-    all_trans_names = {t.name(): i for i, t in enumerate(all_trans)}
+    # the transformations are only imported when they are run
+    all_trans = list(
+        OperationRuns.get_all_operation_infos_for_task(TaskType(task_type))
+    )
+    all_trans_names = {t.name: i for i, t in enumerate(all_trans)}
     transformations = []
     if trans_names_to_run is not None:
         for name in trans_names_to_run:
@@ -76,34 +104,59 @@ def create_leaderboard_for_task(
         f"""
     Creating leaderboard for task: [{task_name}].
     Transformations being run:
-    \t{", ".join([t.name() for t in transformations])}
+    \t{", ".join([t.name for t in transformations])}
     """
     )
-    result_dict = {
-        t.name(): {"Transformation": t.name()} for t in transformations
-    }
-    for model_name, dataset_name in DEFAULT_LEADERBOARD_MODELS[task_name]:
-        # TODO: should we try to allow passing in models, rather than model names?
-        # in this leaderboard case the default implementation will cause unnecessary
-        # multiple inputs.
-        print(f"---- Evaluating {model_name} on {dataset_name} -----")
-        for trans in transformations:
-            print(f"| Transformation: {trans.name()}")
-            try:
-                result = execute_model(
-                    implementation=get_implementation(trans.__name__),
-                    task_type=task_name,
-                    model_name=model_name,
-                    dataset=dataset_name,
-                    percentage_of_examples=percentage_of_examples,
-                )
-                if "accuracy" in result:
-                    key, pt_key = "accuracy", "pt_accuracy"
-                if "bleu" in result:
-                    key, pt_key = "bleu", "pt_bleu"
-                result_dict[trans.name()][f"{model_name.split('/')[-1]}"] = f"{result[key]}->{result[pt_key]} ({result[pt_key]-result[key]})"
-            except Exception as e:
-                print(f"\t Error on {trans.name()}: {e}")
+    # every (transformation, model) cell is run by the scheduler, which saves its result as
+    # soon as it is known and skips the cells already done in a previous run
+    if results_path is None:
+        results_path = os.path.join(
+            os.path.expanduser(cache_dir or "."), "leaderboard_results.sqlite"
+        )
+    store = LeaderboardStore(results_path)
+    cells = [
+        Cell(
+            trans,
+            model_name,
+            dataset_name,
+            task_name,
+            str(percentage_of_examples),
+        )
+        for trans in transformations
+        for model_name, dataset_name in DEFAULT_LEADERBOARD_MODELS[task_name]
+    ]
+    successful, failed = run_cells(
+        cells,
+        store,
+        cache_dir=cache_dir,
+        num_workers=num_workers,
+        memory_budget=(
+            int(memory_budget_mb * 1024 * 1024)
+            if memory_budget_mb is not None
+            else None
+        ),
+    )
+    print(f"{successful} cells were evaluated, {failed} failed.")
+
+    result_dict = {t.name: {"Transformation": t.name} for t in transformations}
+    rows = store.rows()
+    for cell in cells:
+        row = rows.get(
+            (
+                cell.model_name,
+                cell.dataset_name,
+                cell.split,
+                cell.transformation.name,
+            )
+        )
+        if row is None or row["status"] != "done":
+            continue
+        result = row["result"]
+        if "accuracy" in result:
+            key, pt_key = "accuracy", "pt_accuracy"
+        if "bleu" in result:
+            key, pt_key = "bleu", "pt_bleu"
+        result_dict[cell.transformation.name][f"{cell.model_name.split('/')[-1]}"] = f"{result[key]}->{result[pt_key]} ({result[pt_key]-result[key]})"
     df_result = pd.DataFrame(list(result_dict.values()))
     print("Finished! The leaderboard:")
     print(df_result.to_markdown(index=False))
@@ -1,7 +1,7 @@
 from interfaces.SentenceOperation import SentenceOperation
+from lexicon_matcher import LexiconMatcher
 from tasks.TaskTypes import TaskType
-from initialize import spacy_nlp
-import spacy
+from initialize import get_spacy_doc_cache
 
 
 class TextContainsKeywordsFilter(SentenceOperation):
@@ -13,10 +13,16 @@ class TextContainsKeywordsFilter(SentenceOperation):
         if keywords is None:
             keywords = ["these", "keywords", "are", "only", "for", "demo"]
         self.keywords = keywords
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        # keywords are whole tokens (or sequences of tokens, e.g. "New York")
+        self.matcher = LexiconMatcher(keywords, boundary="space")
+        self.nlp = get_spacy_doc_cache()
 
     def filter(self, sentence: str = None) -> bool:
-        tokenized = self.nlp(sentence, disable=["parser", "tagger", "ner"])
-        tokenized = [token.text for token in tokenized]
-        contained_keywords = set(tokenized).intersection(set(self.keywords))
-        return bool(contained_keywords)
+        return self.filter_from_doc(
+            self.nlp(sentence, disable=["parser", "tagger", "ner"])
+        )
+
+    def filter_from_doc(self, tokenized) -> bool:
+        return self.matcher.contains(
+            " ".join(token.text for token in tokenized)
+        )
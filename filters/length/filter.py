@@ -1,9 +1,8 @@
 import operator
 from typing import List
 
-import spacy
 
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 from interfaces.SentenceOperation import (
     SentenceAndTargetOperation,
     SentenceOperation,
@@ -23,7 +22,7 @@ class TextLengthFilter(SentenceOperation):
         super().__init__()
         self.operator = self.parse_operator(op)
         self.threshold = threshold
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
 
     @staticmethod
     def parse_operator(op):
@@ -37,7 +36,11 @@ class TextLengthFilter(SentenceOperation):
         return ops[op]
 
     def filter(self, sentence: str = None) -> bool:
-        tokenized = self.nlp(sentence, disable=["parser", "tagger", "ner"])
+        return self.filter_from_doc(
+            self.nlp(sentence, disable=["parser", "tagger", "ner"])
+        )
+
+    def filter_from_doc(self, tokenized) -> bool:
         return self.operator(len(tokenized), self.threshold)
 
 
@@ -55,7 +58,7 @@ class SentenceAndTargetLengthFilter(SentenceAndTargetOperation):
         super().__init__()
         self.operators = [TextLengthFilter.parse_operator(op) for op in ops]
         self.thresholds = thresholds
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
 
         self._sanity_check()
 
@@ -1,4 +1,4 @@
-import spacy
+from initialize import get_spacy_doc_cache
 from interfaces.QuestionAnswerOperation import QuestionAnswerOperation
 from tasks.TaskTypes import TaskType
 
@@ -14,7 +14,7 @@ class QuantitativeQuestion(QuestionAnswerOperation):
 
     def __init__(self):
         super().__init__()
-        self.nlp = spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         # Covers the broad types of quant questions: distance , age , measurable , un-measurable
         self.quant_ques = ['many','much',
                            'close','far',
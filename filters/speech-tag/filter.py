@@ -4,7 +4,7 @@ from typing import Union
 
 import spacy
 
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
@@ -31,7 +31,7 @@ class SpeechTagFilter(SentenceOperation):
         self.final_operators = self.parse_operator(operations)
         self.final_speech_tags = self.convert_scalar_to_list(speech_tags)
         self.final_thresholds = self.convert_scalar_to_list(thresholds)
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.percentages = percentages
         self.sanity_check()
 
@@ -116,7 +116,9 @@ class SpeechTagFilter(SentenceOperation):
                 )
 
     def filter(self, sentence):
-        doc = self.nlp(sentence)
+        return self.filter_from_doc(self.nlp(sentence))
+
+    def filter_from_doc(self, doc):
         contained_speech_tags = doc.count_by(spacy.attrs.IDS["POS"])
         human_readable_tags = {}
         for pos, count in contained_speech_tags.items():
@@ -1,7 +1,8 @@
 import operator
-import spacy
+from initialize import get_spacy_doc_cache
 
 from interfaces.SentenceOperation import SentenceOperation
+from lexicon_matcher import LexiconMatcher
 from tasks.TaskTypes import TaskType
 from collections import defaultdict
 from typing import Union
@@ -26,7 +27,9 @@ class TokenAmountFilter(SentenceOperation):
         self.final_operators = self.parse_operator(operations)
         self.final_keywords = self.convert_scalar_to_list(keywords)
         self.final_thresholds = self.convert_scalar_to_list(thresholds)
-        self.nlp = spacy.load("en_core_web_sm")
+        # counts all the keywords in a single pass over the tokens
+        self.matcher = LexiconMatcher(self.final_keywords, boundary="space")
+        self.nlp = get_spacy_doc_cache()
         self.sanity_check()
 
     def get_input_length(self, keywords, thresholds, operations):
@@ -108,10 +111,14 @@ class TokenAmountFilter(SentenceOperation):
                 )
 
     def filter(self, sentence):
-        tokenized = self.nlp(sentence, disable=["parser", "tagger", "ner"])
-        contained_keywords = defaultdict(int)
-        for token in tokenized:
-            contained_keywords[token.text] += 1
+        return self.filter_from_doc(
+            self.nlp(sentence, disable=["parser", "tagger", "ner"])
+        )
+
+    def filter_from_doc(self, tokenized):
+        contained_keywords = self.matcher.count(
+            " ".join(token.text for token in tokenized)
+        )
 
         # Go through each comparison, stop if one of them evaluates to False
         for curr_keyword, curr_threshold, curr_operator in zip(
@@ -1,11 +1,517 @@
+import contextlib
+import functools
+import gc
+import hashlib
+import inspect
+import os
+import resource
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
 import spacy
 
 # Use this file to initialize all the heavy common packages shared by multiple transformation and filters.
 
 spacy_nlp = None
+spacy_doc_cache = None
+model_registry = None
+
+
+class SpacyDocCache:
+    """
+    LRU cache of parsed spaCy Docs shared by all transformations and filters,
+    so that a sentence is parsed once no matter how many operations look at it.
+
+    Entries are keyed by the pipeline components that were run and a hash of
+    the text. A request that disables components (e.g. a filter that only
+    needs tokens) is also served by a Doc produced by the full pipeline.
+    Cached Docs are shared, so operations must not modify them in place.
+    """
+
+    def __init__(self, nlp, max_size: int = 10000):
+        self.nlp = nlp
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # behave like the wrapped Language object for anything else
+        # (vocab, pipe_names, tokenizer, ...)
+        if "nlp" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.__dict__["nlp"], name)
+
+    def __getstate__(self):
+        # worker processes start with an empty cache
+        state = self.__dict__.copy()
+        state["_docs"] = OrderedDict()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _components(self, disable=None):
+        disable = set(disable or [])
+        return tuple(n for n in self.nlp.pipe_names if n not in disable)
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, text_hash, components):
+        full = tuple(self.nlp.pipe_names)
+        for key in ((components, text_hash), (full, text_hash)):
+            doc = self._docs.get(key)
+            if doc is not None:
+                self._docs.move_to_end(key)
+                return doc
+        return None
+
+    def _store(self, text_hash, components, doc):
+        self._docs[(components, text_hash)] = doc
+        self._docs.move_to_end((components, text_hash))
+        while len(self._docs) > self.max_size:
+            self._docs.popitem(last=False)
+
+    def __call__(self, text: str, disable=None):
+        components = self._components(disable)
+        text_hash = self._hash(text)
+        with self._lock:
+            doc = self._lookup(text_hash, components)
+            if doc is not None:
+                self.hits += 1
+                return doc
+            self.misses += 1
+        doc = self.nlp(text, disable=list(disable or []))
+        with self._lock:
+            self._store(text_hash, components, doc)
+        return doc
+
+    def pipe(self, texts, disable=None, batch_size: int = 256, **kwargs):
+        """Returns the Docs for `texts`, parsing only the misses with nlp.pipe."""
+        texts = list(texts)
+        components = self._components(disable)
+        hashes = [self._hash(text) for text in texts]
+        docs = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, text_hash in enumerate(hashes):
+                doc = self._lookup(text_hash, components)
+                if doc is not None:
+                    self.hits += 1
+                    docs[i] = doc
+                else:
+                    missing.setdefault(text_hash, []).append(i)
+        if missing:
+            positions = list(missing.values())
+            parsed = self.nlp.pipe(
+                [texts[p[0]] for p in positions],
+                disable=list(disable or []),
+                batch_size=batch_size,
+                **kwargs,
+            )
+            with self._lock:
+                for p, doc in zip(positions, parsed):
+                    self.misses += 1
+                    self.hits += len(p) - 1
+                    self._store(hashes[p[0]], components, doc)
+                    for i in p:
+                        docs[i] = doc
+        return docs
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._docs),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def get_spacy_doc_cache() -> SpacyDocCache:
+    """Returns the shared Doc cache, loading the spaCy pipeline on first use."""
+    global spacy_nlp, spacy_doc_cache
+    if spacy_doc_cache is None:
+        if spacy_nlp is None:
+            spacy_nlp = spacy.load("en_core_web_sm")
+        spacy_doc_cache = SpacyDocCache(spacy_nlp)
+    return spacy_doc_cache
+
+
+def resident_memory() -> int:
+    """Resident memory of the process in bytes (its peak when the current one isn't known)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _memory_size(obj) -> int:
+    # size of the weights of a torch model (or of the model of a pipeline or an AllenNLP
+    # predictor), 0 for tokenizers
+    model = obj
+    for attribute in ("model", "_model"):
+        if hasattr(obj, attribute):
+            model = getattr(obj, attribute)
+            break
+    if not hasattr(model, "parameters"):
+        return 0
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+def _memory_budget_from_env():
+    # NL_AUGMENTER_MODEL_MEMORY_MB=4096 keeps the loaded models under 4 GB
+    value = os.environ.get("NL_AUGMENTER_MODEL_MEMORY_MB")
+    return int(float(value) * 1024 * 1024) if value else None
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of the models, tokenizers and pipelines loaded by the operations and
+    the evaluators, so that the same weights are loaded once however many of them use them.
+
+    Entries are keyed by (model name, class, device, dtype, options given to from_pretrained).
+    Every entry counts the operations holding it (its references, released when they are
+    garbage collected) and the calls running on it, and records when it was last used, how
+    long it took to load and the memory taken by its weights.
+
+    With a memory budget (in bytes), the least recently used models are evicted whenever
+    loading a model takes the registry over the budget, those no operation holds first. A
+    model running a call (see using) is never evicted, as that would free nothing. Operations
+    hold LazyModel handles rather than the models themselves, so an evicted model is loaded
+    again on its next use.
+    """
+
+    def __init__(self, memory_budget: int = None):
+        self.memory_budget = memory_budget
+        self.evictions = 0
+        # whether the models in use were reported to exceed the budget
+        self._over_budget = False
+        self._entries = OrderedDict()
+        # weakref.finalize of the references of every owner, by id
+        self._finalizers = {}
+        self._lock = threading.RLock()
+
+    def set_memory_budget(self, memory_budget: int = None):
+        """Sets the budget in bytes (None for no budget) and evicts what doesn't fit in it."""
+        with self._lock:
+            self.memory_budget = memory_budget
+            self._over_budget = False
+            self._evict(keep=None)
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {
+                "object": None,
+                "references": 0,
+                "active": 0,
+                "loads": 0,
+                "load_seconds": 0.0,
+                "memory_bytes": 0,
+                "last_used": None,
+            }
+            self._entries[key] = entry
+        return entry
+
+    def _loaded_memory(self) -> int:
+        return sum(
+            entry["memory_bytes"]
+            for entry in self._entries.values()
+            if entry["object"] is not None
+        )
+
+    def _evict(self, keep, needed: int = 0):
+        if self.memory_budget is None:
+            return
+        # least recently used first, as the entries are kept in the order of their last use,
+        # the ones no operation holds before the others
+        candidates = [
+            key
+            for key, entry in self._entries.items()
+            if key != keep
+            and entry["object"] is not None
+            and entry["active"] == 0
+        ]
+        candidates.sort(key=lambda key: self._entries[key]["references"] > 0)
+        evicted = False
+        for key in candidates:
+            if self._loaded_memory() + needed <= self.memory_budget:
+                break
+            self._entries[key]["object"] = None
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            gc.collect()
+        in_use = self._loaded_memory() + needed
+        if in_use > self.memory_budget and not self._over_budget:
+            self._over_budget = True
+            print(
+                f"The models in use take {in_use / 2**20:.0f} MB, more than the memory "
+                f"budget of {self.memory_budget / 2**20:.0f} MB: raise the budget or the "
+                f"models will be loaded again and again."
+            )
+
+    def evict_unreferenced(self):
+        """Unloads the objects which no operation holds anymore."""
+        with self._lock:
+            evicted = False
+            for entry in self._entries.values():
+                if entry["object"] is not None and entry["references"] == 0:
+                    entry["object"] = None
+                    self.evictions += 1
+                    evicted = True
+        if evicted:
+            gc.collect()
+
+    def reference(self, key, owner):
+        """Counts owner as a user of key until it is garbage collected."""
+        with self._lock:
+            self._entry(key)["references"] += 1
+            finalizers = self._finalizers.get(id(owner))
+            if finalizers is None:
+                finalizers = self._finalizers[id(owner)] = []
+                weakref.finalize(owner, self._finalizers.pop, id(owner), None)
+            finalizers.append(weakref.finalize(owner, self.release, key))
+
+    def release_owner(self, owner):
+        """
+        Releases the objects used by owner without waiting for it to be garbage collected, and
+        unloads those which no other operation holds.
+        """
+        with self._lock:
+            for finalizer in self._finalizers.pop(id(owner), []):
+                finalizer()
+        self.evict_unreferenced()
+
+    def get(self, key, loader):
+        """Returns the object of key, loading it with loader() if it isn't loaded (anymore)."""
+        with self._lock:
+            entry = self._entry(key)
+            if entry["object"] is None:
+                # a model loaded before is known to need as much memory again
+                self._evict(keep=key, needed=entry["memory_bytes"])
+                resident = resident_memory()
+                start = time.perf_counter()
+                obj = loader()
+                entry["load_seconds"] += time.perf_counter() - start
+                entry["loads"] += 1
+                # tokenizers have no weights, their footprint is the memory they took
+                entry["memory_bytes"] = _memory_size(obj) or max(
+                    resident_memory() - resident, 0
+                )
+                entry["object"] = obj
+                self._evict(keep=key)
+            entry["last_used"] = time.time()
+            self._entries.move_to_end(key)
+            return entry["object"]
+
+    @contextlib.contextmanager
+    def using(self, key, loader):
+        """Like get, but the object isn't evicted until the end of the with block."""
+        with self._lock:
+            obj = self.get(key, loader)
+            entry = self._entries[key]
+            entry["active"] += 1
+        try:
+            yield obj
+        finally:
+            with self._lock:
+                entry["active"] -= 1
+
+    def acquire(self, key, loader, owner=None):
+        """
+        Returns the object of key, loading it with loader() if it isn't loaded yet.
+        With an owner, the object is referenced until the owner is garbage collected,
+        otherwise it is only cached.
+        """
+        if owner is not None:
+            self.reference(key, owner)
+        return self.get(key, loader)
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["references"] > 0:
+                entry["references"] -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = [
+                {
+                    "name": key[0],
+                    "class": key[1],
+                    "device": key[2],
+                    "dtype": key[3],
+                    "options": key[4],
+                    "loaded": entry["object"] is not None,
+                    "in_use": entry["active"] > 0,
+                    "references": entry["references"],
+                    "loads": entry["loads"],
+                    "load_seconds": entry["load_seconds"],
+                    "memory_bytes": entry["memory_bytes"],
+                    "last_used": entry["last_used"],
+                }
+                for key, entry in self._entries.items()
+            ]
+            evictions = self.evictions
+        return {
+            "models": models,
+            "memory_bytes": sum(
+                model["memory_bytes"] for model in models if model["loaded"]
+            ),
+            "memory_budget": self.memory_budget,
+            "evictions": evictions,
+            "resident_memory_bytes": resident_memory(),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        gc.collect()
+
+
+def get_model_registry() -> ModelRegistry:
+    global model_registry
+    if model_registry is None:
+        model_registry = ModelRegistry(_memory_budget_from_env())
+    return model_registry
+
+
+class LazyModel:
+    """
+    Handle on a model, tokenizer or pipeline of the registry, which behaves like it. The object
+    is only loaded when it is first used, and loaded again if the registry evicted it meanwhile.
+    Handles can be pickled: a worker process loads the object in its own registry.
+    """
+
+    def __init__(self, key, loader, owner=None):
+        self.__dict__["_key"] = key
+        self.__dict__["_loader"] = loader
+        if owner is not None:
+            get_model_registry().reference(key, owner)
+
+    def __getstate__(self):
+        return {"_key": self._key, "_loader": self._loader}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def _resolve(self):
+        return get_model_registry().get(self._key, self._loader)
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in ("_key", "_loader"):
+            raise AttributeError(name)
+        value = getattr(self._resolve(), name)
+        if inspect.ismethod(value):
+            # e.g. model.generate, the object can't be evicted while the method runs
+            return functools.partial(self._call_method, name)
+        return value
+
+    def _call_method(self, name, *args, **kwargs):
+        with get_model_registry().using(self._key, self._loader) as obj:
+            return getattr(obj, name)(*args, **kwargs)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        with get_model_registry().using(self._key, self._loader) as obj:
+            return obj(*args, **kwargs)
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __repr__(self):
+        return f"LazyModel({self._key[1]}, {self._key[0]})"
+
+
+def _from_pretrained(cls, name, device, dtype, kwargs):
+    if dtype is not None:
+        kwargs = dict(kwargs, torch_dtype=dtype)
+    obj = cls.from_pretrained(name, **kwargs)
+    if device is not None and hasattr(obj, "to"):
+        obj = obj.to(device)
+    return obj
+
+
+def _pipeline(task, name, device, kwargs):
+    # transformers is only imported when a model is loaded
+    from transformers import pipeline
+
+    return pipeline(task, model=name, tokenizer=name, device=device, **kwargs)
+
+
+def _options(kwargs) -> str:
+    # the keyword arguments of a load, in the key of the entry
+    return repr(sorted(kwargs.items()))
+
+
+def load_pretrained(
+    cls, name: str, device=None, dtype=None, owner=None, **kwargs
+):
+    """
+    Returns a handle on the shared cls.from_pretrained(name) (a model or a tokenizer class of
+    transformers), moved to device. The weights are loaded on first use. Pass owner=self from
+    an operation so that the registry knows it uses it.
+    """
+    key = (
+        name,
+        f"{cls.__module__}.{cls.__qualname__}",
+        str(device),
+        str(dtype),
+        _options(kwargs),
+    )
+    loader = functools.partial(
+        _from_pretrained, cls, name, device, dtype, kwargs
+    )
+    return LazyModel(key, loader, owner)
+
+
+def load_pipeline(task: str, name: str, device=-1, owner=None, **kwargs):
+    """Returns a handle on the shared transformers pipeline of task for the model name."""
+    key = (name, f"pipeline:{task}", str(device), "None", _options(kwargs))
+    loader = functools.partial(_pipeline, task, name, device, kwargs)
+    return LazyModel(key, loader, owner)
+
+
+def load_model(name: str, load, owner=None, **kwargs):
+    """
+    Returns a handle on the shared load(**kwargs), for the models loaded by other means than
+    from_pretrained (e.g. an AllenNLP predictor). name identifies the model in the registry,
+    load has to be importable (a function, a class or a classmethod) for the handle to be
+    pickled.
+    """
+    key = (
+        name,
+        f"{load.__module__}.{load.__qualname__}",
+        "None",
+        "None",
+        _options(kwargs),
+    )
+    loader = functools.partial(load, **kwargs)
+    return LazyModel(key, loader, owner)
 
 
 def initialize_models():
-    global spacy_nlp
+    global spacy_nlp, spacy_doc_cache
     # load spacy
     spacy_nlp = spacy.load("en_core_web_sm")
+    spacy_doc_cache = SpacyDocCache(spacy_nlp)
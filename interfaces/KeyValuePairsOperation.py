@@ -22,3 +22,13 @@ class KeyValuePairsOperation(Operation):
 
     def filter(self, meaning_representation: dict, reference: str) -> bool:
         raise True
+
+    def generate_batch(
+        self, meaning_representations: List[dict], references: List[str]
+    ) -> List[List[Tuple[dict, str]]]:
+        return super().generate_batch(meaning_representations, references)
+
+    def filter_batch(
+        self, meaning_representations: List[dict], references: List[str]
+    ) -> List[bool]:
+        return super().filter_batch(meaning_representations, references)
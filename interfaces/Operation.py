@@ -1,13 +1,41 @@
+import hashlib
+import random
 from typing import Tuple, List
+
+import numpy as np
+
 """Generic operation class. """
 
 
+def derive_seed(seed: int, key: object = None) -> int:
+    """
+    Derives the seed of a single example from the operation seed and an example key
+    (e.g. the text of the example). Without a key the operation seed is used as it is.
+    """
+    if key is None:
+        return seed
+    digest = hashlib.sha256(f"{seed}|{key}".encode("utf8")).hexdigest()
+    # np.random.RandomState only accepts 32 bit seeds
+    return int(digest[:8], 16)
+
+
 class Operation(object):
     languages = None
     tasks = None
     seed = 0
     heavy = False
     max_outputs = 1
+    # when True, the random draws made for an example depend on the example (see
+    # example_seed), instead of every example getting the draws of the operation seed. Off by
+    # default so that the outputs of the test cases don't change. Set it before caching the
+    # operation, it is part of the identity of its results (see result_cache.py).
+    per_example_seed = False
+
+    def __new__(cls, *args, **kwargs):
+        operation = super().__new__(cls)
+        # the constructor arguments identify the outputs of an operation (see result_cache.py)
+        operation._init_args = (args, kwargs)
+        return operation
 
     def __init__(self, seed=0, verbose=False, max_outputs=1):
         self.seed = seed
@@ -27,6 +55,49 @@ class Operation(object):
                 successful_pt += 1
         return successful_pt, failed_pt
 
+    def example_seed(self, key: object = None) -> int:
+        """
+        The seed of the example identified by key (its text, usually): derived from the
+        operation seed and the key when per_example_seed is set, the operation seed otherwise.
+        Either way it only depends on the example, so sharded, multi-threaded and resumed runs
+        give the outputs of the serial run.
+        """
+        return derive_seed(self.seed, key if self.per_example_seed else None)
+
+    def get_rng(self, key: object = None) -> random.Random:
+        """
+        Returns a new random number generator seeded with example_seed(key). Operations should
+        draw from it rather than calling random.seed, so that they never touch the global
+        random state: their outputs then don't depend on the order of the calls and they can
+        be run from several threads or processes.
+        """
+        return random.Random(self.example_seed(key))
+
+    def get_np_rng(self, key: object = None) -> np.random.RandomState:
+        """
+        NumPy counterpart of get_rng. A RandomState draws the same numbers as the legacy
+        np.random.seed/np.random.* functions the operations used to call.
+        """
+        return np.random.RandomState(self.example_seed(key))
+
+    def generate_batch(self, *batched_args) -> List:
+        """
+        Batched version of `generate`. Every positional argument is a list holding
+        the corresponding argument of `generate` for each example, e.g.
+        generate_batch(sentences) or generate_batch(contexts, questions, answers).
+        Returns the list of `generate` outputs in the same order as the inputs.
+
+        The default implementation simply loops over `generate`. Operations which
+        run a model should override it to process the examples as padded batches.
+        """
+        return [self.generate(*args) for args in zip(*batched_args)]
+
+    def filter_batch(self, *batched_args) -> List[bool]:
+        """
+        Batched version of `filter`, following the same conventions as `generate_batch`.
+        """
+        return [self.filter(*args) for args in zip(*batched_args)]
+
     @classmethod
     def is_heavy(cls):
         return cls.heavy
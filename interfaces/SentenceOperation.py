@@ -24,6 +24,39 @@ class SentenceOperation(Operation):
     def filter(self, sentence: str) -> bool:
         raise NotImplementedError
 
+    def generate_batch(self, sentences: List[str]) -> List[List[str]]:
+        return super().generate_batch(sentences)
+
+    def filter_batch(self, sentences: List[str]) -> List[bool]:
+        return super().filter_batch(sentences)
+
+    # Operations that work on a spaCy parse can override these to use a Doc parsed
+    # beforehand (e.g. by dataset.parse) instead of parsing the sentence again.
+    def generate_from_doc(self, doc) -> List[str]:
+        return self.generate(doc.text)
+
+    def filter_from_doc(self, doc) -> bool:
+        return self.filter(doc.text)
+
+    # Batched versions of the hooks above, used by the datasets: the sentences are parsed
+    # together through the shared Doc cache. They are memoized like generate_batch and
+    # filter_batch by result_cache.cache_operation, which only parses the sentences missing
+    # from the cache.
+    def generate_batch_from_docs(
+        self, sentences: List[str]
+    ) -> List[List[str]]:
+        # imported here so that the interfaces don't load spaCy
+        from initialize import get_spacy_doc_cache
+
+        docs = get_spacy_doc_cache().pipe(sentences)
+        return [self.generate_from_doc(doc) for doc in docs]
+
+    def filter_batch_from_docs(self, sentences: List[str]) -> List[bool]:
+        from initialize import get_spacy_doc_cache
+
+        docs = get_spacy_doc_cache().pipe(sentences)
+        return [self.filter_from_doc(doc) for doc in docs]
+
 
 class SentenceAndTargetOperation(Operation):
     """
@@ -51,6 +84,16 @@ class SentenceAndTargetOperation(Operation):
     def filter(self, sentence: str, target: str) -> bool:
         raise NotImplementedError
 
+    def generate_batch(
+        self, sentences: List[str], targets: List[str]
+    ) -> List[List[Tuple[str, str]]]:
+        return super().generate_batch(sentences, targets)
+
+    def filter_batch(
+        self, sentences: List[str], targets: List[str]
+    ) -> List[bool]:
+        return super().filter_batch(sentences, targets)
+
 
 class SentenceAndTargetsOperation(Operation):
     """
@@ -79,3 +122,13 @@ class SentenceAndTargetsOperation(Operation):
 
     def filter(self, sentence: str, target: List[str]) -> bool:
         raise NotImplementedError
+
+    def generate_batch(
+        self, sentences: List[str], targets: List[List[str]]
+    ) -> List[List[Tuple[str, List[str]]]]:
+        return super().generate_batch(sentences, targets)
+
+    def filter_batch(
+        self, sentences: List[str], targets: List[List[str]]
+    ) -> List[bool]:
+        return super().filter_batch(sentences, targets)
@@ -22,3 +22,13 @@ class SentencePairOperation(Operation):
 
     def filter(self, sentence1: str, sentence2: str, target: str) -> bool:
         raise NotImplementedError
+
+    def generate_batch(
+        self, sentences1: List[str], sentences2: List[str], targets: List[str]
+    ) -> List[List[Tuple[str, str, str]]]:
+        return super().generate_batch(sentences1, sentences2, targets)
+
+    def filter_batch(
+        self, sentences1: List[str], sentences2: List[str], targets: List[str]
+    ) -> List[bool]:
+        return super().filter_batch(sentences1, sentences2, targets)
@@ -0,0 +1,178 @@
+from collections import Counter, deque
+from typing import Callable, Iterable, List, Tuple
+
+"""
+Multi-pattern matching of a lexicon (contractions, discourse markers, gendered words, keywords...)
+in a text. The lexicon is compiled once into an Aho-Corasick automaton, which finds all the
+occurrences of all its entries in a single pass over the text, however large the lexicon is.
+Build the matcher once (e.g. at module level or in __init__) and reuse it for every text.
+"""
+
+
+def _is_word_char(c: str) -> bool:
+    # the \w of the re module
+    return c.isalnum() or c == "_"
+
+
+class LexiconMatcher:
+    """
+    Aho-Corasick automaton of a lexicon.
+
+    ignore_case: match the entries whatever their case.
+    boundary: "word" (default) only keeps the matches which aren't inside a word, i.e. which
+        start (end) with a non-word character or after (before) one, like a regex \\b around
+        the entry. "space" only keeps the matches delimited by whitespace or the ends of the
+        text, e.g. for whole tokens of a text joined with spaces. None keeps every match.
+
+    Matches are (start, end, entry) tuples, entry being the lexicon entry which matched
+    text[start:end] (the first one given when several entries only differ by their case).
+    """
+
+    def __init__(
+        self,
+        patterns: Iterable[str],
+        ignore_case: bool = False,
+        boundary: str = "word",
+    ):
+        if boundary not in ("word", "space", None):
+            raise ValueError(f"Unknown boundary {boundary}")
+        self.ignore_case = ignore_case
+        self.boundary = boundary
+        self.patterns = []
+        # states of the automaton: transitions, failure link and the entries ending there
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        keys = {}
+        for pattern in patterns:
+            key = self._fold(pattern)
+            if not key or key in keys:
+                continue
+            keys[key] = len(self.patterns)
+            self.patterns.append(pattern)
+            state = 0
+            for c in key:
+                next_state = self._goto[state].get(c)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][c] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = (keys[key],)
+        self._lengths = [len(self._fold(p)) for p in self.patterns]
+        self._index = {p: i for i, p in enumerate(self.patterns)}
+        self._build_failure_links()
+
+    def _fold(self, text: str) -> str:
+        if not self.ignore_case:
+            return text
+        folded = text.lower()
+        if len(folded) != len(text):
+            # a few characters change length when lowered (e.g. "İ"), keep the offsets
+            folded = "".join(
+                c.lower() if len(c.lower()) == 1 else c for c in text
+            )
+        return folded
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(c, 0)
+                self._output[next_state] += self._output[
+                    self._fail[next_state]
+                ]
+
+    def _at_boundary(self, text: str, start: int, end: int) -> bool:
+        if self.boundary is None:
+            return True
+        if self.boundary == "space":
+            return (start == 0 or text[start - 1].isspace()) and (
+                end == len(text) or text[end].isspace()
+            )
+        return (
+            start == 0
+            or not _is_word_char(text[start])
+            or not _is_word_char(text[start - 1])
+        ) and (
+            end == len(text)
+            or not _is_word_char(text[end - 1])
+            or not _is_word_char(text[end])
+        )
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """All the matches, overlapping ones included, by end and then by length."""
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        state = 0
+        for end, c in enumerate(self._fold(text), 1):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for index in output[state]:
+                start = end - self._lengths[index]
+                if self._at_boundary(text, start, end):
+                    matches.append((start, end, self.patterns[index]))
+        return matches
+
+    def find(
+        self, text: str, longest: bool = True
+    ) -> List[Tuple[int, int, str]]:
+        """
+        The leftmost-longest matches which don't overlap, from left to right. With
+        longest=False, the entry given first wins among those starting at the same position,
+        like in a regex alternation of the entries.
+        """
+
+        def leftmost_longest(match):
+            return match[0], -match[1]
+
+        def leftmost_first(match):
+            return match[0], self._index[match[2]]
+
+        matches = sorted(
+            self.find_all(text),
+            key=leftmost_longest if longest else leftmost_first,
+        )
+        selected = []
+        position = 0
+        for match in matches:
+            if match[0] >= position:
+                selected.append(match)
+                position = match[1]
+        return selected
+
+    def contains(self, text: str) -> bool:
+        return bool(self.find_all(text))
+
+    def count(self, text: str) -> Counter:
+        """Number of occurrences of every entry found in text."""
+        return Counter(entry for _, _, entry in self.find_all(text))
+
+    def sub(
+        self,
+        replace: Callable[[str, str], str],
+        text: str,
+        longest: bool = True,
+    ) -> str:
+        """
+        Replaces the matches of find by replace(matched text, entry), like re.sub.
+        A match is left as it is when replace returns None.
+        """
+        pieces = []
+        position = 0
+        for start, end, entry in self.find(text, longest):
+            replacement = replace(text[start:end], entry)
+            if replacement is not None:
+                pieces.append(text[position:start])
+                pieces.append(replacement)
+                position = end
+        pieces.append(text[position:])
+        return "".join(pieces)
@@ -0,0 +1,562 @@
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from interfaces.Operation import Operation
+
+"""
+Persistent cache of the outputs of transformations and filters, and of the predictions of the
+evaluation models on the original examples (PredictionStore).
+Results are stored in a SQLite file and keyed by a hash of the operation (class, constructor
+arguments, seed and source code), the method and the input, so that re-running an evaluation
+or a leaderboard only computes the outputs of examples it hasn't seen before.
+
+    cache = ResultCache("~/.cache/nl-augmenter")
+    transformation = cache_operation(BackTranslation(), cache)
+"""
+
+# bump this to invalidate all the results cached so far
+CACHE_VERSION = "1"
+
+
+class ResultCache:
+    # cache_dir: directory of the SQLite file (None keeps the results in memory for this process)
+    # max_size_mb: the least recently used results are evicted when the cache grows past this size
+    # salt: any extra string to make the keys of this cache differ from the default ones
+    def __init__(
+        self, cache_dir: str, max_size_mb: int = 1024, salt: str = ""
+    ):
+        if cache_dir is None:
+            self.path = ":memory:"
+        else:
+            cache_dir = os.path.expanduser(cache_dir)
+            os.makedirs(cache_dir, exist_ok=True)
+            self.path = os.path.join(cache_dir, "results.sqlite")
+        self.max_size = max_size_mb * 1024 * 1024
+        self.salt = f"{CACHE_VERSION}|{salt}"
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # connections can't be shared with other processes, every process opens its own
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_conn"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, timeout=60, check_same_thread=False
+            )
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+            )
+            # running total of the sizes of the results, so that writes don't have to sum them
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+            if (
+                self._conn.execute(
+                    "SELECT value FROM metadata WHERE name = 'size'"
+                ).fetchone()
+                is None
+            ):
+                # caches written before the metadata table existed
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO metadata "
+                    "SELECT 'size', COALESCE(SUM(size), 0) FROM results"
+                )
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def make_key(self, *parts) -> str:
+        return hashlib.sha256(
+            repr((self.salt,) + parts).encode("utf-8")
+        ).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, object]:
+        found = {}
+        unique_keys = list(set(keys))
+        with self._lock:
+            conn = self._connection()
+            # stay below the limit of SQLite variables in a query
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value FROM results WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = pickle.loads(value)
+                if rows:
+                    conn.execute(
+                        f"UPDATE results SET last_used = ? WHERE key IN ({placeholders})",
+                        [time.time()] + chunk,
+                    )
+            conn.commit()
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def set_many(self, items: Dict[str, object]):
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            blob = pickle.dumps(value)
+            rows.append((key, blob, len(blob), now))
+        keys = list(items)
+        with self._lock:
+            conn = self._connection()
+            # the sizes of the replaced results and the total are updated in one transaction
+            conn.execute("BEGIN IMMEDIATE")
+            replaced = 0
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                replaced += conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM results WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchone()[0]
+            conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows
+            )
+            total = self._add_size(
+                conn, sum(row[2] for row in rows) - replaced
+            )
+            if total > self.max_size:
+                self._evict(conn, total)
+            conn.commit()
+
+    @staticmethod
+    def _add_size(conn: sqlite3.Connection, delta: int) -> int:
+        conn.execute(
+            "UPDATE metadata SET value = value + ? WHERE name = 'size'",
+            (delta,),
+        )
+        return conn.execute(
+            "SELECT value FROM metadata WHERE name = 'size'"
+        ).fetchone()[0]
+
+    def size(self) -> int:
+        """Total size (bytes) of the pickled results in the cache."""
+        with self._lock:
+            return (
+                self._connection()
+                .execute("SELECT value FROM metadata WHERE name = 'size'")
+                .fetchone()[0]
+            )
+
+    def _evict(self, conn: sqlite3.Connection, total: int):
+        # drop the least recently used results until the cache is back to 90% of its size
+        to_free = total - int(0.9 * self.max_size)
+        freed = 0
+        keys = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM results ORDER BY last_used"
+        ):
+            keys.append(key)
+            freed += size
+            if freed >= to_free:
+                break
+        conn.executemany(
+            "DELETE FROM results WHERE key = ?", [(key,) for key in keys]
+        )
+        self._add_size(conn, -freed)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM results")
+            conn.execute("UPDATE metadata SET value = 0 WHERE name = 'size'")
+            conn.commit()
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _repo_modules(module, found: dict):
+    # the modules of this repository used by module, directly or through other ones
+    path = getattr(module, "__file__", None)
+    if module.__name__ in found or path is None:
+        return
+    path = os.path.abspath(path)
+    if not path.startswith(ROOT_DIR + os.sep) or "site-packages" in path:
+        return
+    found[module.__name__] = path
+    for value in list(vars(module).values()):
+        if inspect.ismodule(value):
+            name = value.__name__
+        else:
+            name = getattr(value, "__module__", None)
+        if isinstance(name, str) and name in sys.modules:
+            _repo_modules(sys.modules[name], found)
+
+
+_source_hashes = {}
+
+
+def _source_hash(cls) -> str:
+    """
+    Hash of the source files of cls and of the modules of the repository it uses (its base
+    classes, char_noise, lexicon_matcher, ...), so that editing a shared helper invalidates the
+    results too.
+    """
+    if cls not in _source_hashes:
+        found = {}
+        for klass in cls.__mro__:
+            module = sys.modules.get(klass.__module__)
+            if module is not None:
+                _repo_modules(module, found)
+        sha = hashlib.sha1()
+        for name in sorted(found):
+            try:
+                with open(found[name], "rb") as f:
+                    sha.update(name.encode("utf-8"))
+                    sha.update(f.read())
+            except OSError:
+                pass
+        _source_hashes[cls] = sha.hexdigest()
+    return _source_hashes[cls]
+
+
+def _stable_repr(value) -> str:
+    # repr of a constructor argument which is the same in every run
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_stable_repr(item) for item in value]
+        if isinstance(value, (set, frozenset)):
+            items.sort()
+        return f"{type(value).__name__}({', '.join(items)})"
+    if isinstance(value, dict):
+        items = sorted(
+            f"{_stable_repr(k)}: {_stable_repr(v)}" for k, v in value.items()
+        )
+        return "{" + ", ".join(items) + "}"
+    if isinstance(value, Operation):
+        return repr(operation_identity(value))
+    if inspect.isfunction(value) or inspect.isclass(value):
+        return f"{value.__module__}.{value.__qualname__}"
+    text = repr(value)
+    if " at 0x" in text:
+        raise TypeError(
+            f"{text} has no stable representation, the results of an operation "
+            "constructed with it can't be cached"
+        )
+    return text
+
+
+def operation_identity(operation: Operation) -> tuple:
+    """
+    Identifies the results of an operation: its class, constructor arguments, seed (and
+    per_example_seed), number of outputs and a hash of its source code. Raises a TypeError
+    when a constructor argument can't be identified across runs (e.g. an arbitrary object).
+    """
+    init_args = getattr(operation, "_init_args", ((), {}))
+    cls = type(operation)
+    return (
+        f"{cls.__module__}.{cls.__qualname__}",
+        _stable_repr(list(init_args[0])),
+        _stable_repr(init_args[1]),
+        operation.seed,
+        operation.per_example_seed,
+        operation.max_outputs,
+        _source_hash(cls),
+    )
+
+
+class OperationMemoizer:
+    """
+    Replaces generate, filter, generate_batch and filter_batch of an operation instance (and
+    the batched doc hooks of a SentenceOperation) with versions which look the results up in a
+    ResultCache first. The batched methods only pass the examples missing from the cache to
+    the operation.
+    """
+
+    def __init__(self, operation: Operation, cache: ResultCache):
+        self.operation = operation
+        self.cache = cache
+        self.identity = operation_identity(operation)
+        # threads currently running the operation itself, e.g. the default generate_batch
+        # calling generate, which must not go through the cache again
+        self._bypass = set()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_bypass"] = set()
+        return state
+
+    def _call_operation(self, method: str, *args):
+        thread = threading.get_ident()
+        self._bypass.add(thread)
+        try:
+            return getattr(type(self.operation), method)(self.operation, *args)
+        finally:
+            self._bypass.discard(thread)
+
+    def _batch(self, method: str, key_method: str, batched_args):
+        if threading.get_ident() in self._bypass:
+            return getattr(type(self.operation), method)(
+                self.operation, *batched_args
+            )
+        examples = list(zip(*batched_args))
+        keys = [
+            self.cache.make_key(self.identity, key_method, example)
+            for example in examples
+        ]
+        found = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            missing_args = [
+                [examples[i][arg] for i in missing]
+                for arg in range(len(batched_args))
+            ]
+            computed = self._call_operation(method, *missing_args)
+            new_results = {
+                keys[i]: result for i, result in zip(missing, computed)
+            }
+            self.cache.set_many(new_results)
+            found.update(new_results)
+        return [found[key] for key in keys]
+
+    def _single(self, method: str, args):
+        if threading.get_ident() in self._bypass:
+            return getattr(type(self.operation), method)(self.operation, *args)
+        return self._batch(method + "_batch", method, [[arg] for arg in args])[
+            0
+        ]
+
+    def generate(self, *args):
+        return self._single("generate", args)
+
+    def filter(self, *args):
+        return self._single("filter", args)
+
+    def generate_batch(self, *batched_args):
+        return self._batch("generate_batch", "generate", batched_args)
+
+    def filter_batch(self, *batched_args):
+        return self._batch("filter_batch", "filter", batched_args)
+
+    # the doc hooks of the SentenceOperations share the results of generate and filter
+    def generate_batch_from_docs(self, sentences):
+        return self._batch("generate_batch_from_docs", "generate", [sentences])
+
+    def filter_batch_from_docs(self, sentences):
+        return self._batch("filter_batch_from_docs", "filter", [sentences])
+
+
+def cache_operation(operation: Operation, cache: ResultCache) -> Operation:
+    """Makes `operation` use `cache` for its results and returns it."""
+    memoizer = OperationMemoizer(operation, cache)
+    operation.generate = memoizer.generate
+    operation.filter = memoizer.filter
+    operation.generate_batch = memoizer.generate_batch
+    operation.filter_batch = memoizer.filter_batch
+    if hasattr(type(operation), "generate_batch_from_docs"):
+        operation.generate_batch_from_docs = memoizer.generate_batch_from_docs
+        operation.filter_batch_from_docs = memoizer.filter_batch_from_docs
+    return operation
+
+
+def perturbed_set(
+    cache: ResultCache,
+    dataset_name: str,
+    split: str,
+    operation: Operation,
+    create,
+    *extra,
+):
+    """
+    Returns the perturbed set of the split of a dataset made by operation. create() makes it
+    the first time, and the result is kept in cache, so that all the models evaluated on the
+    dataset share it. extra: anything else the perturbed set depends on, e.g. the subfields.
+    """
+    key = cache.make_key(
+        "perturbed_set",
+        dataset_name,
+        split,
+        operation_identity(operation),
+        extra,
+    )
+    found = cache.get_many([key])
+    if key in found:
+        print(f"Reusing the perturbed {split} split of {dataset_name}.")
+        return found[key]
+    result = create()
+    cache.set_many({key: result})
+    return result
+
+
+# one cache per directory, so that all the evaluations of a process share it
+_result_caches = {}
+
+
+def get_result_cache(cache_dir: str = None) -> ResultCache:
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+    if cache_dir not in _result_caches:
+        _result_caches[cache_dir] = ResultCache(cache_dir)
+    return _result_caches[cache_dir]
+
+
+class PredictionStore:
+    """
+    Store of the predictions of the evaluation models on the original (unperturbed) examples,
+    keyed by (model, dataset, split, example id). The baseline of a model on a dataset is
+    computed once and shared by the evaluations of all the transformations and filters.
+    With cache_dir=None, the predictions are only kept in memory for the current process.
+    """
+
+    def __init__(self, cache_dir: str = None):
+        if cache_dir is None:
+            self.path = ":memory:"
+        else:
+            cache_dir = os.path.expanduser(cache_dir)
+            os.makedirs(cache_dir, exist_ok=True)
+            self.path = os.path.join(cache_dir, "predictions.sqlite")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_conn"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, timeout=60, check_same_thread=False
+            )
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "model TEXT, dataset TEXT, split TEXT, example_id INTEGER, "
+                "input_hash TEXT, prediction BLOB, "
+                "PRIMARY KEY (model, dataset, split, example_id))"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _input_hash(model_input) -> str:
+        return hashlib.sha1(repr(model_input).encode("utf-8")).hexdigest()
+
+    def predict(
+        self,
+        model_name: str,
+        dataset_name: str,
+        split: str,
+        inputs: List,
+        predict_func,
+    ) -> List:
+        """
+        Returns the predictions of the model for inputs, the examples of the split in order.
+        predict_func(inputs) is only called on the examples without a stored prediction, or whose
+        input changed since the prediction was stored.
+        """
+        hashes = [self._input_hash(model_input) for model_input in inputs]
+        stored = {}
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT example_id, input_hash, prediction FROM predictions "
+                "WHERE model = ? AND dataset = ? AND split = ?",
+                (model_name, dataset_name, split),
+            )
+            for example_id, input_hash, prediction in rows:
+                if (
+                    example_id < len(hashes)
+                    and hashes[example_id] == input_hash
+                ):
+                    stored[example_id] = pickle.loads(prediction)
+        missing = [i for i in range(len(inputs)) if i not in stored]
+        self.hits += len(stored)
+        self.misses += len(missing)
+        if missing:
+            predictions = predict_func([inputs[i] for i in missing])
+            rows = []
+            for i, prediction in zip(missing, predictions):
+                stored[i] = prediction
+                rows.append(
+                    (
+                        model_name,
+                        dataset_name,
+                        split,
+                        i,
+                        hashes[i],
+                        pickle.dumps(prediction),
+                    )
+                )
+            with self._lock:
+                conn = self._connection()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.commit()
+        return [stored[i] for i in range(len(inputs))]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM predictions")
+            conn.commit()
+
+
+# one store per cache directory, so that all the evaluations of a process share their baselines
+_prediction_stores = {}
+
+
+def get_prediction_store(cache_dir: str = None) -> PredictionStore:
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+    if cache_dir not in _prediction_stores:
+        _prediction_stores[cache_dir] = PredictionStore(cache_dir)
+    return _prediction_stores[cache_dir]
@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+from transformations.back_translation.transformation import BackTranslation
+
+
+class Interrupted(BaseException):
+    pass
+
+
+def pipeline(en2de_batch, de2en_batch):
+    # the stages without the models
+    operation = BackTranslation.__new__(BackTranslation)
+    operation.verbose = False
+    operation.batch_size = 1
+    operation.queue_size = 1
+    operation.en2de_batch = en2de_batch
+    operation.de2en_batch = de2en_batch
+    return operation
+
+
+def test_buckets_go_through_both_stages():
+    operation = pipeline(
+        lambda texts: [text.upper() for text in texts],
+        lambda texts: [[text + "!"] for text in texts],
+    )
+    assert operation.generate_batch(["b", "a", "cc"]) == [
+        ["B!"],
+        ["A!"],
+        ["CC!"],
+    ]
+    assert operation.stats["failed"] == 0
+
+
+def test_producer_stops_when_the_consumer_raises():
+    def de2en_batch(texts):
+        raise Interrupted()
+
+    operation = pipeline(lambda texts: texts, de2en_batch)
+    threads = threading.active_count()
+    with pytest.raises(Interrupted):
+        operation.generate_batch([str(i) for i in range(10)])
+    assert threading.active_count() == threads
@@ -0,0 +1,65 @@
+import numpy as np
+
+from char_noise import CharBatch, NeighbourTable, flip_case, substitute, typos
+
+TEXTS = [
+    "The quick brown fox jumps over the lazy dog.",
+    "",
+    "Straße ÉCOLE naïve",
+    "The quick brown fox jumps over the lazy dog.",
+    "a",
+]
+NEIGHBOURS = {"a": "qs", "o": "ip", "e": "wr", "t": "ry"}
+TABLE = NeighbourTable(NEIGHBOURS)
+LEET = {"a": "4", "e": "3", "o": "0", "ß": "SS"}
+
+
+def noises(texts, seed=0):
+    return {
+        "typos": typos(CharBatch(texts, seed), TABLE, 0.5),
+        "flip_case": flip_case(CharBatch(texts, seed), 0.5),
+        "substitute": substitute(CharBatch(texts, seed), LEET, 0.5),
+    }
+
+
+def test_the_noise_only_depends_on_the_seed():
+    assert noises(TEXTS) == noises(TEXTS)
+    assert noises(TEXTS) != noises(TEXTS, seed=1)
+
+
+def test_the_noise_does_not_depend_on_the_batch():
+    together = noises(TEXTS)
+    for i, text in enumerate(TEXTS):
+        alone = noises([text])
+        for name, outputs in together.items():
+            assert outputs[i] == alone[name][0]
+    reversed_batch = noises(TEXTS[::-1])
+    for name, outputs in together.items():
+        assert outputs == reversed_batch[name][::-1]
+
+
+def test_lengths_and_untouched_characters_are_kept():
+    for text, noisy in zip(TEXTS, typos(CharBatch(TEXTS), TABLE, 1.0)):
+        assert len(noisy) == len(text)
+        for c, n in zip(text, noisy):
+            if c.lower() not in "aoet":
+                assert c == n
+            else:
+                assert n.lower() in NEIGHBOURS[c.lower()]
+                assert n.isupper() == c.isupper()
+
+
+def test_case_flips_of_every_script():
+    assert flip_case(CharBatch(["aB ß É"]), 1.0) == ["Ab SS é"]
+    assert flip_case(CharBatch(["aB ß É"]), 0.0) == ["aB ß É"]
+
+
+def test_replacements_by_several_characters():
+    assert substitute(CharBatch(["ß"]), LEET, 1.0) == ["SS"]
+    assert substitute(CharBatch(["xyz"]), LEET, 1.0) == ["xyz"]
+
+
+def test_draws_are_uniform():
+    draws = CharBatch(["x" * 10000]).uniform(0)
+    assert 0 <= draws.min() and draws.max() < 1
+    assert abs(np.mean(draws) - 0.5) < 0.02
@@ -0,0 +1,147 @@
+import json
+import os
+
+import pytest
+
+from dataset import (
+    KeyValueDataset,
+    StreamingDataset,
+    TextLineDataset,
+    map_operation,
+)
+from interfaces.SentenceOperation import SentenceOperation
+
+# number of times the operation was unpickled in this process
+unpickled = 0
+
+
+class Repeat(SentenceOperation):
+    def __init__(self, seed=0, times=2):
+        super().__init__(seed)
+        self.times = times
+
+    def __setstate__(self, state):
+        global unpickled
+        unpickled += 1
+        self.__dict__.update(state)
+
+    def generate(self, sentence: str):
+        return [sentence * i for i in range(1, self.times + 1)]
+
+
+class Short(SentenceOperation):
+    def filter(self, sentence: str) -> bool:
+        return len(sentence) < 3
+
+
+def process_batch(batch, operation):
+    return [(text, os.getpid(), unpickled) for text in batch]
+
+
+def test_map_operation_keeps_the_order_in_batches():
+    batches = []
+
+    def apply_func(batch, operation):
+        batches.append(len(batch))
+        return [text.upper() for text in batch]
+
+    data = [str(i) for i in range(10)]
+    results = list(map_operation(apply_func, None, data, batch_size=3))
+    assert results == data
+    assert batches == [3, 3, 3, 1]
+
+
+def test_map_operation_over_workers():
+    data = [str(i) for i in range(100)]
+    results = list(
+        map_operation(
+            process_batch,
+            Repeat(),
+            data,
+            batch_size=4,
+            num_workers=2,
+            chunk_size=5,
+        )
+    )
+    assert [text for text, _, _ in results] == data
+    assert all(pid != os.getpid() for _, pid, _ in results)
+    # the operation is sent to every worker once (or inherited when forking), not with
+    # every chunk
+    assert max(count for _, _, count in results) <= 1
+
+
+def test_transformations_over_workers_are_the_ones_in_process():
+    dataset = TextLineDataset([f"s{i}" for i in range(20)], list(range(20)))
+    in_process = dataset.apply_transformation(Repeat())
+    sharded = dataset.apply_transformation(
+        Repeat(), num_workers=2, chunk_size=3
+    )
+    assert sharded.data == in_process.data
+    assert sharded.labels == in_process.labels
+    assert sharded.sources == in_process.sources
+
+
+def counting_source(datapoints, read):
+    def source():
+        for datapoint in datapoints:
+            read.append(datapoint["text"])
+            yield datapoint
+
+    return source
+
+
+def test_streaming_stages_run_when_iterating_one_chunk_at_a_time():
+    datapoints = [{"text": f"s{i}", "label": i} for i in range(25)]
+    read = []
+    dataset = (
+        StreamingDataset(
+            counting_source(datapoints, read),
+            fields=["text", "label"],
+            chunk_size=10,
+        )
+        .apply_filter(Short(), subfields=["text"])
+        .apply_transformation(Repeat(), subfields=["text"])
+    )
+    assert read == []
+    iterator = dataset.datapoints()
+    next(iterator)
+    assert len(read) == 10
+    expected = (
+        KeyValueDataset(datapoints, fields=["text", "label"])
+        .apply_filter(Short(), subfields=["text"])
+        .apply_transformation(Repeat(), subfields=["text"])
+    )
+    assert list(dataset.datapoints()) == expected.data
+    assert list(dataset) == [
+        (datapoint["text"], datapoint["label"]) for datapoint in expected.data
+    ]
+
+
+def test_streaming_datasets_are_not_changed_by_their_stages():
+    dataset = StreamingDataset(
+        counting_source([{"text": "ab"}], []), fields=["text"]
+    )
+    transformed = dataset.apply_transformation(Repeat())
+    assert list(dataset.datapoints()) == [{"text": "ab"}]
+    assert list(transformed.datapoints()) == [
+        {"text": "ab"},
+        {"text": "abab"},
+    ]
+
+
+def test_streaming_from_files_to_jsonl(tmp_path):
+    text_file = tmp_path / "input.txt"
+    text_file.write_text("a\nbcd\nef\n", encoding="utf-8")
+    output = tmp_path / "output.jsonl"
+    dataset = StreamingDataset.from_text_file(str(text_file), chunk_size=2)
+    assert dataset.apply_filter(Short()).write_jsonl(str(output)) == 2
+    reloaded = StreamingDataset.from_jsonl(
+        str(output), dataset.task_type, ["text"], max_size=1
+    )
+    assert reloaded.to_key_value_dataset().data == [{"text": "a"}]
+    with pytest.raises(TypeError):
+        len(reloaded)
+    assert [json.loads(line) for line in output.open()] == [
+        {"text": "a"},
+        {"text": "ef"},
+    ]
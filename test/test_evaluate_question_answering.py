@@ -0,0 +1,73 @@
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from transformers import PreTrainedTokenizerFast
+
+from evaluation.evaluate_question_answering import predict_answers
+
+WORDS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + (
+    "who wrote it the author wrote the book question context".split()
+)
+
+
+def make_tokenizer():
+    vocab = {word: i for i, word in enumerate(dict.fromkeys(WORDS))}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+        special_tokens=[("[CLS]", vocab["[CLS]"]), ("[SEP]", vocab["[SEP]"])],
+    )
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        pad_token="[PAD]",
+        unk_token="[UNK]",
+        cls_token="[CLS]",
+        sep_token="[SEP]",
+    )
+
+
+class Outputs:
+    def __init__(self, start_logits, end_logits):
+        self.start_logits = start_logits
+        self.end_logits = end_logits
+
+
+class Model:
+    """Points at the tokens of "author"."""
+
+    device = "cpu"
+
+    def __init__(self, tokenizer):
+        self.author = tokenizer.convert_tokens_to_ids("author")
+
+    def eval(self):
+        pass
+
+    def __call__(self, input_ids, **kwargs):
+        logits = (input_ids == self.author).float() * 10
+        return Outputs(logits, logits)
+
+
+def test_answers_are_extracted_from_the_context():
+    tokenizer = make_tokenizer()
+    answers = predict_answers(
+        Model(tokenizer),
+        tokenizer,
+        [("the author wrote the book", "who wrote it")],
+    )
+    assert answers == ["author"]
+
+
+def test_empty_contexts_get_empty_answers():
+    tokenizer = make_tokenizer()
+    examples = [
+        ("", "who wrote it"),
+        ("   ", "who wrote it"),
+        ("the author wrote the book", "who wrote it"),
+    ]
+    assert predict_answers(Model(tokenizer), tokenizer, examples) == [
+        "",
+        "",
+        "author",
+    ]
+    assert predict_answers(Model(tokenizer), tokenizer, examples[:1]) == [""]
@@ -0,0 +1,63 @@
+import pytest
+
+from dataset import KeyValueDataset
+from evaluation import evaluate_text_generation
+from evaluation.evaluation_engine import make_perturbed_sets
+from interfaces.SentenceOperation import SentenceOperation
+from result_cache import get_result_cache
+from tasks.TaskTypes import TaskType
+
+generated = []
+
+
+class Shout(SentenceOperation):
+    tasks = [TaskType.TEXT_TO_TEXT_GENERATION]
+
+    def generate(self, sentence: str):
+        generated.append(sentence)
+        return [sentence.upper()]
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    dataset = KeyValueDataset(
+        [{"document": "a text", "summary": "text"}],
+        TaskType.TEXT_TO_TEXT_GENERATION,
+        ["document", "summary"],
+    )
+    loads = []
+
+    def load(dataset_name, split):
+        loads.append((dataset_name, split))
+        return dataset
+
+    monkeypatch.setattr(evaluate_text_generation, "_load", load)
+    generated.clear()
+    return dataset, loads
+
+
+def test_evaluations_reuse_the_perturbed_sets_made_beforehand(
+    documents, tmp_path
+):
+    dataset, loads = documents
+    cache_dir = str(tmp_path)
+    assert make_perturbed_sets(
+        Shout, "TEXT_TO_TEXT_GENERATION", "xsum", 20, cache_dir
+    )
+    assert loads == [("xsum", "test[:20%]")]
+    assert generated == ["a text"]
+    # what evaluate_operations asks for, in another run of the same operation
+    (pt_dataset,) = evaluate_text_generation._perturbed_datasets(
+        get_result_cache(cache_dir),
+        dataset,
+        "xsum",
+        "test[:20%]",
+        [Shout()],
+    )
+    assert generated == ["a text"]
+    assert pt_dataset.data == [{"document": "A TEXT", "summary": "text"}]
+
+
+def test_no_perturbed_sets_without_an_evaluation(documents):
+    assert not make_perturbed_sets(Shout, "QUESTION_ANSWERING", "squad")
+    assert generated == []
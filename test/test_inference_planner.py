@@ -0,0 +1,61 @@
+from evaluation.inference_planner import (
+    plan_inference,
+    predict_perturbed,
+    predict_perturbed_union,
+)
+
+BASELINE = ["a", "b", "c"]
+PREDICTIONS = ["A", "B", "C"]
+
+
+class Model:
+    def __init__(self):
+        self.inputs = []
+
+    def __call__(self, inputs):
+        self.inputs.extend(inputs)
+        return [model_input.upper() for model_input in inputs]
+
+
+def test_plan_reuses_the_baseline_and_predicts_the_new_inputs_once():
+    plan = plan_inference(
+        ["a", "x", "c", "x", "y"], [0, 1, 1, None, 2], BASELINE
+    )
+    # "c" comes from "b" but is another original example
+    assert plan["baseline"] == {0: 0, 2: 2}
+    assert plan["to_predict"] == ["x", "y"]
+    assert plan["positions"] == {1: 0, 3: 0, 4: 1}
+
+
+def test_unhashable_inputs_are_planned():
+    plan = plan_inference([["a"], ["x"], ["x"]], None, [["a"]])
+    assert plan["baseline"] == {0: 0}
+    assert plan["to_predict"] == [["x"]]
+
+
+def test_predictions_follow_the_inputs():
+    model = Model()
+    predictions = predict_perturbed(
+        ["x", "a", "x", "b"], [0, 0, 1, 1], BASELINE, PREDICTIONS, model
+    )
+    assert predictions == ["X", "A", "X", "B"]
+    assert model.inputs == ["x"]
+
+
+def test_the_model_is_not_called_without_new_inputs():
+    model = Model()
+    assert predict_perturbed(["b"], [1], BASELINE, PREDICTIONS, model) == ["B"]
+    assert model.inputs == []
+
+
+def test_union_is_split_back_by_operation():
+    model = Model()
+    results = predict_perturbed_union(
+        [(["x", "a"], [0, 0]), ([], []), (["y", "x", "c"], None)],
+        BASELINE,
+        PREDICTIONS,
+        model,
+    )
+    assert results == [["X", "A"], [], ["Y", "X", "C"]]
+    # an input produced by several operations is predicted once
+    assert model.inputs == ["x", "y"]
@@ -0,0 +1,222 @@
+import pickle
+import threading
+
+import pytest
+import spacy
+import torch
+
+import initialize
+from initialize import (
+    LazyModel,
+    ModelRegistry,
+    SpacyDocCache,
+    load_model,
+    load_pretrained,
+)
+
+# 4 KB of weights
+MODEL_BYTES = 32 * 32 * 4
+
+
+def make_model():
+    return torch.nn.Linear(32, 32, bias=False)
+
+
+def key(name, options="[]"):
+    return (name, "torch.nn.Linear", "None", "None", options)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ModelRegistry()
+    monkeypatch.setattr(initialize, "model_registry", registry)
+    return registry
+
+
+class Loader:
+    def __init__(self):
+        self.loads = 0
+
+    def __call__(self):
+        self.loads += 1
+        return make_model()
+
+
+class Owner:
+    pass
+
+
+def loaded(registry):
+    return [
+        model["name"]
+        for model in registry.stats()["models"]
+        if model["loaded"]
+    ]
+
+
+def test_objects_are_loaded_once(registry):
+    loader = Loader()
+    assert registry.get(key("a"), loader) is registry.get(key("a"), loader)
+    assert loader.loads == 1
+    assert registry.stats()["memory_bytes"] == MODEL_BYTES
+
+
+def test_least_recently_used_models_are_evicted(registry):
+    registry.set_memory_budget(2 * MODEL_BYTES)
+    loaders = {name: Loader() for name in "abc"}
+    registry.get(key("a"), loaders["a"])
+    registry.get(key("b"), loaders["b"])
+    registry.get(key("a"), loaders["a"])
+    registry.get(key("c"), loaders["c"])
+    assert loaded(registry) == ["a", "c"]
+    assert registry.stats()["evictions"] == 1
+    # an evicted model is loaded again when it is needed
+    registry.get(key("b"), loaders["b"])
+    assert loaders["b"].loads == 2
+
+
+def test_unreferenced_models_are_evicted_first(registry):
+    registry.set_memory_budget(2 * MODEL_BYTES)
+    owner = Owner()
+    registry.acquire(key("held"), Loader(), owner)
+    registry.get(key("cached"), Loader())
+    registry.get(key("new"), Loader())
+    assert loaded(registry) == ["held", "new"]
+
+
+def test_models_in_use_are_not_evicted(registry, capsys):
+    registry.set_memory_budget(MODEL_BYTES)
+    with registry.using(key("a"), Loader()):
+        registry.get(key("b"), Loader())
+        assert loaded(registry) == ["a", "b"]
+    assert "more than the memory budget" in capsys.readouterr().out
+    registry.get(key("c"), Loader())
+    assert loaded(registry) == ["c"]
+
+
+def test_release_owner_unloads_what_nobody_holds(registry):
+    first, second = Owner(), Owner()
+    registry.acquire(key("shared"), Loader(), first)
+    registry.acquire(key("shared"), Loader(), second)
+    registry.acquire(key("own"), Loader(), first)
+    registry.release_owner(first)
+    assert loaded(registry) == ["shared"]
+
+
+def test_lazy_models_load_on_first_use_and_after_eviction(registry):
+    loader = Loader()
+    model = LazyModel(key("a"), loader)
+    assert loader.loads == 0
+    assert model(torch.ones(1, 32)).shape == (1, 32)
+    registry.set_memory_budget(0)
+    assert loaded(registry) == []
+    assert model.weight.shape == (32, 32)
+    assert loader.loads == 2
+
+
+def test_lazy_models_are_not_evicted_during_a_call(registry):
+    registry.set_memory_budget(MODEL_BYTES)
+    started, resume = threading.Event(), threading.Event()
+
+    class Slow(torch.nn.Linear):
+        def forward(self, x):
+            started.set()
+            resume.wait(10)
+            return super().forward(x)
+
+    slow = LazyModel(key("slow"), lambda: Slow(32, 32, bias=False))
+    thread = threading.Thread(target=slow, args=(torch.ones(1, 32),))
+    thread.start()
+    started.wait(10)
+    registry.get(key("other"), Loader())
+    assert "slow" in loaded(registry)
+    resume.set()
+    thread.join()
+
+
+def test_lazy_models_can_be_pickled(registry):
+    model = LazyModel(key("a"), make_model)
+    copy = pickle.loads(pickle.dumps(model))
+    assert copy.weight.shape == (32, 32)
+
+
+def test_load_options_are_part_of_the_key(registry):
+    first = load_pretrained(torch.nn.Linear, "model", revision="a")
+    second = load_pretrained(torch.nn.Linear, "model", revision="b")
+    same = load_pretrained(torch.nn.Linear, "model", revision="a")
+    assert first._key != second._key
+    assert first._key == same._key
+
+
+class Predictor:
+    """Keeps its model in _model, like the AllenNLP predictors."""
+
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self._model = make_model()
+
+    @classmethod
+    def from_path(cls, archive_path):
+        return cls(archive_path)
+
+    def predict(self, text):
+        return text.upper()
+
+
+def test_custom_loads_are_shared_measured_and_lazy(registry):
+    first = load_model("model", Predictor.from_path, archive_path="a")
+    same = load_model("model", Predictor.from_path, archive_path="a")
+    other = load_model("model", Predictor.from_path, archive_path="b")
+    assert first._key == same._key != other._key
+    assert loaded(registry) == []
+    assert first.predict("text") == "TEXT"
+    assert first.archive_path == "a"
+    assert registry.stats()["memory_bytes"] == MODEL_BYTES
+    copy = pickle.loads(pickle.dumps(first))
+    assert copy.archive_path == "a"
+
+
+@pytest.fixture
+def doc_cache():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    return SpacyDocCache(nlp, max_size=3)
+
+
+def test_docs_are_parsed_once(doc_cache):
+    doc = doc_cache("A sentence. Another one.")
+    assert doc_cache("A sentence. Another one.") is doc
+    assert len(list(doc.sents)) == 2
+    assert (doc_cache.hits, doc_cache.misses) == (1, 1)
+
+
+def test_docs_of_the_full_pipeline_serve_the_partial_ones(doc_cache):
+    doc = doc_cache("text")
+    assert doc_cache("text", disable=["sentencizer"]) is doc
+    partial = doc_cache("other", disable=["sentencizer"])
+    assert doc_cache("other") is not partial
+
+
+def test_pipe_only_parses_the_misses_once(doc_cache):
+    first = doc_cache("a")
+    docs = doc_cache.pipe(["a", "b", "b", "c"])
+    assert docs[0] is first and docs[1] is docs[2]
+    assert [doc.text for doc in docs] == ["a", "b", "b", "c"]
+    assert (doc_cache.hits, doc_cache.misses) == (2, 3)
+
+
+def test_least_recently_used_docs_are_evicted(doc_cache):
+    docs = doc_cache.pipe(["a", "b", "c"])
+    doc_cache("a")
+    doc_cache("d")
+    assert doc_cache("a") is docs[0]
+    assert doc_cache("b") is not docs[1]
+
+
+def test_doc_caches_are_pickled_empty(doc_cache):
+    doc_cache("text")
+    copy = pickle.loads(pickle.dumps(doc_cache))
+    assert copy.pipe_names == ["sentencizer"]
+    misses = copy.misses
+    assert copy("text") is not doc_cache("text")
+    assert copy.misses == misses + 1
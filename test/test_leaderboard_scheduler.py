@@ -0,0 +1,164 @@
+import json
+import os
+
+from evaluation import leaderboard_scheduler
+from evaluation.leaderboard_scheduler import (
+    Cell,
+    LeaderboardStore,
+    code_hash,
+    pending_cells,
+    plan,
+    run_cells,
+)
+from TestRunner import OperationInfo
+
+
+def make_cell(name, model_name="model", heavy=False):
+    info = OperationInfo(
+        name,
+        "transformations.butter_fingers_perturbation",
+        "SentenceOperation",
+        heavy=heavy,
+    )
+    return Cell(info, model_name, "dataset", "TEXT_CLASSIFICATION", "20")
+
+
+def test_pending_cells_skip_the_up_to_date_ones(tmp_path):
+    store = LeaderboardStore(str(tmp_path / "cells.sqlite"))
+    done, failed, outdated, new = [make_cell(f"Op{i}") for i in range(4)]
+    hashes = {f"Op{i}": "current" for i in range(4)}
+    store.save(done, "current", "done", {"accuracy": 1}, None, 1.0)
+    store.save(failed, "current", "failed", None, "error", 1.0)
+    store.save(outdated, "previous", "done", {"accuracy": 1}, None, 1.0)
+    assert pending_cells([done, failed, outdated, new], store, hashes) == [
+        failed,
+        outdated,
+        new,
+    ]
+
+
+def test_run_cells_resumes_where_it_stopped(tmp_path, monkeypatch):
+    store = LeaderboardStore(str(tmp_path / "cells.sqlite"))
+    ran = []
+
+    def execute_model(implementation, model_name, **kwargs):
+        ran.append(model_name)
+        if model_name == "broken":
+            raise RuntimeError("the model failed")
+        return {"accuracy": 1}
+
+    monkeypatch.setattr(leaderboard_scheduler, "execute_model", execute_model)
+    monkeypatch.setattr(
+        leaderboard_scheduler, "make_perturbed_sets", lambda *a, **k: True
+    )
+    monkeypatch.setattr(OperationInfo, "load", lambda self: None)
+    cells = [make_cell("Op", "good"), make_cell("Op", "broken")]
+    assert run_cells(cells, store) == (1, 1)
+    assert sorted(ran) == ["broken", "good"]
+    # only the failed cell runs again
+    assert run_cells(cells, store) == (0, 1)
+    assert sorted(ran) == ["broken", "broken", "good"]
+
+
+def test_costs_only_count_the_successful_cells(tmp_path):
+    store = LeaderboardStore(str(tmp_path / "cells.sqlite"))
+    store.save(make_cell("Op", "a"), "hash", "done", {}, None, 10.0)
+    store.save(make_cell("Op", "b"), "hash", "failed", None, "error", 0.1)
+    assert store.costs() == {"Op": 10.0}
+
+
+def test_plan_runs_the_most_expensive_groups_first():
+    cells = [
+        make_cell("Cheap", "a"),
+        make_cell("Expensive", "b"),
+        make_cell("Cheap", "b"),
+        make_cell("New", "a", heavy=True),
+    ]
+    groups = plan(cells, {"Cheap": 1.0, "Expensive": 5.0})
+    assert [[cell.model_name for cell in group] for group in groups] == [
+        ["a", "a"],
+        ["b", "b"],
+    ]
+    # a heavy transformation which never ran counts as the most expensive one
+    assert [cell.transformation.name for cell in groups[0]] == [
+        "New",
+        "Cheap",
+    ]
+
+
+def test_code_hash_covers_the_shared_modules(tmp_path, monkeypatch):
+    info = make_cell("Op").transformation
+    before = code_hash(info)
+    shared = tmp_path / "shared.py"
+    shared.write_text("VALUE = 1\n")
+    monkeypatch.setattr(leaderboard_scheduler, "ROOT_DIR", str(tmp_path))
+    package = tmp_path / "transformations" / "butter_fingers_perturbation"
+    package.mkdir(parents=True)
+    first = code_hash(info)
+    shared.write_text("VALUE = 2\n")
+    assert code_hash(info) != first
+    assert before != first
+
+
+def record_calls(monkeypatch, log):
+    # the calls of every process, in order, in a file
+    def record(kind, name, model_name, cache_dir):
+        with open(log, "a") as f:
+            f.write(json.dumps([kind, name, model_name, cache_dir]) + "\n")
+
+    def make_perturbed_sets(implementation, task_type, **kwargs):
+        record("perturb", implementation, None, kwargs["cache_dir"])
+        return True
+
+    def execute_model(implementation, model_name, cache_dir, **kwargs):
+        record("evaluate", implementation, model_name, cache_dir)
+        return {"accuracy": 1}
+
+    monkeypatch.setattr(
+        leaderboard_scheduler, "make_perturbed_sets", make_perturbed_sets
+    )
+    monkeypatch.setattr(leaderboard_scheduler, "execute_model", execute_model)
+    monkeypatch.setattr(OperationInfo, "load", lambda self: self.name)
+
+
+def read_calls(log):
+    with open(log) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_perturbed_sets_are_made_once_before_the_cells(tmp_path, monkeypatch):
+    log = str(tmp_path / "calls.jsonl")
+    record_calls(monkeypatch, log)
+    store = LeaderboardStore(str(tmp_path / "cells.sqlite"))
+    cells = [
+        make_cell(name, model_name)
+        for name in ["Light", "Heavy"]
+        for model_name in ["a", "b"]
+    ]
+    assert run_cells(cells, store) == (4, 0)
+    calls = read_calls(log)
+    assert [call[:2] for call in calls[:2]] == [
+        ["perturb", "Light"],
+        ["perturb", "Heavy"],
+    ]
+    assert [call[0] for call in calls[2:]] == ["evaluate"] * 4
+
+
+def test_workers_share_the_perturbed_sets_on_disk(tmp_path, monkeypatch):
+    log = str(tmp_path / "calls.jsonl")
+    record_calls(monkeypatch, log)
+    store = LeaderboardStore(str(tmp_path / "cells.sqlite"))
+    cells = [
+        make_cell(name, model_name, heavy=name == "Heavy")
+        for name in ["Light", "Heavy"]
+        for model_name in ["a", "b", "c"]
+    ]
+    assert run_cells(cells, store, num_workers=2) == (6, 0)
+    calls = read_calls(log)
+    perturbed = [call[1] for call in calls if call[0] == "perturb"]
+    assert sorted(perturbed) == ["Heavy", "Light"]
+    # every process used the same temporary cache, removed at the end
+    cache_dirs = {call[3] for call in calls}
+    assert len(cache_dirs) == 1 and None not in cache_dirs
+    assert not os.path.exists(cache_dirs.pop())
+    assert [call[0] for call in calls[:2]] == ["perturb", "perturb"]
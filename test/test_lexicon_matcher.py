@@ -0,0 +1,79 @@
+import random
+import re
+
+import pytest
+
+from lexicon_matcher import LexiconMatcher
+
+LEXICON = ["can't", "can", "cannot", "not", "i'm", "I am", "a", "an", "and"]
+TEXTS = [
+    "I can't and I cannot, an ant can not.",
+    "Cannot: CAN'T! i'm sure I am, candy is not a_n answer.",
+    "",
+    "nothing matches here",
+]
+
+
+def regex_matches(lexicon, text, flags=0):
+    # a regex alternation picks the first entry matching at the leftmost position
+    pattern = re.compile(
+        r"\b(?:{})(?!\w)".format("|".join(map(re.escape, lexicon))),
+        flags,
+    )
+    return [(m.start(), m.end(), m.group(0)) for m in pattern.finditer(text)]
+
+
+def matched_text(matches, text):
+    return [(start, end, text[start:end]) for start, end, _ in matches]
+
+
+def random_texts(count=200):
+    rng = random.Random(0)
+    words = LEXICON + ["candy", "ant", "Can", "NOT", "x", "", "'", ","]
+    return [
+        " ".join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize("ignore_case", [False, True])
+def test_first_matches_are_the_regex_ones(ignore_case):
+    matcher = LexiconMatcher(LEXICON, ignore_case=ignore_case)
+    flags = re.IGNORECASE if ignore_case else 0
+    for text in TEXTS + random_texts():
+        assert matched_text(
+            matcher.find(text, longest=False), text
+        ) == regex_matches(LEXICON, text, flags)
+
+
+def test_longest_matches_are_the_regex_ones_by_decreasing_length():
+    matcher = LexiconMatcher(LEXICON)
+    by_length = sorted(LEXICON, key=len, reverse=True)
+    for text in TEXTS + random_texts():
+        assert matched_text(matcher.find(text), text) == regex_matches(
+            by_length, text
+        )
+
+
+def test_sub_is_the_regex_sub():
+    matcher = LexiconMatcher(LEXICON, ignore_case=True)
+    pattern = re.compile(
+        r"\b(?:{})(?!\w)".format("|".join(map(re.escape, LEXICON))),
+        re.IGNORECASE,
+    )
+    for text in TEXTS + random_texts():
+        assert matcher.sub(
+            lambda match, _: match.upper(), text, longest=False
+        ) == pattern.sub(lambda match: match.group(0).upper(), text)
+
+
+def test_entries_are_reported_as_given():
+    matcher = LexiconMatcher(["Can't"], ignore_case=True)
+    assert matcher.find("I CAN'T") == [(2, 7, "Can't")]
+    assert matcher.count("can't or can't") == {"Can't": 2}
+    assert not matcher.contains("cant")
+
+
+def test_space_boundaries():
+    matcher = LexiconMatcher(["a b"], boundary="space")
+    assert matcher.find("a b a b, xa b") == [(0, 3, "a b")]
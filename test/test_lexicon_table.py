@@ -0,0 +1,84 @@
+import pickle
+
+import pytest
+
+from transformations.multilingual_lexicon_perturbation import lexicon_table
+from transformations.multilingual_lexicon_perturbation.lexicon_table import (
+    LexiconTable,
+    load_lexicon_table,
+)
+
+TRANSLATIONS = {
+    "hello": "bonjour",
+    "école": "school",
+    "zebra": "zèbre",
+    "日本": "japan",
+    "a": "",
+}
+
+
+def test_translations_round_trip():
+    table = LexiconTable(LexiconTable.build(TRANSLATIONS, (1, 2)))
+    assert len(table) == len(TRANSLATIONS)
+    assert table.source_stamp == (1, 2)
+    for word, translation in TRANSLATIONS.items():
+        assert word in table
+        assert table.get(word) == translation
+    for word in ["", "b", "hell", "helloo", "zz", "Hello"]:
+        assert word not in table
+        assert table.get(word, "missing") == "missing"
+
+
+def test_empty_table():
+    table = LexiconTable(LexiconTable.build({}))
+    assert len(table) == 0
+    assert table.get("word") is None
+
+
+def test_other_bytes_are_rejected():
+    with pytest.raises(ValueError):
+        LexiconTable(b"\0" * 64)
+
+
+def test_tables_can_be_pickled():
+    table = LexiconTable(LexiconTable.build(TRANSLATIONS))
+    assert pickle.loads(pickle.dumps(table)).get("école") == "school"
+
+
+@pytest.fixture
+def lexicon(tmp_path, monkeypatch):
+    source = tmp_path / "lexicon.xz"
+    source.write_bytes(b"lexicon")
+    built = []
+
+    def translations(src_lang, tgt_lang):
+        built.append((src_lang, tgt_lang))
+        return TRANSLATIONS
+
+    monkeypatch.setattr(lexicon_table, "LEXICON_PATH", str(source))
+    monkeypatch.setattr(lexicon_table, "TABLE_DIR", str(tmp_path / "tables"))
+    monkeypatch.setattr(lexicon_table, "_translations", translations)
+    monkeypatch.setattr(lexicon_table, "_tables", {})
+    return source, built
+
+
+def test_tables_are_built_once_and_saved(lexicon):
+    source, built = lexicon
+    table = load_lexicon_table("en", "fr")
+    assert load_lexicon_table("en", "fr") is table
+    assert built == [("en", "fr")]
+    # a new run maps the saved table
+    lexicon_table._tables.clear()
+    saved = load_lexicon_table("en", "fr")
+    assert built == [("en", "fr")]
+    assert saved.get("zebra") == "zèbre"
+    assert pickle.loads(pickle.dumps(saved)) is saved
+
+
+def test_tables_are_built_again_when_the_lexicon_changes(lexicon):
+    source, built = lexicon
+    load_lexicon_table("en", "fr")
+    source.write_bytes(b"another lexicon")
+    lexicon_table._tables.clear()
+    load_lexicon_table("en", "fr")
+    assert built == [("en", "fr"), ("en", "fr")]
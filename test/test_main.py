@@ -98,7 +98,7 @@ def execute_tagging_test_case(transformation, test):
 def execute_test_case_for_transformation(transformation_name):
     print(f"Executing test cases for {transformation_name}")
     tx = OperationRuns(transformation_name)
-    for transformation, test in zip(tx.operations, tx.operation_test_cases):
+    for transformation, test in tx:
         if isinstance(transformation, SentenceOperation):
             execute_sentence_operation_test_case(transformation, test)
         elif isinstance(transformation, SentencePairOperation):
@@ -116,7 +116,7 @@ def execute_test_case_for_transformation(transformation_name):
 def execute_test_case_for_filter(filter_name):
     print(f"Executing test cases for {filter_name}")
     tx = OperationRuns(filter_name, "filters")
-    for filter, test in zip(tx.operations, tx.operation_test_cases):
+    for filter, test in tx:
         filter_args = test["inputs"]
         output = filter.filter(**filter_args)
         assert (
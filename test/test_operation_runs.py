@@ -0,0 +1,17 @@
+from TestRunner import OperationRuns
+
+
+def test_operations_are_kept_without_a_report(capsys):
+    runs = OperationRuns("butter_fingers_perturbation")
+    operations = runs.operations
+    assert len(operations) == len(runs.operation_test_cases)
+    # consecutive test cases with the same args share an instance
+    assert len(set(map(id, operations))) == len(runs.load_times)
+    assert capsys.readouterr().out == ""
+
+
+def test_iterating_reports_the_load_times(capsys):
+    runs = OperationRuns("butter_fingers_perturbation")
+    pairs = list(runs)
+    assert [test_case for _, test_case in pairs] == runs.operation_test_cases
+    assert "Loaded" in capsys.readouterr().out
@@ -0,0 +1,119 @@
+import pytest
+import spacy
+
+import initialize
+from dataset import TextLineDataset
+from initialize import SpacyDocCache
+from interfaces.SentenceOperation import SentenceOperation
+from result_cache import ResultCache, cache_operation, operation_identity
+
+
+class CountingFilter(SentenceOperation):
+    def __init__(self, seed=0, min_length=2):
+        super().__init__(seed)
+        self.min_length = min_length
+        self.calls = 0
+
+    def filter(self, sentence: str) -> bool:
+        self.calls += 1
+        return len(sentence.split()) >= self.min_length
+
+
+class DocLengthFilter(CountingFilter):
+    def filter_from_doc(self, doc) -> bool:
+        self.calls += 1
+        return len(doc) >= self.min_length
+
+
+@pytest.fixture
+def blank_doc_cache(monkeypatch):
+    doc_cache = SpacyDocCache(spacy.blank("en"))
+    monkeypatch.setattr(initialize, "spacy_doc_cache", doc_cache)
+    return doc_cache
+
+
+def test_hits_and_misses():
+    cache = ResultCache(None)
+    cache.set_many({"a": [1, 2], "b": "text"})
+    found = cache.get_many(["a", "b", "c"])
+    assert found == {"a": [1, 2], "b": "text"}
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_eviction_of_the_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.max_size = 2000
+    for i in range(10):
+        cache.set_many({f"old{i}": "x" * 100})
+    # reading the first result makes it the most recently used one
+    cache.get_many(["old0"])
+    for i in range(10):
+        cache.set_many({f"new{i}": "x" * 100})
+    assert cache.size() <= cache.max_size
+    found = cache.get_many([f"old{i}" for i in range(10)])
+    assert "old0" in found and "old1" not in found
+    assert len(cache.get_many([f"new{i}" for i in range(10)])) == 10
+
+
+def test_size_follows_replaced_results(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.set_many({"a": "x" * 1000})
+    size = cache.size()
+    cache.set_many({"a": "x" * 10})
+    assert cache.size() < size
+    # the running total is kept in the file
+    assert ResultCache(str(tmp_path)).size() == cache.size()
+    cache.clear()
+    assert cache.size() == 0
+
+
+def test_memoized_batches_only_compute_the_misses():
+    operation = cache_operation(CountingFilter(), ResultCache(None))
+    sentences = ["a b", "c", "d e f"]
+    assert operation.filter_batch(sentences) == [True, False, True]
+    assert operation.calls == 3
+    assert operation.filter_batch(sentences + ["g h"]) == [
+        True,
+        False,
+        True,
+        True,
+    ]
+    assert operation.calls == 4
+    assert operation.filter("c") is False
+    assert operation.calls == 4
+
+
+def test_filters_on_docs_are_served_from_the_cache(blank_doc_cache):
+    cache = ResultCache(None)
+    operation = cache_operation(DocLengthFilter(), cache)
+    dataset = TextLineDataset(["a b", "c", "d e f", "g"], [0, 1, 0, 1])
+    filtered = dataset.apply_filter(operation)
+    assert filtered.data == ["a b", "d e f"]
+    assert operation.calls == 4
+    parsed = blank_doc_cache.misses
+    hits = cache.hits
+    assert dataset.apply_filter(operation).data == filtered.data
+    # neither filtered nor parsed again
+    assert operation.calls == 4
+    assert blank_doc_cache.misses == parsed
+    assert cache.hits == hits + 4
+
+
+def test_identity_depends_on_the_arguments():
+    assert operation_identity(CountingFilter()) == operation_identity(
+        CountingFilter()
+    )
+    assert operation_identity(CountingFilter()) != operation_identity(
+        CountingFilter(min_length=3)
+    )
+    operation = CountingFilter()
+    operation.per_example_seed = True
+    assert operation_identity(operation) != operation_identity(
+        CountingFilter()
+    )
+
+
+def test_identity_rejects_arguments_without_a_stable_repr():
+    with pytest.raises(TypeError):
+        operation_identity(CountingFilter(min_length=object()))
@@ -1,5 +1,11 @@
+import queue
+import threading
+import time
+from typing import List
+
 from transformers import FSMTForConditionalGeneration, FSMTTokenizer
 
+from initialize import load_pretrained
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
@@ -9,24 +15,37 @@ class BackTranslation(SentenceOperation):
     languages = ["en"]
     heavy = True
 
-    def __init__(self, seed=0, max_outputs=1, num_beams=2):
+    def __init__(
+        self, seed=0, max_outputs=1, num_beams=2, batch_size=16, queue_size=2
+    ):
         super().__init__(seed, max_outputs=max_outputs)
         if self.verbose:
             print("Starting to load English to German Translation Model.\n")
         name_en_de = "facebook/wmt19-en-de"
-        self.tokenizer_en_de = FSMTTokenizer.from_pretrained(name_en_de)
-        self.model_en_de = FSMTForConditionalGeneration.from_pretrained(
-            name_en_de
+        # the models are shared with the other operations using them
+        self.tokenizer_en_de = load_pretrained(
+            FSMTTokenizer, name_en_de, owner=self
+        )
+        self.model_en_de = load_pretrained(
+            FSMTForConditionalGeneration, name_en_de, owner=self
         )
         if self.verbose:
             print("Completed loading English to German Translation Model.\n")
             print("Starting to load German to English Translation Model:")
         name_de_en = "facebook/wmt19-de-en"
-        self.tokenizer_de_en = FSMTTokenizer.from_pretrained(name_de_en)
-        self.model_de_en = FSMTForConditionalGeneration.from_pretrained(
-            name_de_en
+        self.tokenizer_de_en = load_pretrained(
+            FSMTTokenizer, name_de_en, owner=self
+        )
+        self.model_de_en = load_pretrained(
+            FSMTForConditionalGeneration, name_de_en, owner=self
         )
         self.num_beams = num_beams
+        # generate_batch: sentences per batch, and batches translated to German ahead of the
+        # German to English model
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        # throughput of the stages of the last generate_batch
+        self.stats = {}
         if self.verbose:
             print("Completed loading German to English Translation Model.\n")
 
@@ -54,7 +73,8 @@ class BackTranslation(SentenceOperation):
         outputs = self.model_de_en.generate(
             input_ids,
             num_return_sequences=self.max_outputs,
-            num_beams=self.num_beams,
+            # every returned sequence needs its own beam
+            num_beams=max(self.num_beams, self.max_outputs),
         )
         predicted_outputs = []
         for output in outputs:
@@ -67,6 +87,152 @@ class BackTranslation(SentenceOperation):
             print(predicted_outputs)  # Machine learning is great, isn't it?
         return predicted_outputs
 
+    def en2de_batch(self, inputs: List[str]) -> List[str]:
+        encoded = self.tokenizer_en_de(
+            inputs, return_tensors="pt", padding=True
+        )
+        outputs = self.model_en_de.generate(**encoded)
+        return self.tokenizer_en_de.batch_decode(
+            outputs, skip_special_tokens=True
+        )
+
+    def de2en_batch(self, inputs: List[str]) -> List[List[str]]:
+        encoded = self.tokenizer_de_en(
+            inputs, return_tensors="pt", padding=True
+        )
+        outputs = self.model_de_en.generate(
+            **encoded,
+            num_return_sequences=self.max_outputs,
+            # every returned sequence needs its own beam
+            num_beams=max(self.num_beams, self.max_outputs),
+        )
+        decoded = self.tokenizer_de_en.batch_decode(
+            outputs, skip_special_tokens=True
+        )
+        # generate returns the max_outputs sequences of each input next to each other
+        return [
+            decoded[i : i + self.max_outputs]
+            for i in range(0, len(decoded), self.max_outputs)
+        ]
+
     def generate(self, sentence: str):
         perturbs = self.back_translate(sentence)
         return perturbs
+
+    def _translate_bucket(self, translate_batch, inputs):
+        # a failing batch is translated again one input at a time, so that only the inputs
+        # which fail get None
+        if not inputs:
+            return []
+        try:
+            return translate_batch(inputs)
+        except Exception:
+            outputs = []
+            for text in inputs:
+                try:
+                    outputs.append(translate_batch([text])[0])
+                except Exception:
+                    outputs.append(None)
+            return outputs
+
+    @staticmethod
+    def _put(buckets, item, stop):
+        # gives up once the consumer has stopped, instead of blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                buckets.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _en2de_stage(self, sentences, order, buckets, stage, stop):
+        try:
+            for start in range(0, len(order), self.batch_size):
+                if stop.is_set():
+                    break
+                bucket = order[start : start + self.batch_size]
+                begin = time.perf_counter()
+                german = self._translate_bucket(
+                    self.en2de_batch,
+                    [sentences[i] for i in bucket],
+                )
+                stage["seconds"] += time.perf_counter() - begin
+                stage["sentences"] += len(bucket)
+                self._put(buckets, (bucket, german), stop)
+        except BaseException as e:
+            stage["error"] = e
+        finally:
+            self._put(buckets, None, stop)
+
+    def generate_batch(self, sentences: List[str]):
+        """
+        Back translates the sentences with padded batches of batch_size sentences of similar
+        lengths. The English to German model runs in a thread, a few batches ahead of the
+        German to English model, so that both models work at the same time. A sentence which
+        can't be translated is returned as it is.
+        """
+        start_time = time.perf_counter()
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        en_de = {"sentences": 0, "seconds": 0.0}
+        de_en = {"sentences": 0, "seconds": 0.0}
+        buckets = queue.Queue(maxsize=max(self.queue_size, 1))
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._en2de_stage,
+            args=(sentences, order, buckets, en_de, stop),
+            daemon=True,
+        )
+        producer.start()
+        outputs = [None] * len(sentences)
+        try:
+            while True:
+                item = buckets.get()
+                if item is None:
+                    break
+                bucket, german = item
+                translated = [
+                    i for i, de in zip(bucket, german) if de is not None
+                ]
+                begin = time.perf_counter()
+                english = self._translate_bucket(
+                    self.de2en_batch,
+                    [de for de in german if de is not None],
+                )
+                de_en["seconds"] += time.perf_counter() - begin
+                de_en["sentences"] += len(translated)
+                for i, en in zip(translated, english):
+                    outputs[i] = en
+        finally:
+            # the producer stops after its current bucket if this loop raised
+            stop.set()
+            producer.join()
+        if "error" in en_de:
+            raise en_de.pop("error")
+        failed = 0
+        for i, sentence in enumerate(sentences):
+            if outputs[i] is None:
+                failed += 1
+                outputs[i] = [sentence]
+        for stage in (en_de, de_en):
+            stage["sentences_per_second"] = (
+                stage["sentences"] / stage["seconds"]
+                if stage["seconds"]
+                else 0.0
+            )
+        elapsed = time.perf_counter() - start_time
+        self.stats = {
+            "en_de": en_de,
+            "de_en": de_en,
+            "failed": failed,
+            "sentences_per_second": (
+                len(sentences) / elapsed if elapsed else 0.0
+            ),
+        }
+        if self.verbose:
+            print(
+                f"Back translated {self.stats['sentences_per_second']:.2f} sentences/sec "
+                f"(en-de {en_de['sentences_per_second']:.2f}/sec, "
+                f"de-en {de_en['sentences_per_second']:.2f}/sec, "
+                f"{failed} returned as they are)"
+            )
+        return outputs
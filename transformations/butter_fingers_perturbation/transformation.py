@@ -1,6 +1,8 @@
 import itertools
 import random
+from typing import List
 
+from char_noise import CharBatch, NeighbourTable, typos
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
@@ -9,64 +11,93 @@ Base Class for implementing the different input transformations a generation sho
 """
 
 
+# neighbours of every key (itself included) for each supported keyboard layout
+KEY_APPROX = {
+    "querty": {
+        "q": "qwasedzx",
+        "w": "wqesadrfcx",
+        "e": "ewrsfdqazxcvgt",
+        "r": "retdgfwsxcvgt",
+        "t": "tryfhgedcvbnju",
+        "y": "ytugjhrfvbnji",
+        "u": "uyihkjtgbnmlo",
+        "i": "iuojlkyhnmlp",
+        "o": "oipklujm",
+        "p": "plo['ik",
+        "a": "aqszwxwdce",
+        "s": "swxadrfv",
+        "d": "decsfaqgbv",
+        "f": "fdgrvwsxyhn",
+        "g": "gtbfhedcyjn",
+        "h": "hyngjfrvkim",
+        "j": "jhknugtblom",
+        "k": "kjlinyhn",
+        "l": "lokmpujn",
+        "z": "zaxsvde",
+        "x": "xzcsdbvfrewq",
+        "c": "cxvdfzswergb",
+        "v": "vcfbgxdertyn",
+        "b": "bvnghcftyun",
+        "n": "nbmhjvgtuik",
+        "m": "mnkjloik",
+        " ": " ",
+    }
+}
+NEIGHBOUR_TABLES = {
+    keyboard: NeighbourTable(key_approx)
+    for keyboard, key_approx in KEY_APPROX.items()
+}
+
+
 def butter_finger(text, prob=0.1, keyboard="querty", seed=0, max_outputs=1):
-    random.seed(seed)
-    key_approx = {}
-
-    if keyboard == "querty":
-        key_approx["q"] = "qwasedzx"
-        key_approx["w"] = "wqesadrfcx"
-        key_approx["e"] = "ewrsfdqazxcvgt"
-        key_approx["r"] = "retdgfwsxcvgt"
-        key_approx["t"] = "tryfhgedcvbnju"
-        key_approx["y"] = "ytugjhrfvbnji"
-        key_approx["u"] = "uyihkjtgbnmlo"
-        key_approx["i"] = "iuojlkyhnmlp"
-        key_approx["o"] = "oipklujm"
-        key_approx["p"] = "plo['ik"
-
-        key_approx["a"] = "aqszwxwdce"
-        key_approx["s"] = "swxadrfv"
-        key_approx["d"] = "decsfaqgbv"
-        key_approx["f"] = "fdgrvwsxyhn"
-        key_approx["g"] = "gtbfhedcyjn"
-        key_approx["h"] = "hyngjfrvkim"
-        key_approx["j"] = "jhknugtblom"
-        key_approx["k"] = "kjlinyhn"
-        key_approx["l"] = "lokmpujn"
-
-        key_approx["z"] = "zaxsvde"
-        key_approx["x"] = "xzcsdbvfrewq"
-        key_approx["c"] = "cxvdfzswergb"
-        key_approx["v"] = "vcfbgxdertyn"
-        key_approx["b"] = "bvnghcftyun"
-        key_approx["n"] = "nbmhjvgtuik"
-        key_approx["m"] = "mnkjloik"
-        key_approx[" "] = " "
-    else:
+    rng = random.Random(seed)
+    key_approx = KEY_APPROX.get(keyboard)
+    if key_approx is None:
         print("Keyboard not supported.")
+        key_approx = {}
 
     prob_of_typo = int(prob * 100)
     perturbed_texts = []
     for _ in itertools.repeat(None, max_outputs):
-        butter_text = ""
+        butter_text = []
         for letter in text:
             lcletter = letter.lower()
-            if lcletter not in key_approx.keys():
+            if lcletter not in key_approx:
                 new_letter = lcletter
             else:
-                if random.choice(range(0, 100)) <= prob_of_typo:
-                    new_letter = random.choice(key_approx[lcletter])
+                if rng.choice(range(0, 100)) <= prob_of_typo:
+                    new_letter = rng.choice(key_approx[lcletter])
                 else:
                     new_letter = lcletter
             # go back to original case
             if not lcletter == letter:
                 new_letter = new_letter.upper()
-            butter_text += new_letter
-        perturbed_texts.append(butter_text)
+            butter_text.append(new_letter)
+        perturbed_texts.append("".join(butter_text))
     return perturbed_texts
 
 
+def butter_finger_batch(
+    texts, prob=0.1, keyboard="querty", seed=0, max_outputs=1
+):
+    """
+    Vectorized butter_finger over a batch of texts. The typos follow the same distribution,
+    but are drawn differently, so the outputs differ from those of butter_finger.
+    """
+    table = NEIGHBOUR_TABLES.get(keyboard)
+    if table is None:
+        print("Keyboard not supported.")
+        table = NeighbourTable({})
+    batch = CharBatch(texts, seed)
+    # butter_finger makes a typo when a draw in [0, 100) is <= prob_of_typo
+    prob_of_typo = (int(prob * 100) + 1) / 100
+    outputs = [
+        typos(batch, table, prob_of_typo, stream)
+        for stream in range(max_outputs)
+    ]
+    return [list(perturbed) for perturbed in zip(*outputs)]
+
+
 """
 Butter Finger implementation borrowed from https://github.com/alexyorke/butter-fingers.
 """
@@ -80,18 +111,32 @@ class ButterFingersPerturbation(SentenceOperation):
     ]
     languages = ["en"]
 
-    def __init__(self, seed=0, max_outputs=1):
+    def __init__(self, seed=0, max_outputs=1, vectorized=False):
         super().__init__(seed, max_outputs=max_outputs)
+        # vectorized: perturb the batches at once (with different random draws)
+        self.vectorized = vectorized
 
     def generate(self, sentence: str):
+        if self.vectorized:
+            return self.generate_batch([sentence])[0]
         perturbed_texts = butter_finger(
             text=sentence,
             prob=0.05,
-            seed=self.seed,
+            seed=self.example_seed(sentence),
             max_outputs=self.max_outputs,
         )
         return perturbed_texts
 
+    def generate_batch(self, sentences: List[str]) -> List[List[str]]:
+        if not self.vectorized:
+            return super().generate_batch(sentences)
+        return butter_finger_batch(
+            sentences,
+            prob=0.05,
+            seed=self.seed,
+            max_outputs=self.max_outputs,
+        )
+
 
 """
 # Sample code to demonstrate usage. Can also assist in adding test cases.
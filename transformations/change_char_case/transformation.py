@@ -1,18 +1,20 @@
 import random
+from typing import List
 
+from char_noise import CharBatch, flip_case
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
 
 def change_char_case(text, prob=0.1, seed=0, max_outputs=1):
-    random.seed(seed)
+    rng = random.Random(seed)
     results = []
     for _ in range(max_outputs):
         result = []
         for c in text:
-            if c.isupper() and random.random() < prob:
+            if c.isupper() and rng.random() < prob:
                 result.append(c.lower())
-            elif c.islower() and random.random() < prob:
+            elif c.islower() and rng.random() < prob:
                 result.append(c.upper())
             else:
                 result.append(c)
@@ -21,6 +23,15 @@ def change_char_case(text, prob=0.1, seed=0, max_outputs=1):
     return results
 
 
+def change_char_case_batch(texts, prob=0.1, seed=0, max_outputs=1):
+    """Vectorized change_char_case over a batch of texts (with different random draws)."""
+    batch = CharBatch(texts, seed)
+    outputs = [
+        flip_case(batch, prob, stream) for stream in range(max_outputs)
+    ]
+    return [list(perturbed) for perturbed in zip(*outputs)]
+
+
 """
 Change char cases randomly
 """
@@ -34,11 +45,25 @@ class ChangeCharCase(SentenceOperation):
     ]
     languages = ["en"]
 
-    def __init__(self, seed=0, max_outputs=1):
+    def __init__(self, seed=0, max_outputs=1, vectorized=False):
         super().__init__(seed, max_outputs=max_outputs)
+        # vectorized: perturb the batches at once (with different random draws)
+        self.vectorized = vectorized
 
     def generate(self, sentence: str):
+        if self.vectorized:
+            return self.generate_batch([sentence])[0]
         perturbed = change_char_case(
-            text=sentence, prob=0.1, seed=self.seed, max_outputs=self.max_outputs
+            text=sentence,
+            prob=0.1,
+            seed=self.example_seed(sentence),
+            max_outputs=self.max_outputs,
         )
         return perturbed
+
+    def generate_batch(self, sentences: List[str]) -> List[List[str]]:
+        if not self.vectorized:
+            return super().generate_batch(sentences)
+        return change_char_case_batch(
+            sentences, prob=0.1, seed=self.seed, max_outputs=self.max_outputs
+        )
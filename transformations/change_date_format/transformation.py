@@ -1,7 +1,6 @@
 import numpy as np
 
-import spacy
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 import dateparser
 
 from babel.dates import format_date
@@ -14,7 +13,7 @@ class DateFormatTransformation:
     nlp = None
 
     def __init__(self, seed=0, max_output=1):
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.max_output = max_output
         self.seed = seed
 
@@ -81,8 +80,9 @@ class DateFormatTransformation:
 
         return date, has_year, has_month, has_day
 
-    def transform(self, input_text: str):
-        np.random.seed(self.seed)
+    def transform(self, input_text: str, seed=None):
+        seed = self.seed if seed is None else seed
+        np_rng = np.random.RandomState(seed)
         doc = self.nlp(input_text)
         transformed_texts = []
 
@@ -95,24 +95,24 @@ class DateFormatTransformation:
                     date, has_year, has_month, has_day = self.parse_date(entity.text)
 
                     if date:
-                        locale = np.random.choice(self.locales)
-                        np.random.seed(self.seed)
+                        locale = np_rng.choice(self.locales)
+                        np_rng = np.random.RandomState(seed)
                         if has_year and has_month and has_day:
-                            format = np.random.choice(self.ymd_formats)
+                            format = np_rng.choice(self.ymd_formats)
                             new_value = format_date(
                                 date,
                                 format=format,
                                 locale=locale,
                             )
                         elif has_year and has_month:
-                            format = np.random.choice(self.ym_formats)
+                            format = np_rng.choice(self.ym_formats)
                             new_value = format_date(
                                 date,
                                 format=format,
                                 locale=locale,
                             )
                         elif has_month and has_day:
-                            format = np.random.choice(self.md_formats)
+                            format = np_rng.choice(self.md_formats)
                             new_value = format_date(
                                 date,
                                 format=format,
@@ -137,13 +137,14 @@ class ChangeDateFormat(SentenceOperation):
     heavy = True # TODO: need to remove this later (test cases failing temporary fix)
 
     def __init__(self, seed=0, max_output=1):
-        np.random.seed(self.seed)
         super().__init__(seed)
         self.date_format_transformation = DateFormatTransformation(seed, max_output)
         self.max_output = max_output
 
     def generate(self, sentence: str):
-        result = self.date_format_transformation.transform(sentence)
+        result = self.date_format_transformation.transform(
+            sentence, seed=self.example_seed(sentence)
+        )
         if self.verbose:
             print(f"Perturbed Input from {self.name()} : {result}")
         return result
@@ -1,10 +1,16 @@
+import threading
+
 import numpy as np
-import spacy
 from checklist.perturb import Perturb
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
+# Perturb.change_names draws from the global NumPy random state, which is set to the state of
+# the rng of the example for the call (and restored after it), so calls are serialized across
+# threads.
+_np_random_lock = threading.Lock()
+
 
 class ChangePersonNamedEntities(SentenceOperation):
     tasks = [TaskType.TEXT_CLASSIFICATION, TaskType.TEXT_TO_TEXT_GENERATION]
@@ -14,13 +20,20 @@ class ChangePersonNamedEntities(SentenceOperation):
         # TODO: Do not repeat parse computations.
         super().__init__(seed, max_outputs=max_outputs)
         self.n = n
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
 
     def generate(self, sentence: str):
-        np.random.seed(self.seed)
-        perturbed = Perturb.perturb(
-            [self.nlp(sentence)], Perturb.change_names, nsamples=1
-        )
+        doc = self.nlp(sentence)
+        np_rng = self.get_np_rng(sentence)
+        with _np_random_lock:
+            global_state = np.random.get_state()
+            np.random.set_state(np_rng.get_state())
+            try:
+                perturbed = Perturb.perturb(
+                    [doc], Perturb.change_names, nsamples=1
+                )
+            finally:
+                np.random.set_state(global_state)
         perturbed_texts = (
             perturbed.data[0][1 : self.max_outputs]
             if len(perturbed.data) > 0
@@ -1,10 +1,9 @@
 import re
 
 import numpy as np
-import spacy
 from checklist.perturb import Perturb
 
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 from interfaces.SentenceOperation import SentenceAndTargetOperation
 from tasks.TaskTypes import TaskType
 
@@ -24,13 +23,13 @@ class ChangeTwoWayNe(SentenceAndTargetOperation):
         self, first_only=False, last_only=False, n=1, seed=0, max_outputs=1
     ):
         super().__init__(seed, max_outputs=max_outputs)
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.first_only = first_only  # first name
         self.last_only = last_only  # last name
         self.n = n
 
     def generate(self, sentence: str, target: str):
-        np.random.seed(self.seed)
+        np_rng = self.get_np_rng(sentence)
         perturbed_source = sentence
         perturbed_target = target
         n = self.n
@@ -65,12 +64,12 @@ class ChangeTwoWayNe(SentenceAndTargetOperation):
                 if self.last_only:
                     return None
             names = Perturb.data["name"][sex][: 90 + n]
-            to_use = np.random.choice(names, n)
+            to_use = np_rng.choice(names, n)
             if not self.first_only:
                 f = x
                 if len(x.split()) > 1:
                     last = Perturb.data["name"]["last"][: 90 + n]
-                    last = np.random.choice(last, n)
+                    last = np_rng.choice(last, n)
                     to_use = ["%s %s" % (x, y) for x, y in zip(names, last)]
                     if self.last_only:
                         to_use = last
@@ -108,7 +107,7 @@ class ChangeTwoWayNe(SentenceAndTargetOperation):
             else:
                 continue
             sub_re = re.compile(r"\b%s\b" % re.escape(x))
-            to_use = np.random.choice(names, n)
+            to_use = np_rng.choice(names, n)
             ret.extend([sub_re.sub(n, doc.text) for n in to_use])
             outs.extend([sub_re.sub(n, target) for n in to_use])
             ret_m.extend([(x, n) for n in to_use])
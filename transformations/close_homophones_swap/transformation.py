@@ -1,6 +1,5 @@
 import itertools
 import random
-import spacy
 import numpy
 
 from interfaces.SentenceOperation import SentenceOperation
@@ -8,20 +7,20 @@ from tasks.TaskTypes import TaskType
 from SoundsLike.SoundsLike import Search
 from spacy.attrs import LOWER, POS, ENT_TYPE, IS_ALPHA
 from spacy.tokens import Doc
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 
 
 def close_homophones_swap(text, corrupt_prob, seed=0, max_outputs=1, nlp=None):
-    random.seed(seed)
+    rng = random.Random(seed)
     doc = nlp(text)
     perturbed_texts = []
     spaces = [True if tok.whitespace_ else False for tok in doc]
     for _ in range(max_outputs):
         perturbed_text = []
         for index, token in enumerate(doc):
-            if random.uniform(0, 1) < corrupt_prob:
+            if rng.uniform(0, 1) < corrupt_prob:
                 try:
-                    replacement = random.choice(Search.closeHomophones(token.text))
+                    replacement = rng.choice(Search.closeHomophones(token.text))
                     if replacement.lower() != token.text.lower() and token.text.lower() != 'a':
                         perturbed_text.append(replacement)
                     else:
@@ -51,10 +50,10 @@ class CloseHomophonesSwap(SentenceOperation):
     def __init__(self, seed=0, max_outputs=1):
         super().__init__(seed)
         self.max_outputs = max_outputs
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
 
     def generate(self, sentence: str):
         perturbed_texts = close_homophones_swap(
-            text=sentence, corrupt_prob=0.5, seed=self.seed, max_outputs=self.max_outputs, nlp=self.nlp
+            text=sentence, corrupt_prob=0.5, seed=self.example_seed(sentence), max_outputs=self.max_outputs, nlp=self.nlp
         )
         return perturbed_texts
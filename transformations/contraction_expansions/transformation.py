@@ -1,5 +1,5 @@
-import re
 from interfaces.SentenceOperation import SentenceOperation
+from lexicon_matcher import LexiconMatcher
 from tasks.TaskTypes import TaskType
 
 """
@@ -93,7 +93,14 @@ class ContractionExpansions(SentenceOperation):
             "you've": "you have",
         }
         self.reverse_contraction_map = {value:key for key, value in self.contraction_map.items()}
-    
+        # both lexicons are compiled once, the expansions only match when followed by a space
+        self.contraction_matcher = LexiconMatcher(
+            self.contraction_map, ignore_case=True
+        )
+        self.reverse_contraction_matcher = LexiconMatcher(
+            [f"{expansion} " for expansion in self.reverse_contraction_map],
+            ignore_case=True,
+        )
 
     def contract(self, sentence):
         """Contract expanded contractions in a sentence (if any)
@@ -106,14 +113,9 @@ class ContractionExpansions(SentenceOperation):
         string
             String with contractions contracted (if any)
         """
-        
-        reverse_contraction_pattern = re.compile(
-            r"\b({})\b ".format("|".join(self.reverse_contraction_map.keys())),
-            flags=re.IGNORECASE | re.DOTALL,
-        )
 
-        def cont(possible):
-            match = possible.group(1)
+        def cont(possible, _):
+            match = possible[:-1]
             first_char = match[0]
             expanded_contraction = self.reverse_contraction_map.get(
                 match, self.reverse_contraction_map.get(match.lower())
@@ -121,7 +123,9 @@ class ContractionExpansions(SentenceOperation):
             expanded_contraction = first_char + expanded_contraction[1:] + " "
             return expanded_contraction
 
-        return reverse_contraction_pattern.sub(cont, sentence)
+        return self.reverse_contraction_matcher.sub(
+            cont, sentence, longest=False
+        )
 
     def expand_contractions(self, sentence):
         """Expands contractions in a sentence (if any)
@@ -134,15 +138,8 @@ class ContractionExpansions(SentenceOperation):
         string
             String with contractions expanded (if any)
         """
-        
 
-        contraction_pattern = re.compile(
-            r"\b({})\b".format("|".join(self.contraction_map.keys())),
-            flags=re.IGNORECASE | re.DOTALL,
-        )
-
-        def expand_match(contraction):
-            match = contraction.group(0)
+        def expand_match(match, _):
             first_char = match[0]
             expanded_contraction = self.contraction_map.get(
                 match, self.contraction_map.get(match.lower())
@@ -150,7 +147,9 @@ class ContractionExpansions(SentenceOperation):
             expanded_contraction = first_char + expanded_contraction[1:]
             return expanded_contraction
 
-        return contraction_pattern.sub(expand_match, sentence)
+        return self.contraction_matcher.sub(
+            expand_match, sentence, longest=False
+        )
 
     def contractions(self, sentence):
         """Perturbation functions, contracts and expands contractions if present
@@ -1,8 +1,8 @@
 import random
-import re
 
 from collections import defaultdict
 from interfaces.SentenceOperation import SentenceOperation
+from lexicon_matcher import LexiconMatcher
 from tasks.TaskTypes import TaskType
 
 """
@@ -55,38 +55,45 @@ for (k, v) in MARKER_TO_CLASS.items():
     CLASS_TO_MARKERS[v].append(k.rstrip(','))
 CLASS_TO_MARKERS = dict(CLASS_TO_MARKERS)
 
+# finds the markers made of several words too, e.g. "as a result"
+MARKER_MATCHER = LexiconMatcher(MARKER_TO_CLASS, ignore_case=True)
+
 
 def discourse_marker_substitution(text, seed=0, max_output=1):
     """Performs a substitution of discourse markers with semantically equivalent marker
     in the input text
     """
-    random.seed(seed)
+    rng = random.Random(seed)
     perturbed_texts = []
+    occurrences = defaultdict(list)
+    for start, end, marker in MARKER_MATCHER.find(text):
+        occurrences[marker].append((start, end))
     for _ in range(max_output):
-        present_markers = [m for m in MARKER_TO_CLASS if m in text.lower().split()]
+        present_markers = [m for m in MARKER_TO_CLASS if m in occurrences]
 
         if not present_markers:
             return [text]
-        original = random.choice(present_markers)
+        original = rng.choice(present_markers)
         same_class_markers = CLASS_TO_MARKERS[MARKER_TO_CLASS[original]]
         possible_substitutions = [m for m in same_class_markers if m not in original]
         if not possible_substitutions:
             return [text]
-        new = random.choice(possible_substitutions)
-        matched_markers = list(re.finditer("(?i)" + re.escape(original), text))
+        new = rng.choice(possible_substitutions)
+        matched_markers = occurrences[original]
         if matched_markers:
-            m = random.choice(matched_markers)
+            start, end = rng.choice(matched_markers)
+            matched = text[start:end]
             # keep the same case type
-            if m[0].isupper():
+            if matched.isupper():
                 new_with_matching_case_type = new.upper()
-            elif m[0][0].isupper() and len(m[0]) > 1:
+            elif matched[0].isupper() and len(matched) > 1:
                 new_with_matching_case_type = f"{new[0].upper()}{new[1:]}"
             else:
                 new_with_matching_case_type = new
             if original.endswith(","):
                 new_with_matching_case_type += ","
             perturbed_text = (
-                text[: m.start()] + new_with_matching_case_type + text[m.end() :]
+                text[:start] + new_with_matching_case_type + text[end:]
             )
             perturbed_texts.append(perturbed_text)
     return list(set(perturbed_texts))
@@ -105,6 +112,8 @@ class DiscourseMarkerSubstitution(SentenceOperation):
 
     def generate(self, sentence: str):
         perturbed_texts = discourse_marker_substitution(
-            text=sentence, seed=self.seed, max_output=self.max_output
+            text=sentence,
+            seed=self.example_seed(sentence),
+            max_output=self.max_output,
         )
         return perturbed_texts
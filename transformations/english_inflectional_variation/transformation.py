@@ -41,8 +41,8 @@ class EnglishInflectionalVariation(SentenceOperation):
         pos_tagged = [(token, map_tag('en-ptb', 'universal', tag)) for (token, tag) in self.tagger.tag(tokens)]
         pos_tagged = [(tagged[0], '.') if '&' in tagged[0] else tagged for tagged in pos_tagged]
 
-        random.seed(self.seed)
-        perturbed_tokens = [self.randomly_inflect(tokens, pos_tagged, random.randint(0, i*1000)) for i in range(self.max_outputs)]
+        rng = self.get_rng(sentence)
+        perturbed_tokens = [self.randomly_inflect(tokens, pos_tagged, rng.randint(0, i*1000)) for i in range(self.max_outputs)]
         perturbed_tokens = [[(t, tokenized[i][1]) for i, t in enumerate(sentence)] for sentence in perturbed_tokens]
 
         perturbed_sentences = [self.detokenize(sentence) for sentence in perturbed_tokens]
@@ -75,8 +75,7 @@ class EnglishInflectionalVariation(SentenceOperation):
                 if inflections[1]:
                     # Use inflection distribution for weighted random sampling if specified
                     # Otherwise unweighted
-                    random.seed(seed+len(word))
-                    inflection = random.choices(inflections[1])[0][1]
+                    inflection = random.Random(seed+len(word)).choices(inflections[1])[0][1]
                     new_tokens[i] = inflection
         return new_tokens
 
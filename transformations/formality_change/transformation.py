@@ -1,9 +1,13 @@
+import threading
+from typing import List
+
 from transformers import (
     AutoTokenizer,
     AutoModelForSeq2SeqLM,
     AutoModelForSequenceClassification,
 )
 import torch
+from initialize import load_pretrained
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
@@ -14,51 +18,128 @@ code and model from: https://github.com/PrithivirajDamodaran/Styleformer
 
 class Adequacy:
     def __init__(self, model_tag="prithivida/parrot_adequacy_on_BART"):
-        self.nli_model = AutoModelForSequenceClassification.from_pretrained(model_tag)
-        self.tokenizer = AutoTokenizer.from_pretrained(model_tag)
-
-    def filter(self, input_phrase, para_phrases, adequacy_threshold, device="cpu"):
-        top_adequacy_phrases = []
-        for para_phrase in para_phrases:
-            x = self.tokenizer.encode(
-                input_phrase,
-                para_phrase,
+        self.nli_model = load_pretrained(
+            AutoModelForSequenceClassification, model_tag, owner=self
+        )
+        self.tokenizer = load_pretrained(AutoTokenizer, model_tag, owner=self)
+
+    def score_pairs(self, pairs, device="cpu", batch_size=64):
+        """
+        Returns the adequacy score of every (input_phrase, para_phrase) pair, running the NLI
+        model on padded batches of pairs rather than on one pair at a time.
+        """
+        scores = []
+        self.nli_model.to(device)
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start : start + batch_size]
+            x = self.tokenizer(
+                [input_phrase for input_phrase, _ in batch],
+                [para_phrase for _, para_phrase in batch],
                 return_tensors="pt",
-                truncation_strategy="only_first",
+                padding=True,
+                truncation="only_first",
             )
-            self.nli_model = self.nli_model.to(device)
-            logits = self.nli_model(x.to(device))[0]
+            with torch.no_grad():
+                logits = self.nli_model(
+                    input_ids=x["input_ids"].to(device),
+                    attention_mask=x["attention_mask"].to(device),
+                )[0]
             # we throw away "neutral" (dim 1) and take the probability of "entailment" (2) as the adequacy score
             entail_contradiction_logits = logits[:, [0, 2]]
             probs = entail_contradiction_logits.softmax(dim=1)
             prob_label_is_true = probs[:, 1]
-            adequacy_score = prob_label_is_true[0].item()
-            if adequacy_score >= adequacy_threshold:
-                top_adequacy_phrases.append(para_phrase)
-        return top_adequacy_phrases
+            scores.extend(prob_label_is_true.tolist())
+        return scores
+
+    def filter(self, input_phrase, para_phrases, adequacy_threshold, device="cpu"):
+        adequacy_scores = self.score(
+            input_phrase, para_phrases, adequacy_threshold, device
+        )
+        return [
+            para_phrase
+            for para_phrase in para_phrases
+            if para_phrase in adequacy_scores
+        ]
 
     def score(self, input_phrase, para_phrases, adequacy_threshold, device="cpu"):
         adequacy_scores = {}
-        for para_phrase in para_phrases:
-            x = self.tokenizer.encode(
-                input_phrase,
-                para_phrase,
-                return_tensors="pt",
-                truncation_strategy="only_first",
-            )
-            self.nli_model = self.nli_model.to(device)
-            logits = self.nli_model(x.to(device))[0]
-            # we throw away "neutral" (dim 1) and take the probability of "entailment" (2) as the adequacy score
-            entail_contradiction_logits = logits[:, [0, 2]]
-            probs = entail_contradiction_logits.softmax(dim=1)
-            prob_label_is_true = probs[:, 1]
-            adequacy_score = prob_label_is_true[0].item()
+        scores = self.score_pairs(
+            [(input_phrase, para_phrase) for para_phrase in para_phrases],
+            device,
+        )
+        for para_phrase, adequacy_score in zip(para_phrases, scores):
             if adequacy_score >= adequacy_threshold:
                 adequacy_scores[para_phrase] = adequacy_score
         return adequacy_scores
 
 
-adequacy = Adequacy()
+# the adequacy model is shared by all the instances of the transformations and only loaded
+# when one of them is first used, rather than when the module is imported
+_adequacy = None
+_adequacy_lock = threading.Lock()
+
+
+def get_adequacy() -> Adequacy:
+    global _adequacy
+    if _adequacy is None:
+        with _adequacy_lock:
+            if _adequacy is None:
+                _adequacy = Adequacy()
+    return _adequacy
+
+
+def transfer_style_batch(
+    model,
+    tokenizer,
+    adequacy,
+    prefix,
+    sentences,
+    num_beams,
+    max_length,
+    num_return_sequences,
+    quality_filter,
+    device,
+):
+    """
+    Runs the style transfer model on a padded batch of sentences and returns, for every
+    sentence, the candidates which pass the adequacy filter ranked by their adequacy score.
+    """
+    encoded = tokenizer(
+        [prefix + sentence for sentence in sentences],
+        return_tensors="pt",
+        padding=True,
+    )
+    model = model.to(device)
+    preds = model.generate(
+        input_ids=encoded["input_ids"].to(device),
+        attention_mask=encoded["attention_mask"].to(device),
+        num_beams=num_beams,
+        max_length=max_length,
+        early_stopping=True,
+        num_return_sequences=num_return_sequences,
+    )
+    decoded = tokenizer.batch_decode(preds, skip_special_tokens=True)
+
+    # score the candidates of all the sentences at once
+    pairs = []
+    for i, src_sentence in enumerate(sentences):
+        candidates = decoded[
+            i * num_return_sequences : (i + 1) * num_return_sequences
+        ]
+        gen_sentences = set(candidate.strip() for candidate in candidates)
+        pairs.extend((i, src_sentence, gen) for gen in gen_sentences)
+    scores = adequacy.score_pairs(
+        [(src_sentence, gen) for _, src_sentence, gen in pairs], device
+    )
+
+    adequacy_scored_phrases = [{} for _ in sentences]
+    for (i, _, gen), score in zip(pairs, scores):
+        if score >= quality_filter:
+            adequacy_scored_phrases[i][gen] = score
+    return [
+        sorted(scored.items(), key=lambda x: x[1], reverse=True)
+        for scored in adequacy_scored_phrases
+    ]
 
 
 class Formal2Casual(SentenceOperation):
@@ -71,11 +152,10 @@ class Formal2Casual(SentenceOperation):
         if self.verbose:
             print("Starting to load Casual to Formal Model...\n")
         m_name = "prithivida/formal_to_informal_styletransfer"
-        self.tokenizer = AutoTokenizer.from_pretrained(m_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(m_name)
+        self.tokenizer = load_pretrained(AutoTokenizer, m_name, owner=self)
+        self.model = load_pretrained(AutoModelForSeq2SeqLM, m_name, owner=self)
         if self.verbose:
             print("Completed loading Casual to Formal Model.\n")
-        self.adequacy = adequacy
         self.max_output = num_beams
         self.num_beams = num_beams
         self.max_length = max_length
@@ -84,39 +164,35 @@ class Formal2Casual(SentenceOperation):
         if self.device is None:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
+    @property
+    def adequacy(self):
+        return get_adequacy()
+
     def generate(self, sentence: str):
+        return self.generate_batch([sentence])[0]
+
+    def generate_batch(self, sentences: List[str]):
         ctf_prefix = "transfer Formal to Casual: "
-        src_sentence = sentence
-        sentence = ctf_prefix + sentence
-        input_ids = self.tokenizer.encode(sentence, return_tensors="pt")
-        model = self.model.to(self.device)
-        input_ids = input_ids.to(self.device)
-
-        preds = model.generate(
-            input_ids,
+        ranked_batch = transfer_style_batch(
+            self.model,
+            self.tokenizer,
+            self.adequacy,
+            ctf_prefix,
+            sentences,
             num_beams=self.num_beams,
             max_length=self.max_length,
-            early_stopping=True,
             num_return_sequences=self.max_output,
+            quality_filter=self.quality_filter,
+            device=self.device,
         )
-
-        gen_sentences = set()
-        for pred in preds:
-            gen_sentences.add(
-                self.tokenizer.decode(pred, skip_special_tokens=True).strip()
-            )
-
-        adequacy_scored_phrases = self.adequacy.score(
-            src_sentence, list(gen_sentences), self.quality_filter, self.device
-        )
-        ranked_sentences = sorted(
-            adequacy_scored_phrases.items(), key=lambda x: x[1], reverse=True
-        )
-        if len(ranked_sentences) > 0:
-            return [ranked_sentences[0][0]]
-        else:
-            print("No transfer found!")
-            return [sentence]
+        perturbed = []
+        for sentence, ranked_sentences in zip(sentences, ranked_batch):
+            if len(ranked_sentences) > 0:
+                perturbed.append([ranked_sentences[0][0]])
+            else:
+                print("No transfer found!")
+                perturbed.append([ctf_prefix + sentence])
+        return perturbed
 
 
 class Casual2Formal(SentenceOperation):
@@ -129,11 +205,10 @@ class Casual2Formal(SentenceOperation):
         if self.verbose:
             print("Starting to load Casual to Formal Model...\n")
         m_name = "prithivida/informal_to_formal_styletransfer"
-        self.tokenizer = AutoTokenizer.from_pretrained(m_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(m_name)
+        self.tokenizer = load_pretrained(AutoTokenizer, m_name, owner=self)
+        self.model = load_pretrained(AutoModelForSeq2SeqLM, m_name, owner=self)
         if self.verbose:
             print("Completed loading Casual to Formal Model.\n")
-        self.adequacy = adequacy
         self.max_output = num_beams
         self.num_beams = num_beams
         self.max_length = max_length
@@ -142,35 +217,31 @@ class Casual2Formal(SentenceOperation):
         if self.device is None:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
+    @property
+    def adequacy(self):
+        return get_adequacy()
+
     def generate(self, sentence: str):
+        return self.generate_batch([sentence])[0]
+
+    def generate_batch(self, sentences: List[str]):
         ctf_prefix = "transfer Casual to Formal: "
-        src_sentence = sentence
-        sentence = ctf_prefix + sentence
-        input_ids = self.tokenizer.encode(sentence, return_tensors="pt")
-        model = self.model.to(self.device)
-        input_ids = input_ids.to(self.device)
-
-        preds = model.generate(
-            input_ids,
+        ranked_batch = transfer_style_batch(
+            self.model,
+            self.tokenizer,
+            self.adequacy,
+            ctf_prefix,
+            sentences,
             num_beams=self.num_beams,
             max_length=self.max_length,
-            early_stopping=True,
             num_return_sequences=self.max_output,
+            quality_filter=self.quality_filter,
+            device=self.device,
         )
-
-        gen_sentences = set()
-        for pred in preds:
-            gen_sentences.add(
-                self.tokenizer.decode(pred, skip_special_tokens=True).strip()
-            )
-
-        adequacy_scored_phrases = self.adequacy.score(
-            src_sentence, list(gen_sentences), self.quality_filter, self.device
-        )
-        ranked_sentences = sorted(
-            adequacy_scored_phrases.items(), key=lambda x: x[1], reverse=True
-        )
-        if len(ranked_sentences) > 0:
-            return [ranked_sentences[0][0]]
-        else:
-            return [sentence]
+        perturbed = []
+        for sentence, ranked_sentences in zip(sentences, ranked_batch):
+            if len(ranked_sentences) > 0:
+                perturbed.append([ranked_sentences[0][0]])
+            else:
+                perturbed.append([ctf_prefix + sentence])
+        return perturbed
@@ -1,5 +1,4 @@
 import numpy as np
-import spacy
 
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
@@ -10,7 +9,7 @@ import json
 import random
 import hashlib
 from checklist.perturb import process_ret
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 
 
 def hash(input:str):
@@ -79,8 +78,7 @@ class ChangeGenderCultureDiverseName:
 
         """
 
-        if seed is not None:
-            random.seed(seed)
+        rng = random.Random(seed) if seed is not None else random
         ents = [x.text for x in doc.ents if np.all([a.ent_type_ == 'PERSON' for a in x])]
         ret = []
         ret_m = []
@@ -100,9 +98,9 @@ class ChangeGenderCultureDiverseName:
                 else:
                     country_choose_from = self.countries
             
-                new_countries = random.choices(country_choose_from, k=n)
-                new_genders = random.choices(gender_choose_from, k=n)
-                new_names = [random.choice(self.names[c][n]) for c,n in zip(new_countries, new_genders)]
+                new_countries = rng.choices(country_choose_from, k=n)
+                new_genders = rng.choices(gender_choose_from, k=n)
+                new_names = [rng.choice(self.names[c][n]) for c,n in zip(new_countries, new_genders)]
                 if not capito:
                     new_names = [n.lower() for n in new_names]
                 
@@ -111,7 +109,7 @@ class ChangeGenderCultureDiverseName:
                     ret_m.append((name, new_name))
         
         if len(ret) > max_output:
-            idxs = random.choices(range(len(ret)), k=max_output)
+            idxs = rng.choices(range(len(ret)), k=max_output)
             return [ret[idx] for idx in idxs], [ret_m[idx] for idx in idxs]
         else:
             return ret, ret_m
@@ -141,7 +139,7 @@ class GenderCultureDiverseName(SentenceOperation):
 
     def __init__(self, n=1, seed=0, max_output=1, retain_gender=False, retain_culture=False, data_path=None):
         super().__init__(seed)
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.n = n
         self.max_output = max_output
 
@@ -1,5 +1,4 @@
 import numpy as np
-import spacy
 
 from interfaces.SentenceOperation import SentenceAndTargetOperation
 from tasks.TaskTypes import TaskType
@@ -10,7 +9,7 @@ import json
 import random
 import hashlib
 from checklist.perturb import process_ret
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 
 def hash(input:str):
     t_value = input.encode('utf8')
@@ -82,8 +81,7 @@ class ChangeGenderCultureDiverseNameTwoWay:
 
         """
 
-        if seed is not None:
-            random.seed(seed)
+        rng = random.Random(seed) if seed is not None else random
         ents = [x.text for x in doc.ents if np.all([a.ent_type_ == 'PERSON' for a in x])]
         ret_s = []
         ret_t = []
@@ -104,9 +102,9 @@ class ChangeGenderCultureDiverseNameTwoWay:
                 else:
                     country_choose_from = self.countries
             
-                new_countries = random.choices(country_choose_from, k=n)
-                new_genders = random.choices(gender_choose_from, k=n)
-                new_names = [random.choice(self.names[c][n]) for c,n in zip(new_countries, new_genders)]
+                new_countries = rng.choices(country_choose_from, k=n)
+                new_genders = rng.choices(gender_choose_from, k=n)
+                new_names = [rng.choice(self.names[c][n]) for c,n in zip(new_countries, new_genders)]
                 if not capito:
                     new_names = [n.lower() for n in new_names]
                 
@@ -116,7 +114,7 @@ class ChangeGenderCultureDiverseNameTwoWay:
                     ret_m.append((name, new_name))
         
         if len(ret_s) > max_output:
-            idxs = random.choices(range(len(ret_s)), k=max_output)
+            idxs = rng.choices(range(len(ret_s)), k=max_output)
             return [ret_s[idx] for idx in idxs], [ret_t[idx] for idx in idxs], [ret_m[idx] for idx in idxs]
         else:
             return ret_s, ret_t, ret_m
@@ -164,7 +162,7 @@ class GenderCultureDiverseNameTwoWay(SentenceAndTargetOperation):
 
     def __init__(self, n=1, seed=0, max_output=1, data_path=None):
         super().__init__(seed)
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.n = n
         self.max_output = max_output
 
@@ -1,12 +1,16 @@
-import random
-
+import bisect
+import itertools
 from typing import List
 from checklist.editor import Editor
 
 from interfaces.SentenceOperation import SentenceOperation
+from lexicon_matcher import LexiconMatcher
 from tasks.TaskTypes import TaskType
 from .gender_pairs import GENDER_PAIRS
 
+# compiled lexicons of the gendered words (and names), by swap_names
+_matchers = {}
+
 
 class GenderSwap(SentenceOperation):
     """Swaps all gendered words in a given sentence with their counterparts.
@@ -40,6 +44,15 @@ class GenderSwap(SentenceOperation):
             self.male_names = set(map(str.lower, self._male_names_list))
             self.female_names = set(map(str.lower, self._female_name_list))
 
+        if self.swap_names not in _matchers:
+            lexicon = list(self.pairs)
+            if self.swap_names:
+                lexicon += sorted(self.male_names | self.female_names)
+            _matchers[self.swap_names] = LexiconMatcher(
+                lexicon, ignore_case=True
+            )
+        self.matcher = _matchers[self.swap_names]
+
     def _copy_casing(self, target: str, input: str) -> str:
         """Sets the first char of input to have the same case as target.
 
@@ -70,10 +83,22 @@ class GenderSwap(SentenceOperation):
         return raw
 
     def generate(self, sentence: str) -> List[str]:
+        rng = self.get_rng(sentence)
         output = []
         words = sentence.split(" ")
 
-        for word in words:
+        # the words holding a gendered word or a name, found in a single pass over the sentence
+        starts = list(itertools.accumulate(len(word) + 1 for word in words))
+        candidates = {
+            bisect.bisect_right(starts, start)
+            for start, _, _ in self.matcher.find_all(sentence)
+        }
+
+        for i, word in enumerate(words):
+            # words with other characters than letters are normalized before the lookup
+            if i not in candidates and word.isalpha():
+                output.append(word)
+                continue
 
             raw = self._normalize(word)
 
@@ -84,10 +109,10 @@ class GenderSwap(SentenceOperation):
 
             if self.swap_names:
                 if raw in self.female_names:
-                    counterpart = random.choice(self._male_names_list)
+                    counterpart = rng.choice(self._male_names_list)
 
                 if raw in self.male_names:
-                    counterpart = random.choice(self._female_name_list)
+                    counterpart = rng.choice(self._female_name_list)
 
             if counterpart is not None:
                 # If we found a counterpart to an original word, replace it
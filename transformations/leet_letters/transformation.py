@@ -1,7 +1,7 @@
 import itertools
-import random
 from typing import List
 
+from char_noise import CharBatch, substitute
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
@@ -49,12 +49,16 @@ class LeetLetters(SentenceOperation):
     tasks = [TaskType.TEXT_CLASSIFICATION, TaskType.TEXT_TO_TEXT_GENERATION, TaskType.TEXT_TAGGING]
     languages = ["en"]
 
-    def __init__(self, seed: int = 0, max_outputs: int = 1, max_leet: float = 0.5) -> None:
+    def __init__(self, seed: int = 0, max_outputs: int = 1, max_leet: float = 0.5, vectorized: bool = False) -> None:
         super().__init__(seed=seed, max_outputs=max_outputs)
         self.max_leet = max_leet
+        # vectorized: perturb the batches at once (with different random draws)
+        self.vectorized = vectorized
 
     def generate(self, sentence: str) -> List[str]:
-        random.seed(self.seed)
+        if self.vectorized:
+            return self.generate_batch([sentence])[0]
+        rng = self.get_rng(sentence)
         max_leet_replacements = int(self.max_leet * len(sentence))
         perturbed_texts = []
         # Perturb the input sentence max_output times
@@ -64,7 +68,7 @@ class LeetLetters(SentenceOperation):
             for idx, letter in enumerate(sentence):
                 if letter in leet_letter_mappings:
                     leet_candidates.append((idx, leet_letter_mappings[letter]))
-            leet_replacements = random.choices(leet_candidates, k=max_leet_replacements)
+            leet_replacements = rng.choices(leet_candidates, k=max_leet_replacements)
 
             # Conduct replacement
             sentence_list = list(sentence)
@@ -73,3 +77,13 @@ class LeetLetters(SentenceOperation):
             perturbed_texts.append("".join(sentence_list))
             
         return perturbed_texts
+
+    def generate_batch(self, sentences: List[str]) -> List[List[str]]:
+        if not self.vectorized:
+            return super().generate_batch(sentences)
+        batch = CharBatch(sentences, self.seed)
+        outputs = [
+            substitute(batch, leet_letter_mappings, self.max_leet, stream)
+            for stream in range(self.max_outputs)
+        ]
+        return [list(perturbed) for perturbed in zip(*outputs)]
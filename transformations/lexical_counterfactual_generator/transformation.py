@@ -1,8 +1,7 @@
 from interfaces.SentencePairOperation import SentencePairOperation
 from tasks.TaskTypes import TaskType
 from typing import Tuple, List
-from initialize import spacy_nlp
-import spacy
+from initialize import get_spacy_doc_cache
 
 from transformations.back_translation import BackTranslation
 
@@ -32,7 +31,7 @@ class LexicalCounterfactualGenerator(SentencePairOperation):
 
     def __init__(self, seed=0, max_outputs=2, pos_label="1", neg_label="0"):
         super().__init__(seed, max_outputs=max_outputs)
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.pos_label = pos_label
         self.neg_label = neg_label
         self.bt = BackTranslation()
@@ -1,5 +1,4 @@
 import itertools
-import random
 from typing import List, Tuple
 
 from interfaces.TaggingOperation import TaggingOperation
@@ -23,7 +22,7 @@ class LongerNamesNer(TaggingOperation):
     def generate(
         self, token_sequence: List[str], tag_sequence: List[str]
     ) -> List[Tuple[List[str], List[str]]]:
-        random.seed(self.seed)
+        rng = self.get_rng(" ".join(token_sequence))
         token_seq = token_sequence.copy()
         tag_seq = tag_sequence.copy()
         perturbed_sentences = []
@@ -41,7 +40,7 @@ class LongerNamesNer(TaggingOperation):
                 if next < len(tag_seq) and i_tag == tag_seq[next]:
                     for _ in range(self.no_of_repeats):
                         random_upper_letter = chr(
-                            random.randint(ord("A"), ord("Z"))
+                            rng.randint(ord("A"), ord("Z"))
                         )
                         token_seq.insert(next, random_upper_letter)
                         tag_seq.insert(next, i_tag)
@@ -3,7 +3,9 @@ import string
 
 from transformers import M2M100ForConditionalGeneration, M2M100Tokenizer
 
+from initialize import load_pretrained
 from interfaces.SentenceOperation import SentenceOperation
+from result_cache import get_result_cache
 from tasks.TaskTypes import TaskType
 
 """
@@ -11,51 +13,167 @@ Mixed Language Perturbation
 This perturbation translates words in the text from English to other languages (e.g., German). It can be used to test the robustness of a model in a multilingual setting.
 """
 
+MODEL_NAME = "facebook/m2m100_418M"
+
 
 def translate(model, tokenizer, text, src_lang, target_lang):
-    tokenizer.src_lang = src_lang
-    encoded = tokenizer(text, return_tensors="pt")
-    generated_tokens = model.generate(
-        **encoded, forced_bos_token_id=tokenizer.get_lang_id(target_lang)
-    )
-    res = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
-    return res
+    return translate_batch(model, tokenizer, [text], src_lang, target_lang)
 
 
-def mixed_language(
-    model, tokenizer, text, prob_mix=0.1, src_lang="en", trg_lang="fr", seed=0
+def translate_batch(
+    model, tokenizer, texts, src_lang, target_lang, batch_size=32
 ):
-    random.seed(seed)
+    """Translates texts with padded batches of batch_size texts."""
+    tokenizer.src_lang = src_lang
+    translations = []
+    for start in range(0, len(texts), batch_size):
+        encoded = tokenizer(
+            texts[start : start + batch_size],
+            return_tensors="pt",
+            padding=True,
+        )
+        generated_tokens = model.generate(
+            **encoded, forced_bos_token_id=tokenizer.get_lang_id(target_lang)
+        )
+        translations.extend(
+            tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+        )
+    return translations
+
 
+def select_words(text, prob_mix=0.1, seed=0):
+    """
+    Decides which words of text are translated. Returns the words of text with, for every
+    word, the word to translate (without punctuation) or None to keep it, "" dropping it.
+    """
+    rng = random.Random(seed)
     words = text.split()
-    mixed_text = ""
+    selected = []
     for word in words:
+        if rng.random() < prob_mix:
+            selected.append(
+                word.translate(
+                    str.maketrans("", "", string.punctuation)
+                ).strip()
+            )
+        else:
+            selected.append(None)
+    return words, selected
+
+
+def assemble(words, selected, translations):
+    mixed_text = ""
+    for word, plain_word in zip(words, selected):
         if mixed_text != "":
             mixed_text += " "
-        if random.random() < prob_mix:
-            plain_word = word.translate(
-                str.maketrans("", "", string.punctuation)
-            ).strip()
-
-            if plain_word == "":
-                continue
-
-            if not word[0].isupper():  # lower case
-                mixed_text += translate(
-                    model, tokenizer, plain_word, src_lang, trg_lang
-                )[0].lower()
-            else:
-                mixed_text += translate(
-                    model, tokenizer, plain_word, src_lang, trg_lang
-                )[0]
-
-            if word[-1] in string.punctuation:
-                mixed_text += word[-1]
-        else:
+        if plain_word is None:
             mixed_text += word
+            continue
+        if plain_word == "":
+            continue
+        if not word[0].isupper():  # lower case
+            mixed_text += translations[plain_word].lower()
+        else:
+            mixed_text += translations[plain_word]
+        if word[-1] in string.punctuation:
+            mixed_text += word[-1]
     return mixed_text
 
 
+def translate_words(
+    model,
+    tokenizer,
+    words,
+    src_lang,
+    trg_lang,
+    cache=None,
+    model_name=MODEL_NAME,
+    batch_size=32,
+):
+    """
+    {word: translation} of the distinct words. With a ResultCache, only the words it doesn't
+    know yet are translated, the translations being keyed by (model, src_lang, trg_lang, word).
+    """
+    words = list(dict.fromkeys(words))
+    keys = {}
+    translations = {}
+    if cache is not None:
+        keys = {
+            word: cache.make_key(
+                "word_translation", model_name, src_lang, trg_lang, word
+            )
+            for word in words
+        }
+        found = cache.get_many(list(keys.values()))
+        translations = {
+            word: found[key] for word, key in keys.items() if key in found
+        }
+    misses = [word for word in words if word not in translations]
+    if misses:
+        new_translations = dict(
+            zip(
+                misses,
+                translate_batch(
+                    model, tokenizer, misses, src_lang, trg_lang, batch_size
+                ),
+            )
+        )
+        if cache is not None:
+            cache.set_many(
+                {keys[word]: t for word, t in new_translations.items()}
+            )
+        translations.update(new_translations)
+    return translations
+
+
+def mixed_language_batch(
+    model,
+    tokenizer,
+    texts,
+    prob_mix=0.1,
+    src_lang="en",
+    trg_lang="fr",
+    seed=0,
+    cache=None,
+    batch_size=32,
+):
+    """
+    mixed_language of every text, the distinct words selected in all the texts being
+    translated at once. seed can also be the list of the seeds of the texts.
+    """
+    seeds = seed if isinstance(seed, list) else [seed] * len(texts)
+    selections = [
+        select_words(text, prob_mix, text_seed)
+        for text, text_seed in zip(texts, seeds)
+    ]
+    translations = translate_words(
+        model,
+        tokenizer,
+        [
+            plain_word
+            for _, selected in selections
+            for plain_word in selected
+            if plain_word
+        ],
+        src_lang,
+        trg_lang,
+        cache=cache,
+        batch_size=batch_size,
+    )
+    return [
+        assemble(words, selected, translations)
+        for words, selected in selections
+    ]
+
+
+def mixed_language(
+    model, tokenizer, text, prob_mix=0.1, src_lang="en", trg_lang="fr", seed=0
+):
+    return mixed_language_batch(
+        model, tokenizer, [text], prob_mix, src_lang, trg_lang, seed
+    )[0]
+
+
 class MixedLanguagePerturbation(SentenceOperation):
     tasks = [TaskType.TEXT_CLASSIFICATION, TaskType.TEXT_TO_TEXT_GENERATION]
     languages = ["en"]
@@ -63,32 +181,48 @@ class MixedLanguagePerturbation(SentenceOperation):
     heavy = True
 
     def __init__(
-        self, seed=0, prob_mix=0.3, src_lang="en", trg_lang="de", max_outputs=1
+        self,
+        seed=0,
+        prob_mix=0.3,
+        src_lang="en",
+        trg_lang="de",
+        max_outputs=1,
+        cache_dir=None,
+        batch_size=32,
     ):
         super().__init__(seed, max_outputs=max_outputs)
 
-        self.model = M2M100ForConditionalGeneration.from_pretrained(
-            "facebook/m2m100_418M"
+        self.model = load_pretrained(
+            M2M100ForConditionalGeneration, MODEL_NAME, owner=self
         )
-        self.tokenizer = M2M100Tokenizer.from_pretrained(
-            "facebook/m2m100_418M"
+        self.tokenizer = load_pretrained(
+            M2M100Tokenizer, MODEL_NAME, owner=self
         )
 
         self.prob_mix = prob_mix
         self.src_lang = src_lang
         self.trg_lang = trg_lang
+        self.batch_size = batch_size
+        # translations of the words, shared by the operations of the process (and saved
+        # across runs in cache_dir)
+        self.word_cache = get_result_cache(cache_dir)
 
     def generate(self, sentence: str):
-        perturbeds = mixed_language(
+        return self.generate_batch([sentence])[0]
+
+    def generate_batch(self, sentences):
+        perturbeds = mixed_language_batch(
             self.model,
             self.tokenizer,
-            text=sentence,
+            sentences,
             prob_mix=self.prob_mix,
             src_lang=self.src_lang,
             trg_lang=self.trg_lang,
-            seed=self.seed,
+            seed=[self.example_seed(sentence) for sentence in sentences],
+            cache=self.word_cache,
+            batch_size=self.batch_size,
         )
-        return [perturbeds]
+        return [[perturbed] for perturbed in perturbeds]
 
 
 """
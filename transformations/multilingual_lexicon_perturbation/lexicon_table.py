@@ -0,0 +1,162 @@
+import mmap
+import os
+import struct
+from array import array
+
+"""
+Compact lookup table of the translations of one (source, target) language pair of the
+multilingual lexicon.
+The table of a pair is built once from the lexicon (the only time the 100-language DataFrame is
+loaded) and saved as a file which is memory-mapped by the later runs:
+    header: magic, size and modification time of the lexicon it was built from, entries
+    key offsets, value offsets: uint32 * (entries + 1), relative to the start of the strings
+    strings: the utf-8 keys, sorted by their bytes (i.e. by code point), then the values
+A lookup is a binary search over the keys.
+"""
+
+FOLDER_PATH = os.path.dirname(os.path.abspath(__file__))
+LEXICON_PATH = os.path.join(FOLDER_PATH, "multilingual_lexicon_uncased.xz")
+TABLE_DIR = os.path.expanduser("~/.cache/nl-augmenter/multilingual_lexicon")
+
+_MAGIC = b"NLLEX001"
+# magic, size and mtime (ns) of the lexicon, number of entries
+_HEADER = struct.Struct("<8sQQI")
+
+_tables = {}
+
+
+def _source_stamp():
+    stat = os.stat(LEXICON_PATH)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class LexiconTable:
+    """Read-only {source word: translation} over the bytes of a table."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        # (source, target) of the tables loaded with load_lexicon_table
+        self.languages = None
+        magic, size, mtime, entries = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a lexicon table")
+        self.source_stamp = (size, mtime)
+        self._entries = entries
+        view = memoryview(buffer)
+        start = _HEADER.size
+        end = start + 4 * (entries + 1)
+        self._key_offsets = view[start:end].cast("I")
+        self._value_offsets = view[end : end + 4 * (entries + 1)].cast("I")
+        self._strings = view[end + 4 * (entries + 1) :]
+
+    @staticmethod
+    def build(translations: dict, source_stamp=(0, 0)) -> bytes:
+        """The bytes of the table of translations."""
+        keys = sorted(key.encode("utf-8") for key in translations)
+        values = [
+            translations[key.decode("utf-8")].encode("utf-8") for key in keys
+        ]
+        key_offsets = array("I", [0])
+        for key in keys:
+            key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets = array("I", [key_offsets[-1]])
+        for value in values:
+            value_offsets.append(value_offsets[-1] + len(value))
+        if key_offsets.itemsize != 4:
+            raise ValueError("uint32 arrays are required")
+        return b"".join(
+            [
+                _HEADER.pack(_MAGIC, *source_stamp, len(keys)),
+                key_offsets.tobytes(),
+                value_offsets.tobytes(),
+                *keys,
+                *values,
+            ]
+        )
+
+    def __reduce__(self):
+        # mmaps can't be pickled, worker processes load the table again
+        if self.languages is not None:
+            return load_lexicon_table, self.languages
+        return LexiconTable, (bytes(self._buffer),)
+
+    def __len__(self):
+        return self._entries
+
+    def _find(self, word: str):
+        key = word.encode("utf-8")
+        offsets, strings = self._key_offsets, self._strings
+        low, high = 0, self._entries
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(strings[offsets[middle] : offsets[middle + 1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if (
+            low < self._entries
+            and bytes(strings[offsets[low] : offsets[low + 1]]) == key
+        ):
+            return low
+        return None
+
+    def get(self, word: str, default=None):
+        index = self._find(word)
+        if index is None:
+            return default
+        value = self._strings[
+            self._value_offsets[index] : self._value_offsets[index + 1]
+        ]
+        return bytes(value).decode("utf-8")
+
+    def __contains__(self, word: str) -> bool:
+        return self._find(word) is not None
+
+
+def _translations(src_lang: str, tgt_lang: str) -> dict:
+    # pandas is only needed to build a table
+    import pandas as pd
+
+    lexicon_df = pd.read_pickle(LEXICON_PATH)
+    translations = {}
+    for word, translation in zip(lexicon_df[src_lang], lexicon_df[tgt_lang]):
+        # the first translation of a word is kept, words without any are left out
+        if isinstance(word, str) and isinstance(translation, str):
+            translations.setdefault(word, translation)
+    return translations
+
+
+def load_lexicon_table(src_lang: str, tgt_lang: str) -> LexiconTable:
+    """
+    Returns the table of the (src_lang, tgt_lang) pair, memory-mapping the file saved by a
+    previous run, or building it (and saving it when TABLE_DIR is writable).
+    """
+    if (src_lang, tgt_lang) in _tables:
+        return _tables[(src_lang, tgt_lang)]
+    stamp = _source_stamp()
+    path = os.path.join(TABLE_DIR, f"{src_lang}-{tgt_lang}.lex")
+    table = None
+    try:
+        with open(path, "rb") as f:
+            table = LexiconTable(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+        if table.source_stamp != stamp:
+            # the lexicon changed since the table was built
+            table = None
+    except (OSError, ValueError, struct.error):
+        table = None
+    if table is None:
+        data = LexiconTable.build(_translations(src_lang, tgt_lang), stamp)
+        try:
+            os.makedirs(TABLE_DIR, exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+        table = LexiconTable(data)
+    table.languages = (src_lang, tgt_lang)
+    _tables[(src_lang, tgt_lang)] = table
+    return table
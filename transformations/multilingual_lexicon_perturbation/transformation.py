@@ -1,10 +1,9 @@
-import os
 import random
 import string
-import pandas as pd
 
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
+from .lexicon_table import load_lexicon_table
 
 import nltk
 from nltk import word_tokenize
@@ -28,11 +27,9 @@ Serbian (sr), Swati (ss), Sundanese (su), Swedish (sv), Swahili (sw), Tamil (ta)
 Ukrainian (uk), Urdu (ur), Uzbek (uz), Vietnamese (vi), Wolof (wo), Xhosa (xh), Yiddish (yi), Yoruba (yo), Chinese (zh), Zulu (zu)
 """
 
-FOLDER_PATH = '/'.join(os.path.abspath(__file__).split('/')[:-1])
-
-def perturb_sentence(lexicon_df, text, prob_mix=0.5, mlt_src_lang="en", mlt_tgt_lang="zh", seed=0):
-    random.seed(seed)
-    l_df = lexicon_df.set_index(mlt_src_lang)
+def perturb_sentence(lexicon, text, prob_mix=0.5, seed=0):
+    """lexicon: the translations of the source words, see load_lexicon_table"""
+    rng = random.Random(seed)
 
     words = word_tokenize(text)
     mixed_text = ""
@@ -41,22 +38,24 @@ def perturb_sentence(lexicon_df, text, prob_mix=0.5, mlt_src_lang="en", mlt_tgt_
         if mixed_text != "":
             mixed_text += " "
             
-        if word.lower() not in l_df.index:
+        if word.lower() not in lexicon:
             mixed_text += word
         else:
-            rand_prob = random.random()
+            rand_prob = rng.random()
             if rand_prob < prob_mix:
                 plain_word = word.translate(str.maketrans('', '', string.punctuation)).strip().lower()
 
                 if plain_word == "":
                     continue
 
-                if not word[0].isupper(): # lower case
-                    perturbed_word = l_df.loc[plain_word, mlt_tgt_lang]
+                perturbed_word = lexicon.get(plain_word)
+                if perturbed_word is None:
+                    # e.g. "don't", whose plain word "dont" isn't in the lexicon
+                    mixed_text += word
+                elif not word[0].isupper(): # lower case
+                    mixed_text += perturbed_word
                 else:
-                    perturbed_word = l_df.loc[plain_word, mlt_tgt_lang].capitalize()
-                    
-                mixed_text += perturbed_word
+                    mixed_text += perturbed_word.capitalize()
             else:
                 mixed_text += word
 
@@ -83,7 +82,10 @@ class MultilingualLexiconPerturbation(SentenceOperation):
         super().__init__(seed)
         
         # Download nltk `punkt` package
-        nltk.download('punkt')
+        try:
+            nltk.data.find('tokenizers/punkt')
+        except LookupError:
+            nltk.download('punkt')
 
         if mlt_src_lang not in self.supported_languages: 
             raise ValueError(f'Invalid `mlt_src_lang` value "{mlt_src_lang}". Supported languages: {supported_languages}')
@@ -91,12 +93,13 @@ class MultilingualLexiconPerturbation(SentenceOperation):
         if mlt_tgt_lang not in self.supported_languages:
             raise ValueError(f'Invalid `mlt_tgt_lang` value "{mlt_tgt_lang}". Supported languages: {supported_languages}')
             
-        self.lexicon_df = pd.read_pickle(f'{FOLDER_PATH}/multilingual_lexicon_uncased.xz')
+        # only the table of the language pair is loaded
+        self.lexicon = load_lexicon_table(mlt_src_lang, mlt_tgt_lang)
         
         self.prob_mix=prob_mix
         self.mlt_src_lang=mlt_src_lang
         self.mlt_tgt_lang=mlt_tgt_lang
 
     def generate(self, sentence: str):
-        pertubed_sentence = perturb_sentence(lexicon_df=self.lexicon_df, text=sentence, prob_mix=self.prob_mix, mlt_src_lang=self.mlt_src_lang, mlt_tgt_lang=self.mlt_tgt_lang, seed=self.seed)
+        pertubed_sentence = perturb_sentence(lexicon=self.lexicon, text=sentence, prob_mix=self.prob_mix, seed=self.example_seed(sentence))
         return [pertubed_sentence]
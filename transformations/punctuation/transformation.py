@@ -3,6 +3,7 @@ from typing import List
 from cucco import Cucco
 from fastpunct import FastPunct
 
+from initialize import load_model
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
@@ -34,7 +35,8 @@ class PunctuationWithRules(SentenceOperation):
 
     def __init__(self, seed=0, rules=None, max_outputs=1):
         super().__init__(seed, max_outputs=max_outputs)
-        self.fast_punct = FastPunct()
+        # shared through the model registry, loaded on first use
+        self.fast_punct = load_model("fastpunct", FastPunct, owner=self)
         self.normalizations = rules
         if self.normalizations:
             self.cucco = Cucco()
@@ -3,11 +3,10 @@ import random
 import re
 from fractions import Fraction
 
-import spacy
 from num2words import num2words
 from word2number import w2n
 
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
 
@@ -16,13 +15,14 @@ class NumericalTransformation:
     nlp = None
 
     def __init__(self, seed=0, max_outputs=1):
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.max_outputs = max_outputs
         self.seed = seed
 
-    def transform(self, input_text: str):
-        random.seed(self.seed)
-        doc = self.nlp(input_text)
+    def transform(self, input_text: str, doc=None, seed=None):
+        rng = random.Random(self.seed if seed is None else seed)
+        if doc is None:
+            doc = self.nlp(input_text)
 
         for entity in doc.ents:
             new_value = None
@@ -55,9 +55,9 @@ class NumericalTransformation:
                     value_tens = self.value_tens_count(cardinal_value)
 
                     if isinstance(cardinal_value, numbers.Number):
-                        new_value = random.randint(0, value_tens)
+                        new_value = rng.randint(0, value_tens)
                     else:
-                        new_value = random.uniform(0.0, value_tens)
+                        new_value = rng.uniform(0.0, value_tens)
                         # Format value to same number of floating point values:
                         split_entity_value_list = cardinal_value.split(".")
                         floating_length = 0
@@ -78,7 +78,7 @@ class NumericalTransformation:
                     try:
                         num_value = w2n.word_to_num(cardinal_value)
                         value_tens = self.value_tens_count(num_value)
-                        new_value = random.randint(0, value_tens)
+                        new_value = rng.randint(0, value_tens)
                         new_value = num2words(new_value)
                     except ValueError:
                         print(
@@ -119,7 +119,14 @@ class ReplaceNumericalValues(SentenceOperation):
         )
 
     def generate(self, sentence: str):
-        result = self.numerical_transformation.transform(sentence)
+        return self.generate_from_doc(
+            self.numerical_transformation.nlp(sentence)
+        )
+
+    def generate_from_doc(self, doc):
+        result = self.numerical_transformation.transform(
+            doc.text, doc, seed=self.example_seed(doc.text)
+        )
         if self.verbose:
             print(f"Perturbed Input from {self.name()} : {result}")
         return [result]
@@ -1,10 +1,8 @@
-import random
 from interfaces.SentenceOperation import SentenceOperation
 from tasks.TaskTypes import TaskType
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache, load_model
 
 # for sent tokenizer
-import spacy
 
 # coref resolution from allennlp
 # ref: https://demo.allennlp.org/coreference-resolution
@@ -26,11 +24,15 @@ class SentenceReordering(SentenceOperation):
     def __init__(self, enable_coref=True, seed=42, max_outputs=1):
         super().__init__(seed, max_outputs=max_outputs)
         self.seed = seed
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.enable_coref = enable_coref
         if enable_coref:
-            self.coref_model = Predictor.from_path(
-                "https://storage.googleapis.com/allennlp-public-models/coref-spanbert-large-2021.03.10.tar.gz"
+            # shared through the model registry, loaded on first use
+            self.coref_model = load_model(
+                "coref-spanbert-large-2021.03.10",
+                Predictor.from_path,
+                owner=self,
+                archive_path="https://storage.googleapis.com/allennlp-public-models/coref-spanbert-large-2021.03.10.tar.gz",
             )
 
     def generate(self, sentence: str):
@@ -38,12 +40,12 @@ class SentenceReordering(SentenceOperation):
         return perturbed
 
     def sentence_reordering(self, text):
-        random.seed(self.seed)
+        rng = self.get_rng(text)
         # resolve coref
         if self.enable_coref:
             text = self.coref_model.coref_resolved(document=text)
 
         # tokenize and shuffle
         text_split = [i.text for i in self.nlp(text).sents]
-        random.shuffle(text_split)
+        rng.shuffle(text_split)
         return " ".join(text_split)
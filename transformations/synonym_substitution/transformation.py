@@ -2,8 +2,7 @@ import random
 import re
 
 import nltk
-import spacy
-from initialize import spacy_nlp
+from initialize import get_spacy_doc_cache
 from nltk.corpus import wordnet
 
 from interfaces.SentenceOperation import SentenceOperation
@@ -40,9 +39,9 @@ def untokenize(words):
 
 
 def synonym_substitution(
-    text, spacy_pipeline, seed=42, prob=0.5, max_outputs=1
+    text, spacy_pipeline, seed=42, prob=0.5, max_outputs=1, doc=None
 ):
-    random.seed(seed)
+    rng = random.Random(seed)
     upos_wn_dict = {
         "VERB": "v",
         "NOUN": "n",
@@ -50,7 +49,8 @@ def synonym_substitution(
         "ADJ": "s",
     }
 
-    doc = spacy_pipeline(text)
+    if doc is None:
+        doc = spacy_pipeline(text)
     results = []
     for _ in range(max_outputs):
         result = []
@@ -63,8 +63,8 @@ def synonym_substitution(
                 syns = wordnet.synsets(word, pos=wn_pos)
                 syns = [syn.name().split(".")[0] for syn in syns]
                 syns = [syn for syn in syns if syn.lower() != word.lower()]
-                if len(syns) > 0 and random.random() < prob:
-                    result.append(random.choice(syns).replace("_", " "))
+                if len(syns) > 0 and rng.random() < prob:
+                    result.append(rng.choice(syns).replace("_", " "))
                 else:
                     result.append(word)
 
@@ -90,16 +90,20 @@ class SynonymSubstitution(SentenceOperation):
 
     def __init__(self, seed=42, prob=0.5, max_outputs=1):
         super().__init__(seed, max_outputs=max_outputs)
-        self.nlp = spacy_nlp if spacy_nlp else spacy.load("en_core_web_sm")
+        self.nlp = get_spacy_doc_cache()
         self.prob = prob
         nltk.download("wordnet")
 
     def generate(self, sentence: str):
+        return self.generate_from_doc(self.nlp(sentence))
+
+    def generate_from_doc(self, doc):
         perturbed = synonym_substitution(
-            text=sentence,
+            text=doc.text,
             spacy_pipeline=self.nlp,
-            seed=self.seed,
+            seed=self.example_seed(doc.text),
             prob=self.prob,
             max_outputs=self.max_outputs,
+            doc=doc,
         )
         return perturbed